@@ -0,0 +1,499 @@
+import time
+import asyncio
+from datetime import datetime
+from binance import AsyncClient
+from binance.enums import SIDE_BUY, SIDE_SELL, FUTURE_ORDER_TYPE_MARKET, FUTURE_ORDER_TYPE_STOP_MARKET
+# 导入时间同步管理器
+from time_sync_config import time_sync_manager, SyncedTimestampMixin
+# 复用同步交易器的数据结构和策略规则
+from exchange_info_cache import ExchangeInfoCache
+from symbol_universe import SymbolUniverse
+from kline_store import KlineStore
+from signal_engine import SignalEngine
+import strategy_rules as rules
+from rate_governor import RateGovernor
+from request_executor import RequestExecutor
+# 导入异步日志管道
+import log_pipeline
+# 导入配置参数
+from config import LONG_LEVERAGE, SHORT_LEVERAGE, LONG_AMOUNT, SHORT_AMOUNT, exclude_symbols
+from config import EXCHANGE_INFO_REFRESH_INTERVAL, TOP_SYMBOL_LIMIT, KLINE_CAPACITY, ASYNC_CONCURRENCY
+from config import RATE_LIMIT_WEIGHT_PER_MINUTE, RATE_LIMIT_SAFETY_RATIO, RATE_LIMIT_STATE_FILE
+from config import RATE_LIMIT_SYNC_INTERVAL
+from config import REQUEST_MAX_RETRIES, REQUEST_DEADLINE
+from config import LOG_LEVEL, LOG_FILE, LOG_SAMPLE_INTERVAL
+
+logger = log_pipeline.get_logger('AsyncTradingEngine', '异步引擎')
+
+
+# 支持时间同步的异步Binance客户端
+class TimeSyncedAsyncClient(SyncedTimestampMixin, AsyncClient):
+    # 签名时间戳使用时间同步管理器提供的偏移量
+    pass
+
+
+class AsyncTradingEngine:
+    """基于AsyncClient的异步交易引擎，在一个事件循环中运行交易策略、移动止损和主动止盈"""
+
+    def __init__(self, api_key, api_secret, concurrency=ASYNC_CONCURRENCY, profit_threshold=1.3,
+                 take_profit_interval=300):
+        """
+        初始化异步交易引擎
+        :param api_key: Binance API
+        :param api_secret: Binance API KEY
+        :param concurrency: 同时进行的最大请求数
+        :param profit_threshold: 止盈阈值倍数
+        :param take_profit_interval: 止盈检查间隔(秒)
+        """
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.client = None
+        self.long_leverage = LONG_LEVERAGE  # 多单杠杆
+        self.short_leverage = SHORT_LEVERAGE  # 空单杠杆
+        self.long_amount = LONG_AMOUNT  # 多单保证金金额(USDT)
+        self.short_amount = SHORT_AMOUNT  # 空单保证金金额(USDT)
+        self.exclude_symbols = exclude_symbols
+        self.profit_threshold = profit_threshold
+        self.take_profit_interval = take_profit_interval
+        # 网络请求参数
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # 请求限频：与同步交易器和止盈监控器共享额度
+        self.rate_governor = RateGovernor(
+            weight_limit=RATE_LIMIT_WEIGHT_PER_MINUTE,
+            safety_ratio=RATE_LIMIT_SAFETY_RATIO,
+            state_file=RATE_LIMIT_STATE_FILE,
+            sync_interval=RATE_LIMIT_SYNC_INTERVAL
+        )
+        self.request_executor = RequestExecutor(
+            rate_governor=self.rate_governor,
+            time_sync=time_sync_manager,
+            max_retries=REQUEST_MAX_RETRIES,
+            deadline=REQUEST_DEADLINE
+        )
+
+        # 交易所信息由引擎自行定时请求后载入，不在读取时同步刷新
+        self.exchange_info = ExchangeInfoCache(None, ttl=float('inf'))
+        self.kline_store = KlineStore(None, interval='1h', capacity=KLINE_CAPACITY)
+        self.signal_engine = SignalEngine(self.kline_store)
+        self.universe = None
+        self.symbols = []
+
+        self.order_relations = {}  # 格式: {symbol: {'stop_loss': orderId}}
+        self.leverage_state = {}  # 格式: {symbol: 当前杠杆}
+        self.take_profit_executed = set()  # 已执行止盈的交易对
+        self.symbol_locks = {}  # 格式: {symbol: asyncio.Lock}
+        self.running = False
+
+    async def safe_request(self, request_func, *args, **kwargs):
+        """通过统一的请求执行器发送异步请求（限频、按错误码重试、时间同步错误处理）"""
+        return await self.request_executor.execute_async(request_func, *args, semaphore=self.semaphore, **kwargs)
+
+    def _symbol_lock(self, symbol):
+        """获取交易对的下单锁，保证同一交易对的下单操作串行执行"""
+        lock = self.symbol_locks.get(symbol)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.symbol_locks[symbol] = lock
+        return lock
+
+    async def start(self):
+        """创建客户端并加载交易所信息和交易对列表"""
+        # 每个请求结束时用它自己的响应头校准限频额度
+        self.client = await TimeSyncedAsyncClient.create(
+            self.api_key, self.api_secret,
+            session_params={'trace_configs': [self.rate_governor.trace_config()]}
+        )
+        await self.refresh_exchange_info()
+        self.universe = SymbolUniverse(self.exchange_info, limit=TOP_SYMBOL_LIMIT, exclude=self.exclude_symbols)
+        await self.update_symbols()
+        await self.setup_account()
+        await self.load_leverage_state()
+        logger.info(f"异步引擎初始化完成，将监控{len(self.symbols)}个交易对")
+
+    async def close(self):
+        """关闭客户端连接"""
+        self.running = False
+        if self.client:
+            await self.client.close_connection()
+
+    async def refresh_exchange_info(self):
+        """请求一次交易所信息并重建索引"""
+        try:
+            self.exchange_info.load(await self.safe_request(self.client.futures_exchange_info))
+        except Exception as e:
+            logger.error(f"刷新交易所信息失败: {e}")
+
+    async def update_symbols(self):
+        """批量轮询一次全部行情，更新交易量前K标的"""
+        try:
+            self.universe.refresh_eligible()
+            self.universe.update_tickers(await self.safe_request(self.client.futures_ticker))
+            new_symbols = self.universe.top_symbols()
+            if new_symbols:
+                self.symbols = new_symbols
+                logger.info(f"最新监控列表: {len(self.symbols)}个", symbols=','.join(self.symbols))
+        except Exception as e:
+            logger.error(f"更新交易对列表失败: {e}")
+
+    async def setup_account(self):
+        """设置账户为单向持仓模式"""
+        try:
+            position_mode = await self.safe_request(self.client.futures_get_position_mode)
+            if not position_mode['dualSidePosition']:
+                return
+            await self.safe_request(self.client.futures_change_position_mode, dualSidePosition=False)
+            logger.info("成功设置为单向持仓模式")
+        except Exception as e:
+            if getattr(e, 'code', None) == -4059:
+                logger.info("账户已是单向持仓模式")
+            else:
+                logger.warning(f"账户设置警告: {e}")
+
+    async def load_leverage_state(self):
+        """一次请求所有交易对的当前杠杆"""
+        try:
+            configs = await self.safe_request(self.client.futures_symbol_config)
+            self.leverage_state = {config['symbol']: int(config['leverage']) for config in configs}
+        except Exception as e:
+            logger.error(f"获取杠杆设置失败: {e}")
+
+    async def get_positions(self):
+        """获取有持仓的交易对"""
+        try:
+            positions = await self.safe_request(self.client.futures_position_information)
+            return [pos for pos in positions if float(pos['positionAmt']) != 0]
+        except Exception as e:
+            logger.error(f"获取持仓失败: {e}")
+            return []
+
+    async def update_klines(self, symbol):
+        """增量更新一个交易对的K线"""
+        try:
+            limit, start_time = self.kline_store.pending_request(symbol)
+            params = {'symbol': symbol, 'interval': self.kline_store.interval, 'limit': limit}
+            if start_time is not None:
+                params['startTime'] = start_time
+            klines = await self.safe_request(self.client.futures_klines, **params)
+            return self.kline_store.ingest(symbol, klines, start_time)
+        except Exception as e:
+            logger.error(f"获取K线数据失败: {e}", symbol=symbol)
+            return False
+
+    async def calculate_quantity(self, symbol, usdt_amount, leverage, price=None):
+        """计算合约数量，确保符合交易对的 LOT_SIZE 规则，price为None时请求最新价格"""
+        try:
+            if price is None:
+                ticker = await self.safe_request(self.client.futures_symbol_ticker, symbol=symbol)
+                price = float(ticker['price'])
+            symbol_info = self.exchange_info.get_symbol_info(symbol)
+            if not symbol_info or not symbol_info['lot_size']:
+                logger.error("交易对信息获取失败", symbol=symbol)
+                return None
+
+            lot_size = symbol_info['lot_size']
+            quantity = rules.round_step(usdt_amount * leverage / price, lot_size['stepSize'])
+            if quantity < lot_size['minQty']:
+                logger.warning("计算数量小于最小交易量", symbol=symbol, quantity=quantity, min_qty=lot_size['minQty'])
+                return None
+            return rules.format_quantity(quantity, symbol_info['quantityPrecision'])
+        except Exception as e:
+            logger.error(f"计算数量失败: {e}", symbol=symbol)
+            return None
+
+    async def place_order(self, symbol, side, quantity, is_long=True):
+        """调整杠杆后市价下单（杠杆已经相同时跳过），返回包含成交结果的订单"""
+        leverage = self.long_leverage if is_long else self.short_leverage
+        try:
+            if self.leverage_state.get(symbol) != leverage:
+                self.leverage_state.pop(symbol, None)
+                result = await self.safe_request(self.client.futures_change_leverage, symbol=symbol, leverage=leverage)
+                self.leverage_state[symbol] = int(result.get('leverage', leverage))
+            order = await self.safe_request(
+                self.client.futures_create_order,
+                symbol=symbol,
+                side=side,
+                type=FUTURE_ORDER_TYPE_MARKET,
+                quantity=quantity,
+                newOrderRespType='RESULT'
+            )
+            logger.info("下单成功", symbol=symbol, side=side, orderId=order.get('orderId'),
+                        executedQty=order.get('executedQty'))
+            logger.debug("下单响应", order=order)
+            return order
+        except Exception as e:
+            logger.error(f"下单失败: {e}", symbol=symbol, side=side, quantity=quantity)
+            return None
+
+    async def _stop_order_ids(self, symbol):
+        """请求交易对当前的止损单ID"""
+        open_orders = await self.safe_request(self.client.futures_get_open_orders, symbol=symbol)
+        return [order['orderId'] for order in open_orders
+                if order['type'].upper() in ['STOP_MARKET'] or order['reduceOnly']]
+
+    async def _cancel_orders(self, symbol, order_ids):
+        """批量撤单（每次最多10个）"""
+        for i in range(0, len(order_ids), 10):
+            batch = order_ids[i:i + 10]
+            try:
+                results = await self.safe_request(self.client.futures_cancel_orders, symbol=symbol, orderidlist=batch)
+            except Exception as e:
+                logger.error(f"批量撤销订单失败: {e}", symbol=symbol, orders=','.join(map(str, batch)))
+                continue
+            for order_id, result in zip(batch, results):
+                if 'code' in result and result['code'] != -2011:
+                    logger.error(f"撤销订单失败: {result.get('msg')}", symbol=symbol, orderId=order_id)
+
+    async def cancel_associated_orders(self, symbol):
+        """撤销与指定交易对关联的所有止损单"""
+        try:
+            await self._cancel_orders(symbol, await self._stop_order_ids(symbol))
+            self.order_relations.pop(symbol, None)
+        except Exception as e:
+            logger.error(f"获取委托单失败: {e}", symbol=symbol)
+
+    async def place_stop_loss(self, symbol, side, kline, quantity):
+        """
+        根据K线替换止损单：先按持仓数量下reduceOnly止损单，成功后再批量撤销旧止损单
+        :param quantity: 持仓数量
+        """
+        price_precision = self.exchange_info.get_price_precision(symbol)
+        quantity_precision = self.exchange_info.get_quantity_precision(symbol)
+        if price_precision is None or quantity_precision is None:
+            logger.error("交易对信息获取失败", symbol=symbol)
+            return None
+
+        stop_price = rules.stop_price(side == SIDE_BUY, kline, price_precision)
+        stop_side = SIDE_SELL if side == SIDE_BUY else SIDE_BUY
+        try:
+            old_order_ids = await self._stop_order_ids(symbol)
+            order = await self.safe_request(
+                self.client.futures_create_order,
+                symbol=symbol,
+                side=stop_side,
+                type=FUTURE_ORDER_TYPE_STOP_MARKET,
+                stopPrice=stop_price,
+                quantity=rules.format_quantity(quantity, quantity_precision),
+                reduceOnly=True
+            )
+        except Exception as e:
+            logger.error(f"止损单设置失败: {e}", symbol=symbol)
+            return None
+        self.order_relations.setdefault(symbol, {})['stop_loss'] = order['orderId']
+        await self._cancel_orders(symbol, [order_id for order_id in old_order_ids if order_id != order['orderId']])
+        logger.info("止损单设置成功", symbol=symbol, orderId=order['orderId'], stop_price=stop_price)
+        return order
+
+    async def update_stop_loss(self, pos):
+        """满足涨跌幅条件时把止损移动到当前小时K线（K线须已由update_klines更新）"""
+        symbol = pos['symbol']
+        side = SIDE_BUY if float(pos['positionAmt']) > 0 else SIDE_SELL
+        async with self._symbol_lock(symbol):
+            hour_kline = self.kline_store.last_kline(symbol)
+            if hour_kline is None:
+                return None
+            price_change = (hour_kline['close'] - hour_kline['open']) / hour_kline['open'] * 100
+            if not rules.should_trail_stop(side == SIDE_BUY, price_change):
+                return None
+            logger.debug("满足止损调整条件", symbol=symbol, price_change=f"{price_change:.2f}%")
+            return await self.place_stop_loss(symbol, side, hour_kline, abs(float(pos['positionAmt'])))
+
+    async def handle_existing_position(self, symbol, desired_position_type, position):
+        """处理现有持仓：同向禁止重复开仓，反向先平仓"""
+        if not position or float(position['positionAmt']) == 0:
+            return True
+
+        current_position_amount = float(position['positionAmt'])
+        if (current_position_amount > 0 and desired_position_type == 'long') or \
+                (current_position_amount < 0 and desired_position_type == 'short'):
+            logger.info("已有同向持仓，禁止重复开仓", symbol=symbol)
+            return False
+
+        logger.info("存在反向持仓，先平仓再开仓", symbol=symbol)
+        quantity = abs(current_position_amount)
+        if current_position_amount > 0:
+            await self.place_order(symbol, SIDE_SELL, quantity, is_long=False)
+        else:
+            await self.place_order(symbol, SIDE_BUY, quantity, is_long=True)
+        await self.cancel_associated_orders(symbol)
+        return True
+
+    async def act_on_signal(self, symbol, kline, position):
+        """根据开仓信号执行开仓（同一交易对的下单串行执行）"""
+        async with self._symbol_lock(symbol):
+            if kline['long_signal']:
+                side, position_type, amount, leverage = SIDE_BUY, 'long', self.long_amount, self.long_leverage
+            elif kline['short_signal']:
+                side, position_type, amount, leverage = SIDE_SELL, 'short', self.short_amount, self.short_leverage
+            else:
+                return
+            logger.info(f"触发{'开多' if side == SIDE_BUY else '开空'}信号", symbol=symbol)
+            if not await self.handle_existing_position(symbol, position_type, position):
+                return
+            quantity = await self.calculate_quantity(symbol, amount, leverage, price=kline['close'])
+            if not quantity:
+                return
+            order = await self.place_order(symbol, side, quantity, is_long=side == SIDE_BUY)
+            if order:
+                # 止损数量取自下单响应中的成交数量
+                await self.place_stop_loss(symbol, side, kline, float(order.get('executedQty') or quantity))
+
+    async def run_hourly_scan(self):
+        """第59分钟：并发更新K线（每个交易对只请求一次），用已更新的K线并发调整止损，批量计算信号后并发下单"""
+        logger.info(f"执行策略检查: {datetime.now()}")
+        scan_start = time.time()
+        current_positions = await self.get_positions()
+        positions_by_symbol = {pos['symbol']: pos for pos in current_positions}
+
+        top_symbols = list(self.symbols)
+        symbols_to_check = list(set(top_symbols) | set(positions_by_symbol))
+        updated = await asyncio.gather(*[self.update_klines(symbol) for symbol in symbols_to_check])
+        ready_symbols = [symbol for symbol, ok in zip(symbols_to_check, updated) if ok]
+        ready = set(ready_symbols)
+        for pos in current_positions:
+            if pos['symbol'] not in ready:
+                logger.warning("获取K线失败，跳过止损更新", symbol=pos['symbol'])
+        await asyncio.gather(*[self.update_stop_loss(pos) for pos in current_positions if pos['symbol'] in ready])
+        signals = self.signal_engine.evaluate(ready_symbols)
+
+        await asyncio.gather(*[self.act_on_signal(symbol, signals[symbol], positions_by_symbol.get(symbol))
+                               for symbol in top_symbols if symbol in signals])
+        logger.info(f"策略检查完成，已分析{len(signals)}/{len(symbols_to_check)}个交易对",
+                    elapsed=f"{time.time() - scan_start:.2f}s")
+
+    async def check_order_execution(self):
+        """第57分钟：已无持仓的交易对说明止损已成交，清理关联订单"""
+        position_symbols = {pos['symbol'] for pos in await self.get_positions()}
+        closed = [symbol for symbol in self.order_relations if symbol not in position_symbols]
+        for symbol in closed:
+            logger.info("止损单已成交，仓位已平", symbol=symbol)
+        await asyncio.gather(*[self.cancel_associated_orders(symbol) for symbol in closed])
+
+    async def take_profit_half_position(self, symbol, position, current_price):
+        """
+        市价平仓一半仓位：在交易对锁内重新读取持仓，等锁期间已平仓、已反手或不再满足止盈条件时放弃
+        :param position: 检查止盈时的持仓
+        :param current_price: 检查止盈时的价格
+        """
+        try:
+            async with self._symbol_lock(symbol):
+                latest = await self.safe_request(self.client.futures_position_information, symbol=symbol)
+                latest = next((pos for pos in latest if pos['symbol'] == symbol), None)
+                position_amt = float(latest['positionAmt']) if latest else 0.0
+                if position_amt == 0 or (position_amt > 0) != (float(position['positionAmt']) > 0):
+                    logger.info("持仓已平仓或反手，放弃止盈", symbol=symbol, positionAmt=position_amt)
+                    return False
+                entry_price = float(latest['entryPrice'])
+                ratio = rules.price_ratio(position_amt, entry_price, current_price)
+                if ratio < self.profit_threshold:
+                    logger.info("最新持仓已不满足止盈条件，放弃止盈", symbol=symbol, ratio=f"{ratio:.4f}")
+                    return False
+
+                lot_size = self.exchange_info.get_lot_size(symbol)
+                half_quantity = abs(position_amt) / 2
+                if lot_size:
+                    half_quantity = rules.round_step(half_quantity, lot_size['stepSize'])
+                    if half_quantity < lot_size['minQty']:
+                        logger.warning("计算数量小于最小交易量", symbol=symbol, quantity=half_quantity,
+                                       min_qty=lot_size['minQty'])
+                        return False
+                order = await self.safe_request(
+                    self.client.futures_create_order,
+                    symbol=symbol,
+                    side=SIDE_SELL if position_amt > 0 else SIDE_BUY,
+                    type=FUTURE_ORDER_TYPE_MARKET,
+                    quantity=rules.format_quantity(half_quantity, self.exchange_info.get_quantity_precision(symbol)),
+                    reduceOnly=True
+                )
+            profit_percent = rules.profit_percent(position_amt, entry_price, current_price)
+            logger.info("止盈成功，平掉一半仓位", symbol=symbol, quantity=half_quantity,
+                        profit=f"{profit_percent:.2f}%", orderId=order['orderId'])
+            self.take_profit_executed.add(symbol)
+            return True
+        except Exception as e:
+            logger.error(f"止盈操作失败: {e}", symbol=symbol)
+            return False
+
+    async def check_and_execute_take_profit(self):
+        """一次请求全部价格，检查所有持仓是否达到止盈条件"""
+        positions = await self.get_positions()
+        held = {pos['symbol'] for pos in positions}
+        self.take_profit_executed &= held  # 清理已完全平仓的交易对
+        candidates = [pos for pos in positions if pos['symbol'] not in self.take_profit_executed]
+        if not candidates:
+            return
+        try:
+            prices = {t['symbol']: float(t['price'])
+                      for t in await self.safe_request(self.client.futures_symbol_ticker)}
+        except Exception as e:
+            logger.error(f"获取价格失败: {e}")
+            return
+
+        tasks = []
+        for pos in candidates:
+            symbol = pos['symbol']
+            current_price = prices.get(symbol)
+            if current_price is None:
+                continue
+            ratio = rules.price_ratio(float(pos['positionAmt']), float(pos['entryPrice']), current_price)
+            if ratio >= self.profit_threshold:
+                logger.info("达到止盈条件", symbol=symbol, ratio=f"{ratio:.4f}", threshold=self.profit_threshold)
+                tasks.append(self.take_profit_half_position(symbol, pos, current_price))
+        await asyncio.gather(*tasks)
+
+    async def _sleep_until_next_minute(self):
+        """按同步后的服务器时间睡眠到下一个整分钟"""
+        now = time_sync_manager.get_synced_time()
+        next_minute = (int(now) // 60 + 1) * 60
+        await asyncio.sleep(max(0.0, next_minute - now))
+        return datetime.fromtimestamp(next_minute)
+
+    async def strategy_loop(self):
+        """按整分钟调度第57/58/59分钟的任务"""
+        while self.running:
+            slot = await self._sleep_until_next_minute()
+            try:
+                if slot.minute == 57:
+                    logger.info(f"57分检查订单执行情况: {slot}")
+                    await self.check_order_execution()
+                elif slot.minute == 58:
+                    await self.update_symbols()
+                elif slot.minute == 59:
+                    await self.run_hourly_scan()
+            except Exception as e:
+                logger.exception(f"策略任务发生错误: {e}")
+
+    async def take_profit_loop(self):
+        """定时检查止盈"""
+        while self.running:
+            try:
+                await self.check_and_execute_take_profit()
+            except Exception as e:
+                logger.exception(f"检查和执行止盈时发生错误: {e}")
+            await asyncio.sleep(self.take_profit_interval)
+
+    async def exchange_info_loop(self):
+        """定时刷新交易所信息"""
+        while self.running:
+            await asyncio.sleep(EXCHANGE_INFO_REFRESH_INTERVAL)
+            await self.refresh_exchange_info()
+
+    async def run(self):
+        """启动引擎并在同一事件循环中运行所有任务"""
+        await self.start()
+        self.running = True
+        try:
+            await asyncio.gather(self.strategy_loop(), self.take_profit_loop(), self.exchange_info_loop())
+        finally:
+            await self.close()
+
+
+if __name__ == "__main__":
+    from config import API_KEY, API_SECRET
+
+    # 日志级别、日志文件和按交易对采样
+    log_pipeline.setup(level=LOG_LEVEL, log_file=LOG_FILE, sample_interval=LOG_SAMPLE_INTERVAL)
+    engine = AsyncTradingEngine(API_KEY, API_SECRET)
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        logger.info("异步交易引擎已停止")
@@ -0,0 +1,313 @@
+import csv
+import time
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+# 复用实盘的信号判断和止损规则
+from signal_engine import signal_masks
+import strategy_rules as rules
+from config import LONG_LEVERAGE, SHORT_LEVERAGE, LONG_AMOUNT, SHORT_AMOUNT, exclude_symbols
+from config import KLINE_ARCHIVE_DIR
+
+# 平仓原因
+EXIT_STOP = 'stop'  # 触发止损
+EXIT_TAKE_PROFIT = 'take_profit'  # 主动止盈平一半
+EXIT_REVERSE = 'reverse'  # 反向信号平仓
+EXIT_END = 'end'  # 回测结束时按最后收盘价平仓
+
+TRADE_FIELDS = ('symbol', 'side', 'entry_time', 'exit_time', 'entry_price', 'exit_price',
+                'quantity', 'pnl', 'reason')
+
+
+def _as_array(klines):
+    if isinstance(klines, np.ndarray):
+        return np.asarray(klines[:, :5], dtype=np.float64)
+    return np.asarray([row[:5] for row in klines], dtype=np.float64)
+
+
+def align_klines(klines_by_symbol):
+    """
+    把各交易对的K线对齐到同一时间轴
+    :param klines_by_symbol: {symbol: 原始K线列表或形状(m, 5)的数组 [open_time, open, high, low, close]}
+    :return: (symbols, times, opens, highs, lows, closes)，价格矩阵形状(n, T)，缺失的K线为NaN
+    """
+    symbols = sorted(symbol for symbol, klines in klines_by_symbol.items() if len(klines))
+    arrays = {symbol: _as_array(klines_by_symbol[symbol]) for symbol in symbols}
+    if not symbols:
+        return [], np.zeros(0, dtype=np.int64), *(np.zeros((0, 0)) for _ in range(4))
+    times = np.unique(np.concatenate([arr[:, 0] for arr in arrays.values()])).astype(np.int64)
+
+    matrices = [np.full((len(symbols), len(times)), np.nan) for _ in range(4)]
+    for i, symbol in enumerate(symbols):
+        arr = arrays[symbol]
+        columns = np.searchsorted(times, arr[:, 0].astype(np.int64))
+        for field, matrix in enumerate(matrices):
+            matrix[i, columns] = arr[:, field + 1]
+    return symbols, times, *matrices
+
+
+def rolling_mean(matrix, window):
+    """沿时间轴的滑动平均，前window-1列和窗口内有缺失的位置为NaN"""
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] >= window:
+        result[:, window - 1:] = sliding_window_view(matrix, window, axis=1).mean(axis=-1)
+    return result
+
+
+def compute_signals(opens, closes, short_window=20, long_window=60, max_change_pct=4):
+    """
+    一次计算所有交易对所有K线的均线和开仓信号
+    :return: (long_signals, short_signals)，形状(n, T)
+    """
+    ma_short = rolling_mean(closes, short_window)
+    ma_long = rolling_mean(closes, long_window)
+    valid = ~np.isnan(ma_long) & ~np.isnan(opens)
+    return signal_masks(opens, closes, ma_short, ma_long, valid, max_change_pct)
+
+
+class BacktestResult:
+    """回测结果：成交记录、权益曲线和汇总指标"""
+
+    def __init__(self, symbols, times, trades, equity):
+        self.symbols = symbols
+        self.times = times
+        self.trades = trades  # 成交记录列表，字段见TRADE_FIELDS
+        self.equity = equity  # 每根K线收盘时的累计盈亏(已实现+未实现)
+
+    def max_drawdown(self):
+        """最大回撤(USDT)"""
+        if not len(self.equity):
+            return 0.0
+        peak = np.maximum.accumulate(np.maximum(self.equity, 0))
+        return float(np.max(peak - self.equity))
+
+    def summary(self):
+        pnl = np.array([trade['pnl'] for trade in self.trades])
+        # 按开仓统计胜率：同一笔持仓的止盈和最终平仓合并计算
+        by_position = {}
+        for trade in self.trades:
+            key = (trade['symbol'], trade['entry_time'])
+            by_position[key] = by_position.get(key, 0) + trade['pnl']
+        position_pnl = np.array(list(by_position.values()))
+        return {
+            'symbols': len(self.symbols),
+            'bars': len(self.times),
+            'positions': len(position_pnl),
+            'fills': len(pnl),
+            'total_pnl': float(pnl.sum()) if len(pnl) else 0.0,
+            'win_rate': float((position_pnl > 0).mean()) if len(position_pnl) else 0.0,
+            'max_drawdown': self.max_drawdown(),
+        }
+
+    def write_trades(self, path):
+        """把成交记录写入CSV"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TRADE_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.trades)
+
+
+class Backtester:
+    """
+    MA20/MA60策略回测：信号一次性对整个(交易对 x K线)矩阵计算；
+    持仓状态逐根K线推进，每一步对所有交易对做数组运算
+
+    每根K线的处理顺序与实盘一致：
+    1. K线内先检查止损，再检查主动止盈（同一根K线两者都触发时按止损处理）
+    2. 收盘(第59分钟)时按当前K线涨跌幅移动止损
+    3. 按信号开仓，反向持仓先按收盘价平仓，初始止损取当前K线
+    """
+
+    def __init__(self, long_amount=LONG_AMOUNT, short_amount=SHORT_AMOUNT, long_leverage=LONG_LEVERAGE,
+                 short_leverage=SHORT_LEVERAGE, profit_threshold=1.3, fee_rate=0.0004,
+                 short_window=20, long_window=60):
+        """
+        :param long_amount: 多单保证金(USDT)
+        :param short_amount: 空单保证金(USDT)
+        :param long_leverage: 多单杠杆
+        :param short_leverage: 空单杠杆
+        :param profit_threshold: 主动止盈倍数
+        :param fee_rate: 每次成交的手续费率
+        """
+        self.long_notional = long_amount * long_leverage
+        self.short_notional = short_amount * short_leverage
+        self.profit_threshold = profit_threshold
+        self.fee_rate = fee_rate
+        self.short_window = short_window
+        self.long_window = long_window
+
+    def run(self, symbols, times, opens, highs, lows, closes):
+        """
+        :param symbols: 交易对列表
+        :param times: K线开盘时间(毫秒)，形状(T,)
+        :param opens/highs/lows/closes: 价格矩阵，形状(n, T)
+        :return: BacktestResult
+        """
+        n, T = closes.shape
+        long_signals, short_signals = compute_signals(opens, closes, self.short_window, self.long_window)
+        symbols = np.asarray(symbols)
+
+        direction = np.zeros(n, dtype=np.int8)  # 1多 -1空 0无持仓
+        quantity = np.zeros(n)
+        entry = np.zeros(n)
+        stop = np.zeros(n)
+        entry_time = np.zeros(n, dtype=np.int64)
+        tp_done = np.zeros(n, dtype=bool)
+        last_close = np.full(n, np.nan)
+        realized = 0.0
+        equity = np.zeros(T)
+        trades = []
+
+        def close(mask, price, qty, t, reason):
+            """记录mask中交易对的平仓，返回已实现盈亏合计"""
+            idx = np.flatnonzero(mask)
+            if not len(idx):
+                return 0.0
+            d = direction[idx]
+            # 开仓和平仓手续费都计入这笔成交
+            pnl = d * qty[idx] * (price[idx] - entry[idx]) - qty[idx] * (price[idx] + entry[idx]) * self.fee_rate
+            for k, i in enumerate(idx):
+                trades.append({
+                    'symbol': symbols[i], 'side': 'LONG' if d[k] > 0 else 'SHORT',
+                    'entry_time': int(entry_time[i]), 'exit_time': int(times[t]),
+                    'entry_price': float(entry[i]), 'exit_price': float(price[i]),
+                    'quantity': float(qty[i]), 'pnl': float(pnl[k]), 'reason': reason,
+                })
+            return float(pnl.sum())
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for t in range(T):
+                o, h, l, c = opens[:, t], highs[:, t], lows[:, t], closes[:, t]
+                has_bar = ~np.isnan(c)
+                last_close = np.where(has_bar, c, last_close)
+                is_long = direction == 1
+                is_short = direction == -1
+                active = (direction != 0) & has_bar
+
+                # 1. K线内止损：跳空越过止损价时按开盘价成交
+                stop_hit = active & ((is_long & (l <= stop)) | (is_short & (h >= stop)))
+                stop_fill = np.where(is_long, np.minimum(o, stop), np.maximum(o, stop))
+                realized += close(stop_hit, stop_fill, quantity, t, EXIT_STOP)
+                direction[stop_hit] = 0
+
+                # 主动止盈：达到倍数时平一半，每笔持仓只执行一次
+                tp_level = np.where(is_long, entry * self.profit_threshold, entry / self.profit_threshold)
+                tp_hit = active & ~stop_hit & ~tp_done & ((is_long & (h >= tp_level)) | (is_short & (l <= tp_level)))
+                tp_fill = np.where(is_long, np.maximum(o, tp_level), np.minimum(o, tp_level))
+                half = quantity / 2
+                realized += close(tp_hit, tp_fill, half, t, EXIT_TAKE_PROFIT)
+                quantity = np.where(tp_hit, quantity - half, quantity)
+                tp_done |= tp_hit
+
+                # 2. 收盘时移动止损
+                change = (c - o) / o * 100
+                is_long = direction == 1
+                is_short = direction == -1
+                trail_long = is_long & has_bar & (change >= rules.TRAIL_TRIGGER_PCT)
+                trail_short = is_short & has_bar & (change <= -rules.TRAIL_TRIGGER_PCT)
+                stop = np.where(trail_long, l * rules.STOP_LOSS_BUFFER, np.where(trail_short, h, stop))
+
+                # 3. 开仓信号：已有同向持仓时不重复开仓，反向持仓先平仓
+                open_long = long_signals[:, t] & ~is_long
+                open_short = short_signals[:, t] & ~is_short
+                reverse = (open_long & is_short) | (open_short & is_long)
+                realized += close(reverse, c, quantity, t, EXIT_REVERSE)
+
+                opening = open_long | open_short
+                if opening.any():
+                    notional = np.where(open_long, self.long_notional, self.short_notional)
+                    new_quantity = notional / c
+                    direction = np.where(open_long, 1, np.where(open_short, -1, direction)).astype(np.int8)
+                    quantity = np.where(opening, new_quantity, quantity)
+                    entry = np.where(opening, c, entry)
+                    stop = np.where(open_long, l * rules.STOP_LOSS_BUFFER, np.where(open_short, h, stop))
+                    entry_time = np.where(opening, times[t], entry_time)
+                    tp_done &= ~opening
+
+                # 收盘权益：已实现盈亏 + 持仓按最近收盘价计算的浮动盈亏
+                unrealized = np.where(direction != 0, direction * quantity * (last_close - entry), 0.0)
+                equity[t] = realized + float(np.nansum(unrealized))
+
+        # 回测结束仍持有的仓位按最后收盘价平仓
+        if T:
+            realized += close(direction != 0, last_close, quantity, T - 1, EXIT_END)
+            equity[-1] = realized
+        return BacktestResult(list(symbols), times, trades, equity)
+
+
+def fetch_klines_rest(client, symbol, interval, start_ms, end_ms, limit=1000):
+    """
+    分页请求一个交易对的历史K线
+    :return: 原始K线列表
+    """
+    klines = []
+    while start_ms < end_ms:
+        page = client.futures_klines(symbol=symbol, interval=interval, startTime=start_ms,
+                                     endTime=end_ms, limit=limit)
+        if not page:
+            break
+        klines.extend(page)
+        start_ms = page[-1][0] + 1
+        if len(page) < limit:
+            break
+    return klines
+
+
+def _print_summary(summary, elapsed):
+    print(f"交易对: {summary['symbols']}，K线: {summary['bars']}，开仓次数: {summary['positions']}，"
+          f"成交笔数: {summary['fills']}")
+    print(f"总盈亏: {summary['total_pnl']:.2f} USDT，胜率: {summary['win_rate'] * 100:.1f}%，"
+          f"最大回撤: {summary['max_drawdown']:.2f} USDT")
+    print(f"回测耗时: {elapsed:.2f}秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MA20/MA60策略离线回测')
+    parser.add_argument('--symbols', nargs='*', help='交易对列表，默认使用当前交易量前N的USDT合约')
+    parser.add_argument('--top', type=int, default=28, help='未指定交易对时取交易量前N')
+    parser.add_argument('--days', type=int, default=365, help='回测天数')
+    parser.add_argument('--interval', default='1h', help='K线周期')
+    parser.add_argument('--profit-threshold', type=float, default=1.3, help='主动止盈倍数')
+    parser.add_argument('--fee-rate', type=float, default=0.0004, help='手续费率')
+    parser.add_argument('--trades', help='成交记录CSV输出路径')
+    parser.add_argument('--source', choices=('rest', 'archive'), default='rest',
+                        help='K线来源：rest从交易所下载，archive读取本地K线归档')
+    args = parser.parse_args()
+
+    end_ms = int(time.time() * 1000)
+    start_ms = end_ms - args.days * 86400 * 1000
+    if args.source == 'archive':
+        from kline_archive import KlineArchive
+        archive = KlineArchive(KLINE_ARCHIVE_DIR)
+        symbols = args.symbols or archive.symbols(args.interval)
+        klines = archive.load_matrix(symbols, args.interval, start_ms, end_ms)
+        print(f"从本地归档读取{len(klines)}个交易对{args.days}天的{args.interval}K线")
+        _run(klines, args)
+        return
+
+    from binance.client import Client
+    client = Client()
+    symbols = args.symbols
+    if not symbols:
+        tickers = [t for t in client.futures_ticker()
+                   if t['symbol'].endswith('USDT') and t['symbol'] not in exclude_symbols]
+        tickers.sort(key=lambda t: float(t['quoteVolume']), reverse=True)
+        symbols = [t['symbol'] for t in tickers[:args.top]]
+
+    print(f"下载{len(symbols)}个交易对{args.days}天的{args.interval}K线...")
+    klines = {symbol: fetch_klines_rest(client, symbol, args.interval, start_ms, end_ms) for symbol in symbols}
+    _run(klines, args)
+
+
+def _run(klines, args):
+    start = time.time()
+    backtester = Backtester(profit_threshold=args.profit_threshold, fee_rate=args.fee_rate)
+    result = backtester.run(*align_klines(klines))
+    _print_summary(result.summary(), time.time() - start)
+    if args.trades:
+        result.write_trades(args.trades)
+        print(f"成交记录已写入 {args.trades}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+import numpy as np
+from collections import Counter
+from datetime import datetime
+from binance.enums import SIDE_BUY
+from exchange_simulator import SimulatedExchange, SimulatedClient, SimulatedSocketManager
+from rate_governor import RateGovernor
+from config import LONG_AMOUNT, LONG_LEVERAGE
+
+# 每轮测量的阶段，hourly_scan包含symbol_scan、stop_updates和signal_orders
+STAGES = ('prewarm', 'symbol_scan', 'stop_updates', 'signal_orders', 'hourly_scan', 'take_profit')
+
+
+class VirtualClock:
+    """本地时间加一个可推进的偏移量，每轮推进一小时，模拟交易所、限频器和签名时间戳共用"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def time(self):
+        return time.time() + self.offset
+
+    def advance(self, seconds):
+        self.offset += seconds
+
+
+class StageRecorder:
+    """记录各阶段的耗时、请求数和权重；内存追踪期间只记录峰值内存"""
+
+    def __init__(self, exchange):
+        """
+        :param exchange: SimulatedExchange实例，从其统计中读取请求数和权重
+        """
+        self.exchange = exchange
+        self.samples = {stage: [] for stage in STAGES}  # 格式: {阶段: [耗时(秒)]}
+        self.requests = {stage: Counter() for stage in STAGES}  # 格式: {阶段: {接口名: 请求数}}
+        self.weights = Counter()  # 格式: {阶段: 累计权重}
+        self.peaks = {}  # 格式: {阶段: 峰值内存(字节)}
+        self._active = []  # 正在测量的阶段（嵌套时外层在前）
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        counts = Counter(self.exchange.request_counts)
+        weight = sum(self.exchange.request_weights.values())
+        self._active.append(stage)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._active.pop()
+            if tracing:
+                # 内层阶段会重置峰值，外层阶段的峰值取各内层峰值的最大值
+                peak = tracemalloc.get_traced_memory()[1]
+                for name in self._active + [stage]:
+                    self.peaks[name] = max(self.peaks.get(name, 0), peak)
+            else:
+                self.samples[stage].append(elapsed)
+                self.requests[stage].update(self.exchange.request_counts - counts)
+                self.weights[stage] += sum(self.exchange.request_weights.values()) - weight
+
+    def summary(self):
+        """各阶段的统计结果（请求数和权重为每轮平均值）"""
+        result = {}
+        for stage in STAGES:
+            samples = np.array(self.samples[stage]) * 1000
+            n = len(samples)
+            if n == 0:
+                continue
+            result[stage] = {
+                'samples': n,
+                'wall_s': round(float(samples.sum()) / 1000, 4),
+                'mean_ms': round(float(samples.mean()), 3),
+                'p50_ms': round(float(np.percentile(samples, 50)), 3),
+                'p99_ms': round(float(np.percentile(samples, 99)), 3),
+                'max_ms': round(float(samples.max()), 3),
+                'request_count': round(sum(self.requests[stage].values()) / n, 2),
+                'weight': round(self.weights[stage] / n, 2),
+                'requests': {name: round(count / n, 2) for name, count in sorted(self.requests[stage].items())},
+                'peak_memory_kb': round(self.peaks.get(stage, 0) / 1024, 1),
+            }
+        return result
+
+
+def ensure_positions(trader, exchange, count):
+    """在前K标的中开多单并设置止损，使持仓数保持在count（不计入测量）"""
+    for symbol in trader.symbols:
+        if len(exchange.positions) >= count:
+            return
+        if symbol in exchange.positions:
+            continue
+        kline = trader.get_current_hour_klines(symbol)
+        if not kline:
+            continue
+        quantity = trader.calculate_quantity(symbol, LONG_AMOUNT, LONG_LEVERAGE, price=kline['close'])
+        if not quantity:
+            continue
+        order = trader.place_order(symbol, SIDE_BUY, quantity, is_long=True)
+        if order:
+            entry_price, filled = trader._order_fill(order, kline)
+            trader.set_stop_loss(symbol, SIDE_BUY, entry_price, kline, quantity=filled)
+
+
+def run_iteration(trader, monitor, exchange, clock, clients, recorder, positions):
+    """推进一小时行情后按实盘顺序执行一轮：预加载、第59分钟扫描、止盈检查"""
+    clock.advance(3600)
+    for client in clients:
+        client.timestamp_offset = clock.offset * 1000
+    exchange.step(3600)
+    ensure_positions(trader, exchange, positions)
+
+    with recorder.measure('prewarm'):
+        trader.prewarm()
+    with recorder.measure('hourly_scan'):
+        with recorder.measure('symbol_scan'):
+            current_positions, top_symbols, signals = trader.scan_signals()
+        with recorder.measure('stop_updates'):
+            trader.update_stops(current_positions)
+        with recorder.measure('signal_orders'):
+            trader.act_on_signals(top_symbols, signals)
+    with recorder.measure('take_profit'):
+        monitor.check_and_execute_take_profit()
+
+
+def run_size(size, iterations, positions, seed, latency_scale, failure_rate, state_dir):
+    """
+    对一个交易对数量运行基准测试
+    :return: 各阶段统计结果
+    """
+    from binance_main import BinanceFuturesTrader
+    from binance_take_profit import TakeProfitMonitor
+
+    clock = VirtualClock()
+    failures = {'*': {-1007: failure_rate}} if failure_rate else None
+    exchange = SimulatedExchange(symbols=size, seed=seed, balance=1e7, latency_scale=latency_scale,
+                                 failures=failures, now_func=clock.time)
+    governor = RateGovernor(state_file=os.path.join(state_dir, f"governor_{size}.json"), now_func=clock.time)
+    clients = [SimulatedClient(exchange), SimulatedClient(exchange)]
+
+    trader = BinanceFuturesTrader('', '', client=clients[0], socket_manager=SimulatedSocketManager(exchange),
+                                  rate_governor=governor)
+    monitor = TakeProfitMonitor('', '', client=clients[1], socket_manager=SimulatedSocketManager(exchange),
+                                rate_governor=governor)
+    # 实盘中扫描比预加载晚prewarm_lead_seconds秒，总会重新请求最新K线
+    trader.kline_max_age = 0
+    trader.top_symbol_limit = trader.universe.limit = size
+    trader.refresh_symbol_list()
+
+    recorder = StageRecorder(exchange)
+    try:
+        for _ in range(iterations):
+            run_iteration(trader, monitor, exchange, clock, clients, recorder, positions)
+        # 单独追踪一轮的峰值内存（追踪会拖慢运行，不计入耗时）
+        tracemalloc.start()
+        try:
+            run_iteration(trader, monitor, exchange, clock, clients, recorder, positions)
+        finally:
+            tracemalloc.stop()
+    finally:
+        for component in (trader, monitor):
+            component.exchange_info.stop()
+            if component.user_stream:
+                component.user_stream.stop()
+            if component.socket_manager:
+                component.socket_manager.stop()
+        trader.executor.shutdown(wait=False)
+
+    result = recorder.summary()
+    result['_errors'] = {str(code): count for code, count in exchange.error_counts.items()}
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(results, baseline=None):
+    """打印结果表格，提供基准结果时附带p50/p99与请求权重的变化"""
+    for size, stages in results.items():
+        print(f"\n交易对数量: {size}")
+        print(f"{'阶段':<14}{'p50(ms)':>10}{'p99(ms)':>10}{'请求数':>8}{'权重':>8}{'峰值内存(KB)':>14}")
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            row = stages[stage]
+            line = (f"{stage:<14}{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['request_count']:>8.1f}"
+                    f"{row['weight']:>8.1f}{row['peak_memory_kb']:>14.1f}")
+            old = (baseline or {}).get(size, {}).get(stage)
+            if old:
+                line += (f"   p50 {_change(old['p50_ms'], row['p50_ms'])}, p99 {_change(old['p99_ms'], row['p99_ms'])}, "
+                         f"权重 {_change(old['weight'], row['weight'])}")
+            print(line)
+
+
+def _change(old, new):
+    if not old:
+        return 'n/a'
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在模拟交易所上测量每小时周期各阶段的耗时、请求数、权重和内存')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[28, 100, 300], help='交易对数量')
+    parser.add_argument('--iterations', type=int, default=10, help='每个数量运行的小时周期数')
+    parser.add_argument('--positions', type=int, default=10, help='保持的持仓数量')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='模拟延迟缩放系数，0表示不等待')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='每个请求返回-1007的概率')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON结果输出路径')
+    parser.add_argument('--compare', help='用于比较的历史JSON结果')
+    parser.add_argument('--verbose', action='store_true', help='显示交易器和监控器的输出')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as state_dir:
+        for size in args.sizes:
+            print(f"运行 {size} 个交易对, {args.iterations} 轮...", file=sys.stderr)
+            start = time.time()
+            if args.verbose:
+                results[str(size)] = run_size(size, args.iterations, args.positions, args.seed,
+                                              args.latency_scale, args.failure_rate, state_dir)
+            else:
+                # 屏蔽交易器的print和INFO日志，只保留警告
+                logging.disable(logging.INFO)
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        results[str(size)] = run_size(size, args.iterations, args.positions, args.seed,
+                                                      args.latency_scale, args.failure_rate, state_dir)
+                finally:
+                    logging.disable(logging.NOTSET)
+            print(f"完成，耗时{time.time() - start:.1f}秒", file=sys.stderr)
+
+    output = {
+        'meta': {
+            'commit': _git_commit(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'positions': args.positions,
+            'seed': args.seed,
+            'latency_scale': args.latency_scale,
+            'failure_rate': args.failure_rate,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_report(results, baseline)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,75 @@
+import os
 import time
-import pandas as pd
 from datetime import datetime
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait
+from binance import ThreadedWebsocketManager
 from binance.client import Client
 from binance.enums import *
 # 导入时间同步管理器
-from time_sync_config import time_sync_manager
+from time_sync_config import time_sync_manager, SyncedTimestampMixin
+# 导入共享连接池
+from http_pool import http_pool, PooledSessionMixin
+# 导入交易所信息缓存
+from exchange_info_cache import ExchangeInfoCache
+# 导入交易量前K交易对池
+from symbol_universe import SymbolUniverse
+# 导入K线增量存储
+from kline_store import KlineStore
+# 导入本地K线归档
+from kline_archive import KlineArchive
+# 导入批量信号引擎
+from signal_engine import SignalEngine
+# 导入共用的策略规则
+import strategy_rules as rules
+# 导入持仓快照
+from position_book import PositionSnapshot
+# 导入用户数据流
+from user_data_stream import UserDataStream, OrderBook
+# 导入请求限频器和请求执行器
+from rate_governor import RateGovernor
+from request_executor import RequestExecutor
+# 导入按服务器时间对齐的调度器
+from scheduler import Scheduler
+# 导入运行指标
+import metrics
+# 导入异步日志管道
+import log_pipeline
 # 导入配置参数
 from config import LONG_LEVERAGE, SHORT_LEVERAGE, LONG_AMOUNT, SHORT_AMOUNT, exclude_symbols
+from config import EXCHANGE_INFO_TTL, EXCHANGE_INFO_REFRESH_INTERVAL
+from config import TOP_SYMBOL_LIMIT, USE_MARKET_STREAMS
+from config import KLINE_CAPACITY, KLINE_MAX_AGE, USE_KLINE_ARCHIVE, KLINE_ARCHIVE_DIR
+from config import SCAN_WORKERS, SCAN_FETCH_TIMEOUT
+from config import POSITION_SNAPSHOT_MAX_AGE, USE_USER_DATA_STREAM, USER_STREAM_MAX_SILENCE
+from config import RATE_LIMIT_WEIGHT_PER_MINUTE, RATE_LIMIT_SAFETY_RATIO, RATE_LIMIT_STATE_FILE
+from config import RATE_LIMIT_SYNC_INTERVAL
+from config import REQUEST_MAX_RETRIES, REQUEST_DEADLINE
+from config import PREWARM_LEAD_SECONDS
+from config import METRICS_PORT, METRICS_JSON_DIR, METRICS_JSON_INTERVAL
+from config import LOG_LEVEL, LOG_FILE, LOG_SAMPLE_INTERVAL
+
+# 经过队列异步输出的日志器，控制台写入不阻塞交易线程
+logger = log_pipeline.get_logger('BinanceTrader', '交易')
 
 
 # 创建一个支持时间同步的自定义Binance客户端类
-class TimeSyncedBinanceClient(Client):
-    def _get_timestamp(self):
-        # 使用时间同步管理器提供的同步后时间戳
-        return time_sync_manager.get_synced_timestamp()
+class TimeSyncedBinanceClient(SyncedTimestampMixin, PooledSessionMixin, Client):
+    # 签名时间戳使用时间同步管理器提供的偏移量，会话使用共享连接池
+    pass
 
 class BinanceFuturesTrader:
-    def __init__(self, api_key, api_secret):
+    def __init__(self, api_key, api_secret, client=None, socket_manager=None, rate_governor=None):
         """
         初始化交易器
         :param api_key: Binance API
         :param api_secret: Binance API KEY
+        :param client: 替代的REST客户端（如exchange_simulator.SimulatedClient），None时连接币安
+        :param socket_manager: 替代的推送管理器（如SimulatedSocketManager），None时创建ThreadedWebsocketManager
+        :param rate_governor: 替代的限频器，None时按配置创建（与止盈监控器共享状态文件）
         """
         # 使用自定义的支持时间同步的客户端
-        self.client = TimeSyncedBinanceClient(api_key, api_secret)
+        self.client = client or TimeSyncedBinanceClient(api_key, api_secret)
         # 时间同步已在time_sync_manager初始化时自动完成，无需额外输出
         # 从配置文件导入杠杆参数
         self.long_leverage = LONG_LEVERAGE  # 多单杠杆
@@ -35,104 +81,167 @@ class BinanceFuturesTrader:
         self.exclude_symbols = exclude_symbols
         # 网络请求参数
         self.request_timeout = 10  # 请求超时时间(秒)
-        self.max_retries = 3  # 最大重试次数
-        self.retry_delay = 1  # 重试延迟(秒)
+        self.max_retries = REQUEST_MAX_RETRIES  # 最大尝试次数
+        self.request_deadline = REQUEST_DEADLINE  # 单次调用(包括重试)的最长时间(秒)
+
+        # 请求限频：按接口权重提前等待，响应头校准已用额度，与止盈监控器共享
+        self.rate_governor = rate_governor or RateGovernor(
+            weight_limit=RATE_LIMIT_WEIGHT_PER_MINUTE,
+            safety_ratio=RATE_LIMIT_SAFETY_RATIO,
+            state_file=RATE_LIMIT_STATE_FILE,
+            sync_interval=RATE_LIMIT_SYNC_INTERVAL
+        )
+        self.rate_governor.install(self.client)
+        self.request_executor = RequestExecutor(
+            rate_governor=self.rate_governor,
+            time_sync=time_sync_manager,
+            max_retries=self.max_retries,
+            deadline=self.request_deadline,
+            request_timeout=self.request_timeout
+        )
+
+        # 并行扫描：数据请求在线程池中并行，同一交易对的下单通过交易对锁串行
+        self.executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix='scan')
+        self.scan_fetch_timeout = SCAN_FETCH_TIMEOUT  # K线更新阶段的最长等待时间(秒)
+        self.symbol_locks = {}  # 格式: {symbol: Lock}
+        self._symbol_locks_guard = Lock()
+
+        # 持仓快照：每轮请求一次全账户持仓，按交易对查询时复用，自己下单后失效
+        self.positions = PositionSnapshot(
+            lambda: self.safe_request(self.client.futures_position_information),
+            max_age=POSITION_SNAPSHOT_MAX_AGE
+        )
 
         # 新增：用于跟踪止损订单关系
         self.order_relations = {}  # 格式: {symbol: {'stop_loss': orderId}}
 
-        # 初始化交易对列表
-        self.symbols = [s for s in self.get_top_volume_symbols(limit=28, exclude=self.exclude_symbols)
-                        if self.validate_symbol(s)]
-        self.setup_account()
-        print(f"初始化完成，将监控{len(self.symbols)}个交易对")
-
-    def validate_symbol(self, symbol):
-        """验证交易对是否有效"""
-        try:
-            info = self.safe_request(self.client.futures_exchange_info)
-            return any(s['symbol'] == symbol and s['status'] == 'TRADING'
-                       for s in info['symbols'])
-        except:
-            return False
-
-    def refresh_symbol_list(self):
-        """强制刷新交易对列表"""
-        print("强制刷新交易对列表...")
-        self.symbols = [s for s in self.get_top_volume_symbols(limit=28, exclude=self.exclude_symbols)
-                        if self.validate_symbol(s)]
-        print(f"最新有效交易对: {self.symbols}")
-
-    def safe_request(self, request_func, *args, **kwargs):
-        """带重试机制的请求包装函数，包含时间同步错误处理"""
-        last_exception = None
-        for attempt in range(self.max_retries):
+        # 预加载阶段暂存的账户状态，决策时直接使用
+        self.leverage_state = {}  # 格式: {symbol: 当前杠杆}
+        self.account_balance = None  # USDT余额
+        self.prewarm_lead_seconds = PREWARM_LEAD_SECONDS
+
+        # 交易所信息缓存：整个进程只下载一次，后台定时刷新，按交易对索引
+        self.exchange_info = ExchangeInfoCache(
+            lambda: self.safe_request(self.client.futures_exchange_info),
+            ttl=EXCHANGE_INFO_TTL,
+            refresh_interval=EXCHANGE_INFO_REFRESH_INTERVAL
+        )
+        self.exchange_info.start()
+
+        # K线增量存储：每个交易对首次加载完整历史，之后只补充最新K线
+        self.kline_store = KlineStore(self._get_raw_klines, interval='1h', capacity=KLINE_CAPACITY)
+        self.kline_max_age = KLINE_MAX_AGE  # 同一轮内复用K线的最长时间(秒)
+        # 本地K线归档：首次加载交易对时先从归档填充，只请求归档之后的K线
+        self.kline_archive = KlineArchive(KLINE_ARCHIVE_DIR) if USE_KLINE_ARCHIVE else None
+        # 批量信号引擎：所有交易对的MA20/MA60和开仓信号一次计算
+        self.signal_engine = SignalEngine(self.kline_store)
+
+        # 初始化交易对池：先批量轮询一次，之后跟随!ticker@arr行情流实时更新self.symbols
+        self.top_symbol_limit = TOP_SYMBOL_LIMIT
+        self.universe = SymbolUniverse(
+            self.exchange_info,
+            limit=self.top_symbol_limit,
+            exclude=self.exclude_symbols,
+            on_change=self._on_universe_change
+        )
+        self.symbols = []
+        self.refresh_symbol_list()
+
+        # WebSocket行情流
+        self.socket_manager = None
+        if USE_MARKET_STREAMS:
             try:
-                return request_func(*args, **kwargs)
+                self.socket_manager = socket_manager or ThreadedWebsocketManager(api_key, api_secret)
+                self.socket_manager.start()
+                self.universe.start_stream(self.socket_manager)
             except Exception as e:
-                # 特定错误码直接抛出，不重试
-                if hasattr(e, 'code') and e.code in [-4059]:  # 不需要更改持仓模式的错误
-                    raise e
-                
-                # 处理时间同步错误(1021错误码)
-                if hasattr(e, 'code') and e.code == 1021:
-                    print(f"检测到时间同步错误(1021)，重新同步时间...")
-                    time_sync_manager.sync_time()
-                    print(f"重新同步后时间偏移量: {time_sync_manager.time_offset}ms")
-                    time.sleep(self.retry_delay)
-                    continue
+                logger.warning(f"启动行情流失败，改用定时轮询: {e}")
+                self.socket_manager = None
+
+        # 用户数据流：推送维护持仓快照和委托单簿，止损成交后立即清理关联订单
+        self.order_book = OrderBook()
+        self.user_stream = None
+        if self.socket_manager and USE_USER_DATA_STREAM:
+            self.user_stream = UserDataStream(
+                self.socket_manager,
+                lambda: self.safe_request(self.client.futures_get_open_orders),
+                self.positions,
+                self.order_book,
+                on_position_closed=self._on_position_closed,
+                max_silence=USER_STREAM_MAX_SILENCE
+            )
+            self.user_stream.start()
 
-                last_exception = e
-                print(f"请求失败 (尝试 {attempt + 1}/{self.max_retries}): {str(e)}")
-                time.sleep(self.retry_delay)
-        raise last_exception if last_exception else Exception("未知请求错误")
+        # 调度器在run_strategy中创建
+        self.scheduler = None
+        self.running = False
 
-    def get_top_volume_symbols(self, limit=28, exclude=None):
-        """获取成交量前limit的USDT合约，排除指定交易对和下架交易对"""
-        if exclude is None:
-            exclude = []
+        self.setup_account()
+        self.load_leverage_state()
+        logger.info(f"初始化完成，将监控{len(self.symbols)}个交易对")
 
+    def refresh_symbol_list(self):
+        """强制刷新交易对列表（批量轮询一次全部行情）"""
+        logger.info("强制刷新交易对列表...")
         try:
-            # 获取交易所信息
-            exchange_info = self.safe_request(self.client.futures_exchange_info)
-
-            # 获取当前有效的交易对列表
-            valid_symbols = [s['symbol'] for s in exchange_info['symbols']
-                             if s['quoteAsset'] == 'USDT'
-                             and s['contractType'] == 'PERPETUAL'
-                             and s['status'] == 'TRADING'  # 只选择正在交易中的
-                             and s['symbol'] not in exclude]
-
-            # 获取成交量数据
-            tickers = self.safe_request(self.client.futures_ticker)
-            volume_data = []
-
-            for ticker in tickers:
-                if ticker['symbol'] in valid_symbols:  # 只处理有效交易对
-                    volume_data.append({
-                        'symbol': ticker['symbol'],
-                        'volume': float(ticker['quoteVolume'])
-                    })
-
-            volume_df = pd.DataFrame(volume_data)
-            return volume_df.sort_values('volume', ascending=False).head(limit)['symbol'].tolist()
+            self.universe.poll(lambda: self.safe_request(self.client.futures_ticker))
+            self.symbols = self.universe.top_symbols()
         except Exception as e:
-            print(f"获取交易量前{limit}标的失败: {e}")
-            return []  # 返回空列表而不是None，避免后续处理出错
+            logger.error(f"刷新交易对列表失败: {e}")
+        logger.info(f"最新有效交易对: {len(self.symbols)}个", symbols=','.join(self.symbols))
+
+    def stream_live(self):
+        """用户数据流是否可用（不可用时退回REST轮询）"""
+        return self.user_stream is not None and self.user_stream.is_live()
+
+    def _on_position_closed(self, symbol):
+        """
+        用户数据流推送持仓归零：止损已成交，在线程池中撤销此刻记录的关联订单
+        （反手时平仓也会触发，撤单任务执行前可能已经开了新仓并设置了新止损单）
+        """
+        relation = self.order_relations.get(symbol)
+        if relation is None:
+            return
+        logger.info("止损单已成交，仓位已平", symbol=symbol)
+        order_ids = {order['orderId'] for order in self.order_book.open_orders(symbol) if self._is_stop_order(order)}
+        if relation.get('stop_loss') is not None:
+            order_ids.add(relation['stop_loss'])
+        self.executor.submit(self._cleanup_closed_position, symbol, sorted(order_ids))
+
+    def _cleanup_closed_position(self, symbol, order_ids):
+        """持有交易对锁确认仍无持仓后，只撤销平仓时记录的订单"""
+        with self._symbol_lock(symbol):
+            position = self.get_position(symbol)
+            if position and float(position['positionAmt']) != 0:
+                logger.info("已重新开仓，跳过撤销平仓时的关联订单", symbol=symbol)
+                return
+            self.cancel_associated_orders(symbol, order_ids)
+
+    def _on_universe_change(self, added, removed):
+        """交易对池排名变化回调，保持self.symbols为最新的前K交易对"""
+        self.symbols = self.universe.top_symbols()
+        logger.info("交易对池变化", added=','.join(added), removed=','.join(removed))
+
+    def safe_request(self, request_func, *args, **kwargs):
+        """通过统一的请求执行器发送请求（限频、按错误码重试、时间同步错误处理）"""
+        return self.request_executor.execute(request_func, *args, **kwargs)
 
     def update_symbols(self):
-        """无条件更新为最新的交易量前28标的"""
-        print("更新交易量前28标的...")
+        """更新为最新的交易量前K标的；行情流正常时列表已实时更新，只需同步下架信息"""
+        logger.info(f"更新交易量前{self.top_symbol_limit}标的...")
         try:
-            new_symbols = [s for s in self.get_top_volume_symbols(limit=28, exclude=self.exclude_symbols)
-                           if self.validate_symbol(s)]
+            self.universe.refresh_eligible()
+            if not self.universe.is_live():
+                # 行情流不可用，退回批量轮询
+                self.universe.poll(lambda: self.safe_request(self.client.futures_ticker))
+            new_symbols = self.universe.top_symbols()
             if new_symbols:  # 只有获取成功时才更新
                 self.symbols = new_symbols
-                print(f"最新监控列表: {self.symbols}")
+                logger.info(f"最新监控列表: {len(self.symbols)}个", symbols=','.join(self.symbols))
             else:
-                print("保持原有交易对列表")
+                logger.warning("保持原有交易对列表")
         except Exception as e:
-            print(f"更新交易对列表失败: {e}")
+            logger.error(f"更新交易对列表失败: {e}")
 
     def setup_account(self):
         """设置账户参数"""
@@ -144,7 +253,7 @@ class BinanceFuturesTrader:
 
             # 如果已经是单向持仓模式，则不需要再次设置
             if not position_mode['dualSidePosition']:
-                print("账户已是单向持仓模式，无需更改")
+                logger.info("账户已是单向持仓模式，无需更改")
                 return
 
             # 尝试设置单向持仓模式
@@ -153,14 +262,14 @@ class BinanceFuturesTrader:
                     self.client.futures_change_position_mode,
                     dualSidePosition=False
                 )
-                print("成功设置为单向持仓模式")
+                logger.info("成功设置为单向持仓模式")
             except Exception as e:
                 if hasattr(e, 'code') and e.code == -4059:
-                    print("账户已是单向持仓模式")
+                    logger.info("账户已是单向持仓模式")
                 else:
-                    print(f"账户设置警告: {e}")
+                    logger.warning(f"账户设置警告: {e}")
         except Exception as e:
-            print(f"获取持仓模式失败: {e}")
+            logger.error(f"获取持仓模式失败: {e}")
 
     def get_account_balance(self):
         """获取U本位合约账户USDT余额"""
@@ -171,161 +280,123 @@ class BinanceFuturesTrader:
                     return float(asset['balance'])
             return 0.0
         except Exception as e:
-            print(f"获取余额失败: {e}")
+            logger.error(f"获取余额失败: {e}")
             return 0.0
 
     def get_positions(self):
         """获取U本位合约持仓数据"""
         try:
-            positions = self.safe_request(self.client.futures_position_information)
-            return [pos for pos in positions if float(pos['positionAmt']) != 0]
+            return self.positions.open_positions()
         except Exception as e:
-            print(f"获取持仓失败: {e}")
+            logger.error(f"获取持仓失败: {e}")
             return []
 
-    def _get_raw_klines(self, symbol, interval='1h', limit=100):
+    def _get_raw_klines(self, symbol, interval='1h', limit=100, start_time=None):
         """获取原始K线数据的私有方法，供其他方法调用"""
         try:
-            klines = self.safe_request(
-                self.client.futures_klines,
-                symbol=symbol,
-                interval=interval,
-                limit=limit
-            )
+            params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+            if start_time is not None:
+                params['startTime'] = start_time
+            klines = self.safe_request(self.client.futures_klines, **params)
             if not klines:
-                print(f"获取{symbol}原始K线数据为空")
+                logger.warning("获取原始K线数据为空", symbol=symbol, sample=('K线为空', symbol))
                 return None
             return klines
         except Exception as e:
-            print(f"获取{symbol}原始K线数据失败: {e}")
-            return None
-
-    def get_klines_data(self, symbol, interval='1h', limit=100):
-        """处理K线数据并计算指标"""
-        try:
-            # 复用_get_raw_klines方法获取数据
-            klines = self._get_raw_klines(symbol, interval, limit)
-            if not klines:
-                return None
-
-            df = pd.DataFrame(klines, columns=[
-                'open_time', 'open', 'high', 'low', 'close', 'volume',
-                'close_time', 'quote_asset_volume', 'number_of_trades',
-                'taker_buy_base', 'taker_buy_quote', 'ignore'
-            ])
-
-            numeric_cols = ['open', 'high', 'low', 'close']
-            df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, axis=1)
-
-            # 检查数据量是否足够计算移动平均线
-            if len(df) >= 60:
-                # 计算移动平均线，使用bfill()处理可能的NaN值
-                df['ma_20'] = df['close'].rolling(20).mean().bfill()
-                df['ma_60'] = df['close'].rolling(60).mean().bfill()
-            elif len(df) >= 20:
-                # 至少有20根K线，计算MA20，MA60设为NaN
-                df['ma_20'] = df['close'].rolling(20).mean().bfill()
-                df['ma_60'] = pd.NA
-                print(f"{symbol} K线数据量({len(df)})不足60根，无法计算MA60")
-            else:
-                # 数据量不足20根K线
-                df['ma_20'] = pd.NA
-                df['ma_60'] = pd.NA
-                print(f"{symbol} K线数据量({len(df)})不足20根，无法计算移动平均线")
-                return None
-
-            # 确保最后一行数据没有NaN值
-            if df.iloc[-1][['ma_20', 'ma_60']].isna().any():
-                print(f"{symbol} 最新K线数据移动平均线计算结果包含NaN值")
-                return None
-
-            return df.iloc[-1]
-        except Exception as e:
-            print(f"处理{symbol}K线数据失败: {e}")
+            logger.error(f"获取原始K线数据失败: {e}", symbol=symbol)
             return None
 
     def get_current_hour_klines(self, symbol):
         """获取当前小时的K线数据（用于动态止损判断）"""
         try:
-            # 复用_get_raw_klines方法获取数据
-            klines = self._get_raw_klines(symbol, '1h', 1)
-            if not klines:
+            # 与批量信号计算共用K线存储，只补充最新K线
+            if not self.kline_store.update(symbol, max_age=self.kline_max_age):
                 return None
+            last = self.kline_store.last_kline(symbol)
 
             kline = {
-                'open': float(klines[0][1]),
-                'high': float(klines[0][2]),
-                'low': float(klines[0][3]),
-                'close': float(klines[0][4]),
-                'price_change_pct': (float(klines[0][4]) - float(klines[0][1])) / float(klines[0][1]) * 100
+                'open': last['open'],
+                'high': last['high'],
+                'low': last['low'],
+                'close': last['close'],
+                'price_change_pct': (last['close'] - last['open']) / last['open'] * 100
             }
             return kline
         except Exception as e:
-            print(f"获取{symbol}当前小时K线失败: {e}")
+            logger.error(f"获取当前小时K线失败: {e}", symbol=symbol)
             return None
 
+    def load_leverage_state(self):
+        """一次请求所有交易对的当前杠杆"""
+        try:
+            configs = self.safe_request(self.client.futures_symbol_config)
+            self.leverage_state = {config['symbol']: int(config['leverage']) for config in configs}
+        except Exception as e:
+            logger.error(f"获取杠杆设置失败: {e}")
+
     def adjust_leverage(self, symbol, is_long=True):
-        """根据交易方向调整杠杆"""
+        """根据交易方向调整杠杆，杠杆已经相同时不发送请求"""
         leverage = self.long_leverage if is_long else self.short_leverage
+        if self.leverage_state.get(symbol) == leverage:
+            return True
         try:
-            self.safe_request(
+            result = self.safe_request(
                 self.client.futures_change_leverage,
                 symbol=symbol,
                 leverage=leverage
             )
+            self.leverage_state[symbol] = int(result.get('leverage', leverage))
             return True
         except Exception as e:
-            print(f"调整{symbol}杠杆失败: {e}")
+            # 状态未知，下次重新设置
+            self.leverage_state.pop(symbol, None)
+            logger.error(f"调整杠杆失败: {e}", symbol=symbol)
             return False
 
-    def calculate_quantity(self, symbol, usdt_amount, leverage):
-        """计算合约数量，确保符合交易对的 LOT_SIZE 规则"""
+    def calculate_quantity(self, symbol, usdt_amount, leverage, price=None):
+        """
+        计算合约数量，确保符合交易对的 LOT_SIZE 规则
+        :param price: 已知的最新价格（如刚更新的K线收盘价），None时请求最新价格
+        """
         try:
-            # 获取当前价格
-            ticker = self.safe_request(self.client.futures_symbol_ticker, symbol=symbol)
-            price = float(ticker['price'])
+            if price is None:
+                # 获取当前价格
+                ticker = self.safe_request(self.client.futures_symbol_ticker, symbol=symbol)
+                price = float(ticker['price'])
             raw_quantity = usdt_amount * leverage / price
 
-            # 获取交易对的 LOT_SIZE 规则
-            exchange_info = self.safe_request(self.client.futures_exchange_info)
-            symbol_info = next((s for s in exchange_info['symbols'] if s['symbol'] == symbol), None)
+            # 从缓存获取交易对的 LOT_SIZE 规则
+            symbol_info = self.exchange_info.get_symbol_info(symbol)
 
             if not symbol_info:
-                print(f"{symbol} 交易对信息获取失败")
+                logger.error("交易对信息获取失败", symbol=symbol)
                 return None
 
-            lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
+            lot_size_filter = symbol_info['lot_size']
             if not lot_size_filter:
-                print(f"{symbol} 没有 LOT_SIZE 限制")
+                logger.warning("没有 LOT_SIZE 限制", symbol=symbol)
                 return None
 
-            step_size = float(lot_size_filter['stepSize'])
-            min_qty = float(lot_size_filter['minQty'])
+            step_size = lot_size_filter['stepSize']
+            min_qty = lot_size_filter['minQty']
 
             # 计算符合 stepSize 的数量
-            quantity = round(raw_quantity / step_size) * step_size
+            quantity = rules.round_step(raw_quantity, step_size)
 
             # 确保不小于 minQty
             if quantity < min_qty:
-                print(f"{symbol} 计算数量 {quantity} 小于最小交易量 {min_qty}")
+                logger.warning("计算数量小于最小交易量", symbol=symbol, quantity=quantity, min_qty=min_qty)
                 return None
 
             # 格式化数量，避免科学计数法或多余小数
-            # 改进格式化逻辑，确保精度正确
-            try:
-                quantity_str = f"{quantity:.{symbol_info['quantityPrecision']}f}"
-                quantity = float(quantity_str.rstrip('0').rstrip('.') if '.' in quantity_str else quantity_str)
-            except:
-                # 如果无法获取quantityPrecision，使用备用方法
-                quantity = float(
-                    f"{quantity:.8f}".rstrip('0').rstrip('.') if '.' in f"{quantity:.8f}" else f"{quantity:.0f}")
-
-            print(
-                f"{symbol} 计算数量: {quantity} (价格: {price}, 原始数量: {raw_quantity}, stepSize: {step_size}, minQty: {min_qty})")
+            quantity = rules.format_quantity(quantity, symbol_info['quantityPrecision'])
+
+            logger.debug("计算数量", symbol=symbol, quantity=quantity, price=price, raw_quantity=raw_quantity,
+                         step_size=step_size, min_qty=min_qty)
             return quantity
 
         except Exception as e:
-            print(f"计算 {symbol} 数量失败: {e}")
+            logger.error(f"计算数量失败: {e}", symbol=symbol)
             return None
 
     def place_order(self, symbol, side, quantity, is_long=True):
@@ -335,6 +406,7 @@ class BinanceFuturesTrader:
         :param side: 买卖方向 (BUY/SELL)
         :param quantity: 数量
         :param is_long: 是否是多单
+        :return: 订单结果（包含成交均价avgPrice和成交数量executedQty）
         """
         if not self.adjust_leverage(symbol, is_long):
             return None
@@ -345,221 +417,223 @@ class BinanceFuturesTrader:
                 symbol=symbol,
                 side=side,
                 type=FUTURE_ORDER_TYPE_MARKET,
-                quantity=quantity
+                quantity=quantity,
+                # 市价单直接返回成交结果，无需再查询成交价
+                newOrderRespType='RESULT'
             )
-            print(f"下单成功: {order}")
+            logger.info("下单成功", symbol=symbol, side=side, orderId=order.get('orderId'),
+                        status=order.get('status'), avgPrice=order.get('avgPrice'), executedQty=order.get('executedQty'))
+            logger.debug("下单响应", order=order)
+            # 持仓已变化，下次读取时重新请求
+            self.positions.invalidate()
             return order
         except Exception as e:
-            print(f"下单失败: {e}")
+            logger.error(f"下单失败: {e}", symbol=symbol, side=side, quantity=quantity)
             return None
 
-    def set_stop_loss(self, symbol, side, entry_price, kline=None):
-        """设置移动止损单"""
-        position = self.get_position(symbol)
-        if not position or float(position['positionAmt']) == 0:
-            return None
+    def set_stop_loss(self, symbol, side, entry_price, kline=None, quantity=None):
+        """
+        设置移动止损单
+        :param quantity: 开仓订单的成交数量，已知时不再查询持仓
+        """
+        if quantity is None:
+            position = self.get_position(symbol)
+            if not position or float(position['positionAmt']) == 0:
+                return None
+            quantity = abs(float(position['positionAmt']))
 
-        quantity = abs(float(position['positionAmt']))
         stop_side = SIDE_SELL if side == SIDE_BUY else SIDE_BUY
 
-        # 获取交易对的 pricePrecision
-        exchange_info = self.safe_request(self.client.futures_exchange_info)
-        symbol_info = next((s for s in exchange_info['symbols'] if s['symbol'] == symbol), None)
-        if not symbol_info:
-            print(f"{symbol} 交易对信息获取失败")
+        # 从缓存获取交易对的 pricePrecision
+        price_precision = self.exchange_info.get_price_precision(symbol)
+        if price_precision is None:
+            logger.error("交易对信息获取失败", symbol=symbol)
             return None
 
-        price_precision = symbol_info['pricePrecision']
-        current_price = float(position['markPrice'])
-
-        # 初始止损设置
-        if side == SIDE_BUY:  # 多单
-            stop_price = round(kline['low'] * 0.999, price_precision)  # 初始止损为开仓时K线最低价下方0.1%的位置
-        else:  # 空单
-            stop_price = round(kline['high'], price_precision)  # 初始止损为开仓时K线最高价
-
-        print(f"{symbol} 初始止损设置: {stop_price}")
-
-        # 先撤销原有止损单
-        self.cancel_associated_orders(symbol)
+        # 初始止损设置：多单为开仓时K线最低价下方0.1%的位置，空单为开仓时K线最高价
+        stop_price = rules.stop_price(side == SIDE_BUY, kline, price_precision)
 
-        # 创建新止损单
-        try:
-            order = self.safe_request(
-                self.client.futures_create_order,
-                symbol=symbol,
-                side=stop_side,
-                type=FUTURE_ORDER_TYPE_STOP_MARKET,
-                stopPrice=stop_price,
-                closePosition=True
-                # 已移除quantity参数，因为closePosition=True表示关闭整个仓位
-            )
-            print(f"止损单设置成功: {order} (止损价格: {stop_price})")
-            if symbol not in self.order_relations:
-                self.order_relations[symbol] = {}
-            self.order_relations[symbol]['stop_loss'] = order['orderId']
-            return order
-        except Exception as e:
-            print(f"止损单设置失败: {e}")
-            return None
+        order = self.replace_stop_loss(symbol, stop_side, stop_price, quantity)
+        if order:
+            logger.info("止损单设置成功", symbol=symbol, orderId=order.get('orderId'), stop_price=stop_price,
+                        quantity=quantity)
+        return order
 
     def update_stop_loss(self, symbol, side, entry_price):
         """更新移动止损（每小时59分检查）"""
         try:
             position = self.get_position(symbol)
             if not position or float(position['positionAmt']) == 0:
-                print(f"{symbol} 无持仓，跳过止损更新")
+                logger.debug("无持仓，跳过止损更新", symbol=symbol)
                 return None
 
             # 获取当前小时K线
             hour_kline = self.get_current_hour_klines(symbol)
             if not hour_kline:
-                print(f"{symbol} 获取K线失败，跳过止损更新")
+                logger.warning("获取K线失败，跳过止损更新", symbol=symbol)
                 return None
 
             # 检查涨跌幅是否满足条件
             price_change = hour_kline['price_change_pct']
-            if (side == SIDE_BUY and price_change >= 1.0) or (side == SIDE_SELL and price_change <= -1.0):
-                print(f"{symbol} 满足止损调整条件，当前涨跌幅: {price_change:.2f}%")
-
-                # 获取交易对精度信息
-                exchange_info = self.safe_request(self.client.futures_exchange_info)
-                symbol_info = next((s for s in exchange_info['symbols'] if s['symbol'] == symbol), None)
-                if not symbol_info:
-                    print(f"{symbol} 交易对信息获取失败")
+            if rules.should_trail_stop(side == SIDE_BUY, price_change):
+                logger.debug("满足止损调整条件", symbol=symbol, price_change=f"{price_change:.2f}%")
+
+                # 从缓存获取交易对精度信息
+                price_precision = self.exchange_info.get_price_precision(symbol)
+                if price_precision is None:
+                    logger.error("交易对信息获取失败", symbol=symbol)
                     return None
 
-                price_precision = symbol_info['pricePrecision']
                 quantity = abs(float(position['positionAmt']))
 
-                # 计算新止损价 (跟踪止损)
-                if side == SIDE_BUY:
-                    # 多单止损价更新至最新小时K线最低价下方0.1%的位置
-                    new_stop_price = round(hour_kline['low'] * 0.999, price_precision)
-                    print(f"{symbol} 多单止损价更新至: {new_stop_price}")
-                else:
-                    # 空单止损价更新至最新小时K线的最高价
-                    new_stop_price = round(hour_kline['high'], price_precision)
-                    print(f"{symbol} 空单止损价更新至: {new_stop_price}")
+                # 计算新止损价 (跟踪止损)：多单更新至最新小时K线最低价下方0.1%，空单更新至最高价
+                new_stop_price = rules.stop_price(side == SIDE_BUY, hour_kline, price_precision)
+                logger.info(f"{'多单' if side == SIDE_BUY else '空单'}止损价更新", symbol=symbol, stop_price=new_stop_price,
+                            price_change=f"{price_change:.2f}%")
 
-                # 先撤销原有止损单
-                self.cancel_associated_orders(symbol)
-
-                # 创建新止损单
                 stop_side = SIDE_SELL if side == SIDE_BUY else SIDE_BUY
-                try:
-                    # 准备提交止损单参数:
-                    print(f"准备提交止损单参数: "
-                          f"symbol={symbol}, "
-                          f"side={stop_side}, "
-                          f"type=STOP_MARKET, "
-                          f"stopPrice={new_stop_price}, "
-                          f"closePosition=True")
-
-                    order = self.safe_request(
-                        self.client.futures_create_order,
-                        symbol=symbol,
-                        side=stop_side,
-                        type='STOP_MARKET',
-                        stopPrice=new_stop_price,
-                        closePosition=True  # 使用closePosition而不是quantity
-                        # 移除timeInForce参数，因为与closePosition=True不兼容
-                    )
-                    print(f"验证订单是否真正创建")
-                    order_id = order['orderId']
-                    verified_order = self.safe_request(
-                        self.client.futures_get_order,
-                        symbol=symbol,
-                        orderId=order_id
-                    )
-                    if verified_order['status'] == 'NEW':
-                        print(f"止损单验证成功: {order_id}")
-                        if symbol not in self.order_relations:
-                            self.order_relations[symbol] = {}
-                        self.order_relations[symbol]['stop_loss'] = order_id
-                        return order
-                    else:
-                        print(f"止损单状态异常: {verified_order['status']}")
-                        return None
-
-                except Exception as e:
-                    print(f"止损单创建失败: {str(e)}")
-                    # 尝试获取错误详情
-                    if hasattr(e, 'code'):
-                        print(f"错误代码: {e.code}")
-                    if hasattr(e, 'message'):
-                        print(f"错误信息: {e.message}")
-                    return None
+                return self.replace_stop_loss(symbol, stop_side, new_stop_price, quantity)
         except Exception as e:
-            print(f"更新止损时发生未预期错误: {str(e)}")
+            logger.error(f"更新止损时发生未预期错误: {str(e)}", symbol=symbol)
             return None
 
+    def replace_stop_loss(self, symbol, stop_side, stop_price, quantity):
+        """
+        替换止损单：先按持仓数量下reduceOnly止损单，成功后再批量撤销旧止损单，
+        替换过程中持仓始终有止损保护；下单响应即为结果，不再查询订单
+        :param stop_side: 止损单方向
+        :param stop_price: 触发价格
+        :param quantity: 持仓数量
+        :return: 新止损单，失败时返回None（旧止损单保留）
+        """
+        old_order_ids = self._stop_order_ids(symbol)
+        quantity_precision = self.exchange_info.get_quantity_precision(symbol)
+        try:
+            if quantity_precision is None:
+                raise ValueError("交易对信息获取失败")
+            order = self.safe_request(
+                self.client.futures_create_order,
+                symbol=symbol,
+                side=stop_side,
+                type=FUTURE_ORDER_TYPE_STOP_MARKET,
+                stopPrice=stop_price,
+                quantity=rules.format_quantity(quantity, quantity_precision),
+                reduceOnly=True
+            )
+        except Exception as e:
+            logger.warning(f"按数量下止损单失败，改用closePosition止损单: {e}", symbol=symbol)
+            return self._replace_close_position_stop(symbol, stop_side, stop_price)
+
+        self.order_relations.setdefault(symbol, {})['stop_loss'] = order['orderId']
+        self._cancel_orders(symbol, [order_id for order_id in old_order_ids if order_id != order['orderId']])
+        return order
+
+    def _replace_close_position_stop(self, symbol, stop_side, stop_price):
+        """
+        closePosition止损单：同方向只能存在一个，已存在时(-4130)先撤销旧止损单再下单
+        """
+        params = dict(symbol=symbol, side=stop_side, type=FUTURE_ORDER_TYPE_STOP_MARKET,
+                      stopPrice=stop_price, closePosition=True)
+        try:
+            order = self.safe_request(self.client.futures_create_order, **params)
+            old_order_ids = [order_id for order_id in self._stop_order_ids(symbol) if order_id != order['orderId']]
+            self._cancel_orders(symbol, old_order_ids)
+        except Exception as e:
+            if getattr(e, 'code', None) != -4130:
+                logger.error(f"止损单设置失败: {e}", symbol=symbol)
+                return None
+            self._cancel_orders(symbol, self._stop_order_ids(symbol))
+            try:
+                order = self.safe_request(self.client.futures_create_order, **params)
+            except Exception as e:
+                logger.error(f"止损单设置失败: {e}", symbol=symbol)
+                return None
+        self.order_relations.setdefault(symbol, {})['stop_loss'] = order['orderId']
+        return order
+
     def get_position(self, symbol):
-        """获取指定交易对的持仓（带验证）"""
+        """获取指定交易对的持仓（带验证），从持仓快照读取"""
         try:
-            positions = self.safe_request(self.client.futures_position_information)
-            for pos in positions:
-                if pos['symbol'] == symbol:
-                    # 验证仓位数据完整性
-                    if all(k in pos for k in ['positionAmt', 'entryPrice', 'markPrice']):
-                        return pos
+            pos = self.positions.get(symbol)
+            # 验证仓位数据完整性
+            if pos and all(k in pos for k in ['positionAmt', 'entryPrice', 'markPrice']):
+                return pos
             return None
         except Exception as e:
-            print(f"获取{symbol}持仓失败: {str(e)}")
+            logger.error(f"获取持仓失败: {str(e)}", symbol=symbol)
             return None
 
-    def check_open_long_signal(self, kline):
-        """检查开多信号"""
-        if kline is None:
-            return False
-
-        # 计算当前K线的涨跌幅（基于开盘价和收盘价）
-        price_change = (kline['close'] - kline['open']) / kline['open'] * 100
-
-        return (kline['close'] > kline['ma_60'] > kline['ma_20'] > kline['open'] and
-                abs(price_change) < 4)  # 涨跌幅小于4%
+    @staticmethod
+    def _is_stop_order(order):
+        """是否是止损单"""
+        return order['type'].upper() in ['STOP_MARKET'] or order['reduceOnly']
 
-    def check_open_short_signal(self, kline):
-        """检查开空信号"""
-        if kline is None:
-            return False
+    def _stop_order_ids(self, symbol):
+        """
+        获取交易对当前的止损单ID：用户数据流可用时从内存委托单簿读取，
+        否则优先使用记录的止损单，没有记录时才请求挂单
+        """
+        if self.stream_live():
+            return [order['orderId'] for order in self.order_book.open_orders(symbol) if self._is_stop_order(order)]
+        stop_loss_id = self.order_relations.get(symbol, {}).get('stop_loss')
+        if stop_loss_id is not None:
+            return [stop_loss_id]
+        open_orders = self.safe_request(self.client.futures_get_open_orders, symbol=symbol)
+        return [order['orderId'] for order in open_orders if self._is_stop_order(order)]
+
+    def _cancel_orders(self, symbol, order_ids):
+        """批量撤单（每次最多10个）"""
+        for i in range(0, len(order_ids), 10):
+            batch = order_ids[i:i + 10]
+            try:
+                results = self.safe_request(self.client.futures_cancel_orders, symbol=symbol, orderidlist=batch)
+            except Exception as e:
+                logger.error(f"批量撤销订单失败: {e}", symbol=symbol, orders=batch)
+                continue
+            for order_id, result in zip(batch, results):
+                # 单个订单失败时返回 {'code': ..., 'msg': ...}
+                if 'code' in result:
+                    if result['code'] == -2011:
+                        # 订单已不存在
+                        self.order_book.remove(symbol, order_id)
+                    else:
+                        logger.error(f"撤销订单失败: {result.get('msg')}", symbol=symbol, orderId=order_id)
+                    continue
+                self.order_book.remove(symbol, order_id)
+                logger.info("已撤销订单", symbol=symbol, orderId=order_id, type=result.get('type'))
 
-        # 计算当前K线的涨跌幅（基于开盘价和收盘价）
-        price_change = (kline['close'] - kline['open']) / kline['open'] * 100
+    def cancel_associated_orders(self, symbol, order_ids=None):
+        """
+        撤销与指定交易对关联的止损单
+        :param order_ids: 只撤销这些订单；None时撤销该交易对当前全部止损单
+        """
+        try:
+            cancel_all = order_ids is None
+            if cancel_all:
+                # 获取所有当前委托：用户数据流可用时从内存委托单簿读取
+                if self.stream_live():
+                    open_orders = self.order_book.open_orders(symbol)
+                else:
+                    open_orders = self.safe_request(self.client.futures_get_open_orders, symbol=symbol)
+                order_ids = [order['orderId'] for order in open_orders if self._is_stop_order(order)]
 
-        return (kline['close'] < kline['ma_60'] < kline['ma_20'] < kline['open'] and
-                abs(price_change) < 4)  # 涨跌幅小于4%
+            # 一次请求撤销全部止损单
+            self._cancel_orders(symbol, list(order_ids))
 
-    def cancel_associated_orders(self, symbol):
-        """撤销与指定交易对关联的所有止损单"""
-        try:
-            # 获取所有当前委托
-            open_orders = self.safe_request(self.client.futures_get_open_orders, symbol=symbol)
-
-            for order in open_orders:
-                # 检查是否是止损单
-                if order['type'].upper() in ['STOP_MARKET'] or order['reduceOnly']:
-                    try:
-                        # 撤销订单
-                        self.safe_request(
-                            self.client.futures_cancel_order,
-                            symbol=symbol,
-                            orderId=order['orderId']
-                        )
-                        print(f"已撤销订单: {order['orderId']} (类型: {order['type']})")
-                    except Exception as e:
-                        print(f"撤销订单{order['orderId']}失败: {e}")
-
-            # 清除该交易对的订单关系记录
-            if symbol in self.order_relations:
+            # 清除该交易对的订单关系记录（只撤销指定订单且记录的止损单已被替换时保留）
+            relation = self.order_relations.get(symbol)
+            if relation is not None and (cancel_all or relation.get('stop_loss') in (None, *order_ids)):
                 del self.order_relations[symbol]
 
         except Exception as e:
-            print(f"获取{symbol}委托单失败: {e}")
+            logger.error(f"获取委托单失败: {e}", symbol=symbol)
 
     def check_order_execution(self):
         """检查订单执行情况"""
         try:
+            # 用户数据流可用时持仓快照已是最新，无需请求
+            if not self.stream_live():
+                self.positions.refresh()
             positions = self.get_positions()
             position_symbols = [pos['symbol'] for pos in positions]
 
@@ -567,11 +641,12 @@ class BinanceFuturesTrader:
             for symbol in list(self.order_relations.keys()):
                 # 如果该交易对已经没有持仓，说明订单已执行
                 if symbol not in position_symbols:
-                    print(f"{symbol} 的止损单已成交，仓位已平")
-                    self.cancel_associated_orders(symbol)
+                    logger.info("止损单已成交，仓位已平", symbol=symbol)
+                    with self._symbol_lock(symbol):
+                        self.cancel_associated_orders(symbol)
 
         except Exception as e:
-            print(f"检查订单执行情况失败: {e}")
+            logger.error(f"检查订单执行情况失败: {e}")
 
     def handle_existing_position(self, symbol, desired_position_type):
         """
@@ -589,11 +664,11 @@ class BinanceFuturesTrader:
         # 检查是否已有同向持仓
         if (current_position_amount > 0 and desired_position_type == 'long') or \
                 (current_position_amount < 0 and desired_position_type == 'short'):
-            print(f"{symbol} 已有同向持仓，禁止重复开仓")
+            logger.info("已有同向持仓，禁止重复开仓", symbol=symbol)
             return False
 
         # 存在反向持仓，先平仓
-        print(f"{symbol} 存在反向持仓，先平仓再开仓")
+        logger.info("存在反向持仓，先平仓再开仓", symbol=symbol)
         if current_position_amount > 0:  # 当前是多头，需要平多
             quantity = abs(current_position_amount)
             self.place_order(symbol, SIDE_SELL, quantity, is_long=False)
@@ -604,112 +679,239 @@ class BinanceFuturesTrader:
         self.cancel_associated_orders(symbol)
         return True  # 平仓后可以开仓
 
-    def run_strategy(self):
-        """运行交易策略"""
-        print("自动交易系统启动...")
-        print(f"账户余额: {self.get_account_balance()} USDT")
-
-        while True:
-            now = datetime.now()
+    def _symbol_lock(self, symbol):
+        """获取交易对的下单锁，保证同一交易对的下单操作串行执行"""
+        with self._symbol_locks_guard:
+            lock = self.symbol_locks.get(symbol)
+            if lock is None:
+                lock = Lock()
+                self.symbol_locks[symbol] = lock
+            return lock
 
+    def _run_parallel(self, func, symbols, timeout=None):
+        """
+        在线程池中并行执行func(symbol)
+        :param timeout: 等待时间(秒)，超时未完成的任务不包含在结果中
+        :return: {symbol: 返回值}
+        """
+        futures = {self.executor.submit(func, symbol): symbol for symbol in symbols}
+        done, not_done = wait(futures, timeout=timeout)
+        for future in not_done:
+            future.cancel()
+        if not_done:
+            logger.warning(f"{len(not_done)}个交易对未在{timeout}秒内完成，本轮跳过",
+                           symbols=','.join(futures[f] for f in not_done))
+
+        results = {}
+        for future in done:
+            symbol = futures[future]
             try:
-                # 每小时第57分钟检查订单执行情况
-                if now.minute == 57 and now.second == 0:
-                    print(f"\n57分检查订单执行情况: {now}")
-                    self.check_order_execution()
-                    time.sleep(1)  # 避免1秒内重复执行
-                    continue
+                results[symbol] = future.result()
+            except Exception as e:
+                logger.error(f"处理时出错: {e}", symbol=symbol)
+        return results
+
+    def _update_position_stop_loss(self, pos):
+        """检查单个持仓是否需要更新止损"""
+        symbol = pos['symbol']
+        entry_price = float(pos['entryPrice'])
+        position_side = 'long' if float(pos['positionAmt']) > 0 else 'short'
+        side = SIDE_BUY if position_side == 'long' else SIDE_SELL
+        with self._symbol_lock(symbol):
+            return self.update_stop_loss(symbol, side, entry_price)
+
+    @staticmethod
+    def _order_fill(order, kline):
+        """
+        从下单响应中取成交均价和成交数量
+        :return: (成交均价, 成交数量)，响应中没有成交信息时分别为K线收盘价和None
+        """
+        avg_price = float(order.get('avgPrice') or 0)
+        executed_qty = float(order.get('executedQty') or 0)
+        return avg_price or kline['close'], executed_qty or None
+
+    def _act_on_signal(self, symbol, kline):
+        """根据开仓信号执行开仓（同一交易对的下单串行执行）"""
+        with self._symbol_lock(symbol):
+            if kline['long_signal']:
+                logger.info("触发开多信号", symbol=symbol, close=kline['close'])
+                if self.handle_existing_position(symbol, 'long'):
+                    quantity = self.calculate_quantity(symbol, self.long_amount, self.long_leverage,
+                                                       price=kline['close'])
+                    if quantity:
+                        order = self.place_order(symbol, SIDE_BUY, quantity, is_long=True)
+                        if order:
+                            # 开仓价格和数量取自下单响应
+                            entry_price, filled = self._order_fill(order, kline)
+                            # 设置止损
+                            self.set_stop_loss(symbol, SIDE_BUY, entry_price, kline, quantity=filled)
+
+            elif kline['short_signal']:
+                logger.info("触发开空信号", symbol=symbol, close=kline['close'])
+                if self.handle_existing_position(symbol, 'short'):
+                    quantity = self.calculate_quantity(symbol, self.short_amount, self.short_leverage,
+                                                       price=kline['close'])
+                    if quantity:
+                        order = self.place_order(symbol, SIDE_SELL, quantity, is_long=False)
+                        if order:
+                            # 开仓价格和数量取自下单响应
+                            entry_price, filled = self._order_fill(order, kline)
+                            # 设置止损
+                            self.set_stop_loss(symbol, SIDE_SELL, entry_price, kline, quantity=filled)
+
+    def _scan_symbols(self, positions):
+        """本轮监控的交易对：前K标的 + 当前持仓标的（去重）"""
+        top_symbols = list(self.symbols)
+        return top_symbols, list(set(top_symbols + [pos['symbol'] for pos in positions]))
+
+    def prewarm(self):
+        """
+        第59分钟前预加载：交易规则、持仓、账户余额、杠杆和所有候选交易对的K线历史，
+        决策时只需补充最新一根K线并计算信号
+        """
+        start = time.time()
+        # 为并行请求准备好已握手的连接（替代客户端不使用共享连接池）
+        if isinstance(self.client, PooledSessionMixin):
+            http_pool.prewarm(connections=SCAN_WORKERS)
+        try:
+            if self.exchange_info.is_stale():
+                self.exchange_info.refresh()
+        except Exception as e:
+            logger.error(f"预加载交易所信息失败: {e}")
+        try:
+            if not self.stream_live():
+                self.positions.refresh()
+        except Exception as e:
+            logger.error(f"预加载持仓失败: {e}")
+        self.account_balance = self.get_account_balance()
+        self.load_leverage_state()
+
+        _, symbols = self._scan_symbols(self.get_positions())
+        if self.kline_archive:
+            new_symbols = [symbol for symbol in symbols if self.kline_store.size(symbol) == 0]
+            self.kline_archive.seed_store(self.kline_store, new_symbols)
+        loaded = self._run_parallel(lambda symbol: self.kline_store.update(symbol, max_age=self.kline_max_age),
+                                    symbols, timeout=self.scan_fetch_timeout)
+        logger.info("预加载完成", klines=f"{sum(1 for ok in loaded.values() if ok)}/{len(symbols)}",
+                    balance=self.account_balance, seconds=round(time.time() - start, 2))
+
+    def run_hourly_scan(self):
+        """
+        每小时第59分钟执行交易策略和移动止损检查：数据请求并行，同一交易对的下单串行
+        历史K线、交易规则和杠杆已在预加载阶段准备好，这里只补充最新K线
+        """
+        logger.info(f"执行策略检查: {datetime.now()}")
+        scan_start = time.time()
+        current_positions, top_symbols, signals = self.scan_signals()
+        self.update_stops(current_positions)
+        self.act_on_signals(top_symbols, signals)
+        logger.info(f"策略检查完成，共耗时{time.time() - scan_start:.2f}秒")
+
+    def scan_signals(self):
+        """
+        读取持仓，并行增量更新K线，一次性计算所有交易对的开仓信号
+        :return: (当前持仓, 本轮前K标的, {symbol: 最新K线和信号})
+        """
+        scan_start = time.time()
+        try:
+            # 本轮只请求一次全账户持仓（用户数据流可用时无需请求），之后按交易对的查询都从快照读取
+            if not self.stream_live():
+                self.positions.refresh()
+            current_positions = self.get_positions()
+            logger.info(f"当前持仓: {len(current_positions)}个",
+                        positions=','.join(f"{pos['symbol']}:{pos['positionAmt']}" for pos in current_positions))
+        except Exception as e:
+            logger.error(f"获取持仓失败: {e}")
+            current_positions = []
 
-                # 每小时第58分钟更新交易量前28的标的
-                if now.minute == 58 and now.second == 0:
-                    try:
-                        self.update_symbols()
-                    except Exception as e:
-                        print(f"更新交易对列表失败: {e}")
-                    time.sleep(1)
-                    continue
+        # 本轮使用的前K标的快照（self.symbols可能被行情流回调随时更新）和监控列表
+        top_symbols, symbols_to_check = self._scan_symbols(current_positions)
 
-                # 每小时第59分钟执行交易策略和移动止损检查
-                if now.minute == 59 and now.second == 0:
-                    print(f"\n执行策略检查: {now}")
-                    try:
-                        current_positions = self.get_positions()
-                        print(f"当前持仓: {current_positions}")
-
-                        # 检查所有持仓，如果仓位为0但仍有订单，则撤销
-                        for symbol in set(pos['symbol'] for pos in current_positions):
-                            position = self.get_position(symbol)
-                            if position and float(position['positionAmt']) == 0:
-                                self.cancel_associated_orders(symbol)
-                                print(f"{symbol} 仓位已平，已撤销关联订单")
-
-                        # 检查所有持仓是否需要更新止损
-                        for pos in current_positions:
-                            symbol = pos['symbol']
-                            entry_price = float(pos['entryPrice'])
-                            position_side = 'long' if float(pos['positionAmt']) > 0 else 'short'
-                            side = SIDE_BUY if position_side == 'long' else SIDE_SELL
-                            self.update_stop_loss(symbol, side, entry_price)
-
-                    except Exception as e:
-                        print(f"获取持仓失败: {e}")
-                        current_positions = []
-
-                    # 合并监控列表：前28标的 + 当前持仓标的（去重）
-                    symbols_to_check = list(set(self.symbols + [pos['symbol'] for pos in current_positions]))
-
-                    for symbol in symbols_to_check:
-                        try:
-                            print(f"\n分析交易对: {symbol}")
-                            kline = self.get_klines_data(symbol)
-                            if kline is None:
-                                continue
-
-                            # 检查开仓信号（仅对前28标的执行）
-                            if symbol in self.symbols:
-                                if self.check_open_long_signal(kline):
-                                    print(f"{symbol} 触发开多信号")
-                                    if self.handle_existing_position(symbol, 'long'):
-                                        quantity = self.calculate_quantity(symbol, self.long_amount, self.long_leverage)
-                                        if quantity:
-                                            order = self.place_order(symbol, SIDE_BUY, quantity, is_long=True)
-                                            if order:
-                                                # 获取开仓价格
-                                                ticker = self.safe_request(self.client.futures_symbol_ticker,
-                                                                           symbol=symbol)
-                                                entry_price = float(ticker['price'])
-                                                # 设置止损
-                                                self.set_stop_loss(symbol, SIDE_BUY, entry_price, kline)
-
-                                elif self.check_open_short_signal(kline):
-                                    print(f"{symbol} 触发开空信号")
-                                    if self.handle_existing_position(symbol, 'short'):
-                                        quantity = self.calculate_quantity(symbol, self.short_amount,
-                                                                           self.short_leverage)
-                                        if quantity:
-                                            order = self.place_order(symbol, SIDE_SELL, quantity, is_long=False)
-                                            if order:
-                                                # 获取开仓价格
-                                                ticker = self.safe_request(self.client.futures_symbol_ticker,
-                                                                           symbol=symbol)
-                                                entry_price = float(ticker['price'])
-                                                # 设置止损
-                                                self.set_stop_loss(symbol, SIDE_SELL, entry_price, kline)
-
-                        except Exception as e:
-                            print(f"处理{symbol}时出错: {e}")
-
-                    time.sleep(1)
-                else:
-                    time.sleep(1)
+        # 并行增量更新K线，超时未完成的交易对本轮不参与信号计算
+        updated = self._run_parallel(lambda symbol: self.kline_store.update(symbol, max_age=self.kline_max_age),
+                                     symbols_to_check, timeout=self.scan_fetch_timeout)
+        ready_symbols = [symbol for symbol in symbols_to_check if updated.get(symbol)]
+
+        # 一次性计算所有交易对的均线和开仓信号
+        signals = self.signal_engine.evaluate(ready_symbols)
+        logger.info(f"已分析{len(signals)}/{len(symbols_to_check)}个交易对，"
+                    f"数据耗时{time.time() - scan_start:.2f}秒")
+        return current_positions, top_symbols, signals
+
+    def update_stops(self, current_positions):
+        """撤销已平仓交易对的关联订单，并行检查所有持仓是否需要更新止损（K线已在scan_signals中更新）"""
+        try:
+            # 检查有关联订单的交易对，如果仓位为0但仍有订单，则撤销
+            for symbol in list(self.order_relations):
+                position = self.get_position(symbol)
+                if not position or float(position['positionAmt']) == 0:
+                    self.cancel_associated_orders(symbol)
+                    logger.info("仓位已平，已撤销关联订单", symbol=symbol)
+
+            positions_by_symbol = {pos['symbol']: pos for pos in current_positions}
+            self._run_parallel(lambda symbol: self._update_position_stop_loss(positions_by_symbol[symbol]),
+                               list(positions_by_symbol))
+        except Exception as e:
+            logger.error(f"更新止损失败: {e}")
+
+    def act_on_signals(self, top_symbols, signals):
+        """检查开仓信号（仅对前K标的执行），不同交易对并行下单"""
+        signal_symbols = [symbol for symbol in top_symbols
+                          if symbol in signals
+                          and (signals[symbol]['long_signal'] or signals[symbol]['short_signal'])]
+        self._run_parallel(lambda symbol: self._act_on_signal(symbol, signals[symbol]), signal_symbols)
+
+    def run_strategy(self):
+        """运行交易策略"""
+        logger.info("自动交易系统启动...")
+        logger.info(f"账户余额: {self.get_account_balance()} USDT")
+
+        # 按同步后的服务器时间调度，慢的任务不会导致后面的任务被跳过
+        self.scheduler = Scheduler(now_func=time_sync_manager.get_synced_time)
+        # 每小时第57分钟检查订单执行情况
+        self.scheduler.add_job('检查订单执行情况', self.check_order_execution, minute=57)
+        # 每小时第58分钟更新交易量前28的标的
+        self.scheduler.add_job('更新交易对列表', self.update_symbols, minute=58)
+        # 第59分钟前预加载决策所需数据，晚于第59分钟时跳过
+        lead = self.prewarm_lead_seconds
+        self.scheduler.add_job('预加载数据', self.prewarm, minute=58, second=60 - lead, max_lateness=lead)
+        # 每小时第59分钟执行交易策略和移动止损检查，K线收盘后才执行的信号没有意义，延迟超过55秒时跳过
+        self.scheduler.add_job('交易策略和移动止损检查', self.run_hourly_scan, minute=59, max_lateness=55)
+
+        self.running = True
+        while self.running:
+            try:
+                self.scheduler.run_forever()
             except Exception as e:
-                print(f"主循环发生错误: {e}")
+                logger.error(f"主循环发生错误: {e}")
                 time.sleep(10)  # 发生错误时等待10秒再继续
 
+    def stop(self):
+        """停止调度并关闭推送、后台刷新和线程池"""
+        self.running = False
+        if self.scheduler:
+            self.scheduler.stop()
+        self.exchange_info.stop()
+        if self.user_stream:
+            self.user_stream.stop()
+        if self.socket_manager:
+            self.socket_manager.stop()
+        self.executor.shutdown(wait=False)
+        logger.info("自动交易系统已停止")
+
 
 if __name__ == "__main__":
     from config import API_KEY,API_SECRET
 
+    # 日志级别、日志文件和按交易对采样
+    log_pipeline.setup(level=LOG_LEVEL, log_file=LOG_FILE, sample_interval=LOG_SAMPLE_INTERVAL)
+    # 启动指标端点和/或JSON快照
+    metrics.registry.start(
+        port=METRICS_PORT,
+        json_path=os.path.join(METRICS_JSON_DIR, 'trader_metrics.json') if METRICS_JSON_DIR else None,
+        json_interval=METRICS_JSON_INTERVAL
+    )
+
     trader = BinanceFuturesTrader(API_KEY, API_SECRET)
 
     trader.run_strategy()
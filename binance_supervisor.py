@@ -0,0 +1,99 @@
+import os
+import time
+from threading import Thread
+# 导入交易器和止盈监控器
+from binance_main import BinanceFuturesTrader
+from binance_take_profit import TakeProfitMonitor
+# 导入运行指标
+import metrics
+# 导入异步日志管道
+import log_pipeline
+# 导入配置参数
+from config import TAKE_PROFIT_MODE
+from config import METRICS_PORT, METRICS_JSON_DIR, METRICS_JSON_INTERVAL
+from config import LOG_LEVEL, LOG_FILE, LOG_SAMPLE_INTERVAL
+
+logger = log_pipeline.get_logger('BinanceSupervisor', '主控')
+
+
+class BinanceSupervisor:
+    """
+    在一个进程中运行交易器和止盈监控器：
+    共用时间同步、连接池、限频器、交易所信息、行情、持仓快照、用户数据流和交易对锁，
+    止盈和交易器的开平仓、止损更新在同一交易对上串行执行
+    """
+
+    def __init__(self, api_key, api_secret, check_interval=300, profit_threshold=1.3, mode=TAKE_PROFIT_MODE,
+                 client=None, socket_manager=None, rate_governor=None, restart_delay=10):
+        """
+        :param api_key: Binance API Key
+        :param api_secret: Binance API Secret
+        :param check_interval: 止盈检查间隔（秒）
+        :param profit_threshold: 止盈阈值倍数
+        :param mode: 止盈模式，'stream' 或 'poll'
+        :param client: 替代的REST客户端（如exchange_simulator.SimulatedClient）
+        :param socket_manager: 替代的推送管理器（如SimulatedSocketManager）
+        :param rate_governor: 替代的限频器
+        :param restart_delay: 止盈监控器意外退出后重新启动前的等待时间(秒)
+        """
+        self.trader = BinanceFuturesTrader(api_key, api_secret, client=client, socket_manager=socket_manager,
+                                           rate_governor=rate_governor)
+        self.monitor = TakeProfitMonitor(api_key, api_secret, check_interval=check_interval,
+                                         profit_threshold=profit_threshold, mode=mode, trader=self.trader)
+        self.restart_delay = restart_delay
+        self.running = False
+        self.monitor_thread = None
+
+        # 共用一个用户数据流，持仓归零时交易器撤销关联订单，监控器清理止盈记录
+        if self.trader.user_stream:
+            self.trader.user_stream.on_position_closed = self._on_position_closed
+
+    def _on_position_closed(self, symbol):
+        self.trader._on_position_closed(symbol)
+        self.monitor._on_position_closed(symbol)
+
+    def _run_monitor(self):
+        """止盈监控器线程：意外退出时等待后重新启动"""
+        while self.running:
+            self.monitor.start()
+            if self.running:
+                logger.warning(f"止盈监控器已退出，{self.restart_delay}秒后重新启动")
+                time.sleep(self.restart_delay)
+
+    def start(self):
+        """在后台线程运行止盈监控器，在当前线程运行交易策略（阻塞直到停止）"""
+        self.running = True
+        self.monitor_thread = Thread(target=self._run_monitor, name='take-profit', daemon=True)
+        self.monitor_thread.start()
+        try:
+            self.trader.run_strategy()
+        except KeyboardInterrupt:
+            logger.info("程序被用户中断")
+        finally:
+            self.stop()
+
+    def stop(self):
+        """先停止止盈监控器，再停止交易器（共用的推送由交易器关闭）"""
+        if not self.running:
+            return
+        self.running = False
+        self.monitor.stop()
+        if self.monitor_thread:
+            self.monitor_thread.join(timeout=5)
+        self.trader.stop()
+
+
+if __name__ == "__main__":
+    from config import API_KEY, API_SECRET
+
+    # 日志级别、日志文件和按交易对采样
+    log_pipeline.setup(level=LOG_LEVEL, log_file=LOG_FILE, sample_interval=LOG_SAMPLE_INTERVAL)
+    # 启动指标端点和/或JSON快照（同一进程只需一个端点）
+    metrics.registry.start(
+        port=METRICS_PORT,
+        json_path=os.path.join(METRICS_JSON_DIR, 'supervisor_metrics.json') if METRICS_JSON_DIR else None,
+        json_interval=METRICS_JSON_INTERVAL
+    )
+
+    supervisor = BinanceSupervisor(API_KEY, API_SECRET)
+    supervisor.start()
@@ -1,11 +1,13 @@
+import os
 import time
-import logging
+from threading import Thread, Lock
+from binance import ThreadedWebsocketManager
 from binance.client import Client
 from binance.enums import SIDE_BUY, SIDE_SELL, FUTURE_ORDER_TYPE_MARKET
 
 # 导入时间同步管理器
 try:
-    from time_sync_config import time_sync_manager
+    from time_sync_config import time_sync_manager, SyncedTimestampMixin
 except ImportError:
     print("警告: 无法导入time_sync_config，请确保该模块存在")
     # 创建一个简单的替代时间同步管理器类
@@ -14,6 +16,29 @@ except ImportError:
             return int(time.time() * 1000)
     time_sync_manager = DummyTimeSyncManager()
 
+    class SyncedTimestampMixin:
+        pass
+
+# 导入共享连接池
+from http_pool import PooledSessionMixin
+# 导入交易所信息缓存
+from exchange_info_cache import ExchangeInfoCache
+# 导入共用的策略规则
+import strategy_rules as rules
+# 导入持仓快照
+from position_book import PositionSnapshot
+# 导入用户数据流
+from user_data_stream import UserDataStream, OrderBook
+# 导入标记价格推送
+from mark_price_stream import MarkPriceFeed
+# 导入请求限频器和请求执行器
+from rate_governor import RateGovernor
+from request_executor import RequestExecutor
+# 导入运行指标
+import metrics
+# 导入异步日志管道
+import log_pipeline
+
 # 从配置文件导入API密钥
 try:
     from config import API_KEY, API_SECRET
@@ -23,79 +48,195 @@ except ImportError:
     API_KEY = ''
     API_SECRET = ''
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-logger = logging.getLogger('BinanceTakeProfitMonitor')
+# 从配置文件导入止盈模式
+try:
+    from config import TAKE_PROFIT_MODE
+except ImportError:
+    TAKE_PROFIT_MODE = 'poll'
+
+# 从配置文件导入指标设置
+try:
+    from config import TAKE_PROFIT_METRICS_PORT, METRICS_JSON_DIR, METRICS_JSON_INTERVAL
+except ImportError:
+    TAKE_PROFIT_METRICS_PORT = None
+    METRICS_JSON_DIR = None
+    METRICS_JSON_INTERVAL = 60
+
+# 从配置文件导入日志设置
+try:
+    from config import LOG_LEVEL, TAKE_PROFIT_LOG_FILE, LOG_SAMPLE_INTERVAL
+except ImportError:
+    LOG_LEVEL = 'INFO'
+    TAKE_PROFIT_LOG_FILE = None
+    LOG_SAMPLE_INTERVAL = 60
+
+# 从配置文件导入限频设置
+try:
+    from config import RATE_LIMIT_WEIGHT_PER_MINUTE, RATE_LIMIT_SAFETY_RATIO, RATE_LIMIT_STATE_FILE
+except ImportError:
+    RATE_LIMIT_WEIGHT_PER_MINUTE = 2400
+    RATE_LIMIT_SAFETY_RATIO = 0.9
+    RATE_LIMIT_STATE_FILE = None
+try:
+    from config import RATE_LIMIT_SYNC_INTERVAL
+except ImportError:
+    RATE_LIMIT_SYNC_INTERVAL = 1
+
+# 从配置文件导入用户数据流设置
+try:
+    from config import USER_STREAM_MAX_SILENCE
+except ImportError:
+    USER_STREAM_MAX_SILENCE = 120
+
+# 从配置文件导入请求重试设置
+try:
+    from config import REQUEST_MAX_RETRIES, REQUEST_DEADLINE
+except ImportError:
+    REQUEST_MAX_RETRIES = 3
+    REQUEST_DEADLINE = 30
 
-class TimeSyncedBinanceClient(Client):
-    """支持时间同步的Binance客户端"""
-    def _get_timestamp(self):
-        # 使用时间同步管理器提供的同步后时间戳
-        return time_sync_manager.get_synced_timestamp()
+# 配置日志（经过队列异步输出，控制台写入不阻塞止盈下单）
+logger = log_pipeline.get_logger('BinanceTakeProfitMonitor', '止盈')
+
+class TimeSyncedBinanceClient(SyncedTimestampMixin, PooledSessionMixin, Client):
+    """支持时间同步的Binance客户端（签名时间戳使用时间同步管理器提供的偏移量，会话使用共享连接池）"""
 
 class TakeProfitMonitor:
     """币安U本位合约主动止盈监控器"""
-    def __init__(self, api_key, api_secret, check_interval=60, profit_threshold=1.3):
+    def __init__(self, api_key, api_secret, check_interval=60, profit_threshold=1.3, use_streams=True,
+                 mode='poll', client=None, socket_manager=None, rate_governor=None, trader=None):
         """
         初始化止盈监控器
         :param api_key: Binance API Key
         :param api_secret: Binance API Secret
         :param check_interval: 检查间隔（秒）
         :param profit_threshold: 止盈阈值倍数（默认1.35倍）
+        :param use_streams: 是否使用用户数据流维护持仓（关闭时每次检查请求持仓）
+        :param mode: 'poll' 按check_interval定时检查；'stream' 订阅持仓交易对的markPrice@1s，每次推送都检查
+        :param client: 替代的REST客户端（如exchange_simulator.SimulatedClient），None时连接币安
+        :param socket_manager: 替代的推送管理器（如SimulatedSocketManager），None时创建ThreadedWebsocketManager
+        :param rate_governor: 替代的限频器，None时按配置创建
+        :param trader: 同一进程中的BinanceFuturesTrader（见binance_supervisor），提供时共用它的客户端、限频器、
+                       交易所信息、持仓快照、用户数据流、行情和交易对锁，不再单独请求和订阅
         """
-        # 使用支持时间同步的客户端
-        self.client = TimeSyncedBinanceClient(api_key, api_secret)
+        self.trader = trader
         self.check_interval = check_interval
         self.profit_threshold = profit_threshold
-        
+        self.symbol_locks = {}  # 格式: {symbol: Lock}，与交易器同进程时使用交易器的锁
+        self._symbol_locks_guard = Lock()
+
         # 用于跟踪已执行止盈的币种，防止重复执行
         self.take_profit_executed = set()
         
+        # 标记价格推送：推送模式下每秒收到持仓交易对的标记价格
+        self.price_feed = None
+        self.pending_take_profit = set()  # 正在执行止盈的交易对
+        
         # 运行状态
         self.running = False
-    
-    def safe_request(self, request_func, *args, **kwargs):
-        """带重试机制的请求包装函数"""
-        max_retries = 3
-        retry_delay = 1
-        last_exception = None
         
-        for attempt in range(max_retries):
+        if trader is not None:
+            self._share_trader(trader, mode)
+            return
+        
+        # 使用支持时间同步的客户端
+        self.client = client or TimeSyncedBinanceClient(api_key, api_secret)
+
+        # 请求限频：与交易器共享同一个状态文件，两个进程合计不超过权重上限
+        self.rate_governor = rate_governor or RateGovernor(
+            weight_limit=RATE_LIMIT_WEIGHT_PER_MINUTE,
+            safety_ratio=RATE_LIMIT_SAFETY_RATIO,
+            state_file=RATE_LIMIT_STATE_FILE,
+            sync_interval=RATE_LIMIT_SYNC_INTERVAL
+        )
+        self.rate_governor.install(self.client)
+        self.request_executor = RequestExecutor(
+            rate_governor=self.rate_governor,
+            time_sync=time_sync_manager,
+            max_retries=REQUEST_MAX_RETRIES,
+            deadline=REQUEST_DEADLINE
+        )
+        
+        # 交易所信息缓存：按交易对索引LOT_SIZE等规则，后台定时刷新
+        self.exchange_info = ExchangeInfoCache(
+            lambda: self.safe_request(self.client.futures_exchange_info)
+        )
+        self.exchange_info.start()
+
+        # 持仓快照：每次检查请求一次全账户持仓，止盈下单后失效
+        self.positions = PositionSnapshot(
+            lambda: self.safe_request(self.client.futures_position_information)
+        )
+        
+        # 用户数据流：推送维护持仓快照，持仓归零时立即清理止盈记录
+        self.socket_manager = None
+        self.user_stream = None
+        if use_streams:
             try:
-                # 使用同步后的时间戳进行请求
-                timestamp = time_sync_manager.get_synced_timestamp()
-                if 'timestamp' not in kwargs:
-                    kwargs['timestamp'] = timestamp
-                
-                return request_func(*args, **kwargs)
+                self.socket_manager = socket_manager or ThreadedWebsocketManager(api_key, api_secret)
+                self.socket_manager.start()
+                self.user_stream = UserDataStream(
+                    self.socket_manager,
+                    lambda: self.safe_request(self.client.futures_get_open_orders),
+                    self.positions,
+                    OrderBook(),
+                    on_position_closed=self._on_position_closed,
+                    max_silence=USER_STREAM_MAX_SILENCE
+                )
+                self.user_stream.start()
             except Exception as e:
-                # 处理时间同步错误(1021错误码)
-                if hasattr(e, 'code') and e.code == 1021:
-                    logger.info("时间戳同步成功")
-                    if hasattr(time_sync_manager, 'sync_time'):
-                        time_sync_manager.sync_time()
-                    time.sleep(retry_delay)
-                    continue
-                
-                last_exception = e
-                logger.warning(f"请求失败 (尝试 {attempt + 1}/{max_retries}): {str(e)}")
-                time.sleep(retry_delay)
+                logger.error(f"启动用户数据流失败，改用REST轮询: {e}")
         
-        logger.error(f"请求失败，已达到最大重试次数: {str(last_exception)}")
-        raise last_exception if last_exception else Exception("未知请求错误")
+        if mode == 'stream' and self.socket_manager:
+            self.price_feed = MarkPriceFeed(self.socket_manager, on_tick=self._on_mark_price)
+    
+    def _share_trader(self, trader, mode):
+        """与同一进程中的交易器共用连接、缓存和推送（这些资源由交易器启动和停止）"""
+        self.client = trader.client
+        self.rate_governor = trader.rate_governor
+        self.request_executor = trader.request_executor
+        self.exchange_info = trader.exchange_info
+        self.positions = trader.positions
+        self.socket_manager = trader.socket_manager
+        self.user_stream = trader.user_stream
+        if mode == 'stream' and self.socket_manager:
+            self.price_feed = MarkPriceFeed(self.socket_manager, on_tick=self._on_mark_price)
+    
+    def _symbol_lock(self, symbol):
+        """获取交易对的下单锁；与交易器同进程时和交易器的开平仓、止损更新共用同一把锁"""
+        if self.trader is not None:
+            return self.trader._symbol_lock(symbol)
+        with self._symbol_locks_guard:
+            lock = self.symbol_locks.get(symbol)
+            if lock is None:
+                lock = Lock()
+                self.symbol_locks[symbol] = lock
+            return lock
+    
+    def safe_request(self, request_func, *args, **kwargs):
+        """通过统一的请求执行器发送请求（签名时间戳由客户端的时间同步提供）"""
+        return self.request_executor.execute(request_func, *args, **kwargs)
+    
+    def stream_live(self):
+        """用户数据流是否可用（不可用时退回REST轮询）"""
+        return self.user_stream is not None and self.user_stream.is_live()
+    
+    def _on_position_closed(self, symbol):
+        """用户数据流推送持仓归零，从已执行止盈列表中移除"""
+        if symbol in self.take_profit_executed:
+            logger.info(f"{symbol} 已完全平仓，从已执行止盈列表中移除")
+            self.take_profit_executed.discard(symbol)
     
     def get_positions(self):
         """使用同步后的时间戳获取持仓信息"""
         try:
             # 注释掉不需要显示的日志
             # logger.info(f"使用同步时间戳 {time_sync_manager.get_synced_timestamp()} 获取持仓信息")
-            positions = self.safe_request(self.client.futures_position_information)
+            # 用户数据流可用时持仓快照已是最新，无需请求
+            if not self.stream_live():
+                self.positions.refresh()
             # 只返回有持仓的交易对
-            return [pos for pos in positions if float(pos['positionAmt']) != 0]
+            return self.positions.open_positions()
         except Exception as e:
             logger.error(f"获取持仓失败: {e}")
             return []
@@ -109,36 +250,66 @@ class TakeProfitMonitor:
             logger.error(f"获取{symbol}当前价格失败: {e}")
             return None
     
-    def take_profit_half_position(self, symbol, position):
-        """市价平仓一半仓位"""
+    def get_all_prices(self, symbols=()):
+        """
+        一次请求获取全部交易对的最新价格，格式: {symbol: price}
+        :param symbols: 需要价格的交易对；与交易器同进程且行情流正常时，推送价格已覆盖这些交易对则不再请求
+        """
+        if self.trader is not None and self.trader.universe.is_live():
+            prices = self.trader.universe.last_prices()
+            if all(symbol in prices for symbol in symbols):
+                return prices
+        try:
+            tickers = self.safe_request(self.client.futures_symbol_ticker)
+            return {ticker['symbol']: float(ticker['price']) for ticker in tickers}
+        except Exception as e:
+            logger.error(f"批量获取价格失败: {e}")
+            return {}
+    
+    def take_profit_half_position(self, symbol, position, current_price=None):
+        """市价平仓一半仓位（持有交易对锁，与同一交易对的其他下单串行执行）"""
+        with self._symbol_lock(symbol):
+            return self._take_profit_half_position(symbol, position, current_price)
+    
+    def _take_profit_half_position(self, symbol, position, current_price):
         try:
+            # 等锁期间持仓可能已被止损平掉或被交易器反手，按最新持仓重新确认
+            latest = self.positions.get(symbol)
+            if not latest or float(latest['positionAmt']) * float(position['positionAmt']) <= 0:
+                logger.info("持仓已变化，取消止盈", symbol=symbol)
+                return False
+            position = latest
             position_amt = float(position['positionAmt'])
             entry_price = float(position['entryPrice'])
-            current_price = self.get_current_price(symbol)
+            if current_price is None:
+                current_price = self.get_current_price(symbol)
             
             if current_price is None:
                 logger.error(f"无法获取{symbol}当前价格，取消止盈操作")
                 return False
             
+            if rules.price_ratio(position_amt, entry_price, current_price) < self.profit_threshold:
+                logger.info("持仓已变化，未达到止盈条件", symbol=symbol, entry_price=entry_price, price=current_price)
+                return False
+            
             # 计算一半仓位
             half_quantity = abs(position_amt) / 2  # 对于空单，position_amt是负数，abs取绝对值
             
-            # 获取交易对的 LOT_SIZE 规则，确保数量符合规则
-            exchange_info = self.safe_request(self.client.futures_exchange_info)
-            symbol_info = next((s for s in exchange_info['symbols'] if s['symbol'] == symbol), None)
+            # 从缓存获取交易对的 LOT_SIZE 规则，确保数量符合规则
+            symbol_info = self.exchange_info.get_symbol_info(symbol)
             
             if not symbol_info:
                 logger.error(f"{symbol} 交易对信息获取失败")
                 return False
             
             # 调整数量到符合交易规则
-            lot_size_filter = next((f for f in symbol_info['filters'] if f['filterType'] == 'LOT_SIZE'), None)
+            lot_size_filter = symbol_info['lot_size']
             if lot_size_filter:
-                step_size = float(lot_size_filter['stepSize'])
-                min_qty = float(lot_size_filter['minQty'])
+                step_size = lot_size_filter['stepSize']
+                min_qty = lot_size_filter['minQty']
                 
                 # 计算符合 stepSize 的数量
-                half_quantity = round(half_quantity / step_size) * step_size
+                half_quantity = rules.round_step(half_quantity, step_size)
                 
                 # 确保不小于 minQty
                 if half_quantity < min_qty:
@@ -157,28 +328,32 @@ class TakeProfitMonitor:
                 quantity=half_quantity,
                 reduceOnly=True  # 确保是减仓操作
             )
+            # 持仓已变化，下次读取时重新请求
+            self.positions.invalidate()
             
             # 计算盈利百分比 - 考虑多单和空单的不同计算方式
-            if position_amt > 0:  # 多单
-                profit_percent = ((current_price - entry_price) / entry_price) * 100
-            else:  # 空单
-                profit_percent = ((entry_price - current_price) / entry_price) * 100
+            profit_percent = rules.profit_percent(position_amt, entry_price, current_price)
             
-            logger.info(f"止盈成功: {symbol} 平掉一半仓位 ({half_quantity}), "
-                        f"开仓价: {entry_price}, 当前价: {current_price}, "
-                        f"盈利: {profit_percent:.2f}%, 订单ID: {order['orderId']}")
+            logger.info("止盈成功: 平掉一半仓位", symbol=symbol, quantity=half_quantity, entry_price=entry_price,
+                        price=current_price, profit=f"{profit_percent:.2f}%", orderId=order['orderId'])
             
             # 记录该币种已执行止盈
             self.take_profit_executed.add(symbol)
+            metrics.TAKE_PROFIT_ORDERS.inc(result='ok')
             
             return True
         except Exception as e:
             logger.error(f"{symbol} 止盈操作失败: {e}")
+            metrics.TAKE_PROFIT_ORDERS.inc(result='error')
             # 如果出现异常，不记录为已执行止盈，以便下次重试
             return False
     
     def check_and_execute_take_profit(self):
         """检查所有持仓是否达到止盈条件并执行止盈操作"""
+        with metrics.TAKE_PROFIT_CYCLE.time():
+            self._check_and_execute_take_profit()
+    
+    def _check_and_execute_take_profit(self):
         try:
             # 获取所有持仓
             positions = self.get_positions()
@@ -198,6 +373,12 @@ class TakeProfitMonitor:
                     logger.info(f"{symbol} 已完全平仓，从已执行止盈列表中移除")
                     self.take_profit_executed.remove(symbol)
             
+            # 本轮所有持仓共用一次批量价格请求
+            if current_position_symbols - self.take_profit_executed:
+                prices = self.get_all_prices(current_position_symbols - self.take_profit_executed)
+            else:
+                prices = {}
+            
             for position in positions:
                 symbol = position['symbol']
                 position_amt = float(position['positionAmt'])
@@ -205,35 +386,80 @@ class TakeProfitMonitor:
                 
                 # 跳过已执行过止盈的币种
                 if symbol in self.take_profit_executed:
-                    logger.info(f"{symbol} 已执行过止盈，跳过检查")
+                    logger.debug("已执行过止盈，跳过检查", symbol=symbol)
                     continue
                 
-                # 获取当前价格
-                current_price = self.get_current_price(symbol)
+                # 从本轮批量价格中获取当前价格
+                current_price = prices.get(symbol)
                 if current_price is None:
+                    logger.error(f"获取{symbol}当前价格失败")
                     continue
                 
                 # 计算当前价格相对于开仓价的倍数
-                price_ratio = current_price / entry_price if position_amt > 0 else entry_price / current_price
+                price_ratio = rules.price_ratio(position_amt, entry_price, current_price)
                 
-                logger.info(f"{symbol}: 开仓价={entry_price}, 当前价={current_price}, 价格倍数={price_ratio:.4f}")
+                logger.info("止盈检查", symbol=symbol, entry_price=entry_price, price=current_price,
+                            ratio=f"{price_ratio:.4f}", sample=('止盈检查', symbol))
                 
                 # 检查是否达到止盈条件
                 if price_ratio >= self.profit_threshold:
                     logger.info(f"{symbol} 达到止盈条件 (倍数: {price_ratio:.4f} ≥ {self.profit_threshold})")
-                    self.take_profit_half_position(symbol, position)
+                    self.take_profit_half_position(symbol, position, current_price)
         except Exception as e:
             logger.error(f"检查和执行止盈时发生错误: {e}")
     
+    def _on_mark_price(self, symbol, price):
+        """标记价格推送回调：达到止盈条件时在后台线程执行止盈"""
+        if symbol in self.take_profit_executed or symbol in self.pending_take_profit:
+            return
+        position = self.positions.peek(symbol)
+        if not position or float(position['positionAmt']) == 0:
+            return
+        
+        price_ratio = rules.price_ratio(float(position['positionAmt']), float(position['entryPrice']), price)
+        if price_ratio >= self.profit_threshold:
+            logger.info(f"{symbol} 达到止盈条件 (倍数: {price_ratio:.4f} ≥ {self.profit_threshold})")
+            self.pending_take_profit.add(symbol)
+            Thread(target=self._execute_take_profit, args=(symbol, position, price), daemon=True).start()
+    
+    def _execute_take_profit(self, symbol, position, price):
+        try:
+            self.take_profit_half_position(symbol, position, price)
+        finally:
+            self.pending_take_profit.discard(symbol)
+    
+    def _sync_price_subscription(self):
+        """按当前持仓更新标记价格订阅（已执行止盈的交易对不再订阅）"""
+        try:
+            held = {pos['symbol'] for pos in self.positions.open_positions()}
+        except Exception as e:
+            logger.error(f"获取持仓失败: {e}")
+            return
+        self.take_profit_executed &= held  # 清理已完全平仓的币种
+        self.price_feed.set_symbols(held - self.take_profit_executed)
+    
     def start(self):
         """启动监控器"""
         logger.info(f"启动主动止盈监控器")
-        logger.info(f"检查间隔: {self.check_interval}秒, 止盈阈值: {self.profit_threshold}倍")
+        if self.price_feed:
+            logger.info(f"推送模式: 订阅持仓交易对标记价格, 止盈阈值: {self.profit_threshold}倍")
+        else:
+            logger.info(f"检查间隔: {self.check_interval}秒, 止盈阈值: {self.profit_threshold}倍")
         
         self.running = True
         
         try:
+            last_check = 0
             while self.running:
+                if self.price_feed:
+                    # 推送模式：每秒同步一次订阅，推送失效时退回定时检查
+                    self._sync_price_subscription()
+                    if not self.price_feed.is_live() and time.time() - last_check >= self.check_interval:
+                        self.check_and_execute_take_profit()
+                        last_check = time.time()
+                    time.sleep(1)
+                    continue
+                
                 self.check_and_execute_take_profit()
                 
                 # 等待下一次检查
@@ -251,6 +477,16 @@ class TakeProfitMonitor:
     def stop(self):
         """停止监控器"""
         self.running = False
+        if self.price_feed:
+            self.price_feed.stop()
+        if self.trader is not None:
+            # 共用的推送由交易器停止
+            logger.info("币安U本位合约主动止盈监控器已停止")
+            return
+        if self.user_stream:
+            self.user_stream.stop()
+        if self.socket_manager:
+            self.socket_manager.stop()
         logger.info("币安U本位合约主动止盈监控器已停止")
 
 # 主程序入口
@@ -263,12 +499,22 @@ if __name__ == "__main__":
     # 注释掉不需要显示的信息
     # print("正在使用配置文件中的API密钥...")
     
+    # 日志级别、日志文件和按交易对采样
+    log_pipeline.setup(level=LOG_LEVEL, log_file=TAKE_PROFIT_LOG_FILE, sample_interval=LOG_SAMPLE_INTERVAL)
+    # 启动指标端点和/或JSON快照
+    metrics.registry.start(
+        port=TAKE_PROFIT_METRICS_PORT,
+        json_path=os.path.join(METRICS_JSON_DIR, 'take_profit_metrics.json') if METRICS_JSON_DIR else None,
+        json_interval=METRICS_JSON_INTERVAL
+    )
+    
     # 创建并启动监控器
     monitor = TakeProfitMonitor(
         api_key=API_KEY,
         api_secret=API_SECRET,
         check_interval=300,  # 每5分钟检查一次
-        profit_threshold=1.3  # 1.3倍止盈
+        profit_threshold=1.3,  # 1.3倍止盈
+        mode=TAKE_PROFIT_MODE  # stream: 标记价格推送触发止盈
     )
     
     try:
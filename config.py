@@ -23,3 +23,62 @@ exclude_symbols = ["BTCUSDT", "ETHUSDT", "XRPUSDT", "LINKUSDT", "SOLUSDT", "BNBU
                     "DOGEUSDT", "1000PEPEUSDT", "1000000BOBUSDT", "SUIUSDT", "WLDUSDT",
                     "TRXUSDT", "RESOLVUSDT", "FUNUSDT", "MYXUSDT", "TONUSDT", "XLMUSDT",
                      "HYPEUSDT", "FARTCOINUSDT"]  # 在这里添加要排除的交易对
+
+# 交易所信息缓存设置
+EXCHANGE_INFO_TTL = 3600  # 缓存有效期(秒)
+EXCHANGE_INFO_REFRESH_INTERVAL = 1800  # 后台刷新间隔(秒)
+
+# 交易对池设置
+TOP_SYMBOL_LIMIT = 28  # 监控交易量前K的交易对
+USE_MARKET_STREAMS = True  # 是否使用WebSocket行情流（关闭时使用定时轮询）
+
+# K线存储设置
+KLINE_CAPACITY = 100  # 每个交易对保留的1小时K线数量
+KLINE_MAX_AGE = 5  # 同一轮检查内复用已更新K线的最长时间(秒)
+USE_KLINE_ARCHIVE = True  # 是否用本地K线归档预填充K线存储
+KLINE_ARCHIVE_DIR = 'data/klines'  # 本地K线归档目录（python kline_archive.py 下载）
+
+# 并行扫描设置
+SCAN_WORKERS = 8  # 扫描线程数（1为串行）
+SCAN_FETCH_TIMEOUT = 20  # 第59分钟K线更新阶段的最长等待时间(秒)
+
+# 异步引擎设置
+ASYNC_CONCURRENCY = 32  # 异步引擎同时进行的最大请求数
+
+# 持仓快照设置
+POSITION_SNAPSHOT_MAX_AGE = 30  # 持仓快照最长使用时间(秒)，自己下单后立即失效
+
+# 用户数据流设置
+USE_USER_DATA_STREAM = True  # 是否使用用户数据流维护持仓和委托（需要USE_MARKET_STREAMS开启）
+USER_STREAM_MAX_SILENCE = 120  # 超过多少秒没有推送时用REST重新对账持仓和挂单(秒)
+
+# 止盈监控设置
+TAKE_PROFIT_MODE = 'stream'  # stream: 订阅持仓交易对markPrice@1s推送触发止盈; poll: 每5分钟检查一次
+
+# 请求限频设置（交易器和止盈监控器通过状态文件共享额度）
+RATE_LIMIT_WEIGHT_PER_MINUTE = 2400  # 每分钟请求权重上限
+RATE_LIMIT_SAFETY_RATIO = 0.9  # 只使用上限的这个比例
+RATE_LIMIT_STATE_FILE = None  # 共享状态文件路径，None时使用系统临时目录
+RATE_LIMIT_SYNC_INTERVAL = 1  # 内存中的限频状态与共享文件同步的最长间隔(秒)
+
+# 请求重试设置
+REQUEST_MAX_RETRIES = 3  # 最大尝试次数（参数错误等不可重试的错误直接失败）
+REQUEST_DEADLINE = 30  # 单次调用(包括重试)的最长时间(秒)
+
+# 预加载设置
+PREWARM_LEAD_SECONDS = 15  # 在第59分钟前多少秒预先加载K线、交易规则、杠杆和账户数据
+
+# 连接池设置
+HTTP_POOL_SIZE = 12  # 每个主机保持的连接数，应不小于SCAN_WORKERS
+
+# 指标设置
+METRICS_PORT = 9108  # 交易器的Prometheus指标端点端口（仅监听127.0.0.1），None表示不启动
+TAKE_PROFIT_METRICS_PORT = 9109  # 止盈监控器的指标端点端口，None表示不启动
+METRICS_JSON_DIR = None  # 定期写入JSON指标快照的目录，None表示不写入
+METRICS_JSON_INTERVAL = 60  # JSON指标快照的写入间隔(秒)
+
+# 日志设置（日志经过队列由后台线程写入，不阻塞交易线程）
+LOG_LEVEL = 'INFO'  # 日志级别，DEBUG时输出每个交易对的检查细节和完整下单响应
+LOG_FILE = 'logs/trader.log'  # 交易器日志文件（每天轮换），None表示只输出到控制台
+TAKE_PROFIT_LOG_FILE = 'logs/take_profit.log'  # 止盈监控器日志文件
+LOG_SAMPLE_INTERVAL = 60  # 按交易对重复输出的信息在这个间隔(秒)内只输出一次
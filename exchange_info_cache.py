@@ -0,0 +1,160 @@
+import time
+import logging
+from threading import Thread, Lock
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[交易所信息] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('ExchangeInfoCache')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+def _parse_symbol(s):
+    """把exchange_info中的单个交易对条目整理成索引记录"""
+    filters = {f['filterType']: f for f in s.get('filters', [])}
+    lot_size = filters.get('LOT_SIZE')
+    price_filter = filters.get('PRICE_FILTER')
+    return {
+        'symbol': s['symbol'],
+        'status': s.get('status'),
+        'quoteAsset': s.get('quoteAsset'),
+        'contractType': s.get('contractType'),
+        'pricePrecision': s.get('pricePrecision'),
+        'quantityPrecision': s.get('quantityPrecision'),
+        'lot_size': {
+            'stepSize': float(lot_size['stepSize']),
+            'minQty': float(lot_size['minQty']),
+            'maxQty': float(lot_size['maxQty']),
+        } if lot_size else None,
+        'price_filter': {
+            'tickSize': float(price_filter['tickSize']),
+            'minPrice': float(price_filter['minPrice']),
+            'maxPrice': float(price_filter['maxPrice']),
+        } if price_filter else None,
+        'filters': filters,
+    }
+
+
+class ExchangeInfoCache:
+    """交易所信息缓存，按交易对建立索引，带过期时间和后台刷新"""
+
+    def __init__(self, fetch_func, ttl=3600, refresh_interval=1800, retry_after=60):
+        """
+        初始化交易所信息缓存
+        :param fetch_func: 获取完整futures_exchange_info的函数
+        :param ttl: 缓存有效期(秒)，过期后下次读取时同步刷新
+        :param refresh_interval: 后台刷新间隔(秒)
+        :param retry_after: 刷新失败后多少秒内读取时不再重试，继续使用旧索引(秒)
+        """
+        self.fetch_func = fetch_func
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.index = {}  # 格式: {symbol: 索引记录}
+        self.last_refresh_time = 0  # 上次刷新时间
+        self.retry_after = retry_after
+        self.retry_time = 0  # 刷新失败后允许读取时再次刷新的时间
+        self.refresh_thread = None  # 刷新线程
+        self.running = False  # 运行状态
+        self._lock = Lock()
+
+    def start(self):
+        """立即加载一次并启动后台刷新"""
+        if self.running:
+            return
+
+        self.running = True
+        self.refresh()
+        self.refresh_thread = Thread(target=self._auto_refresh)
+        self.refresh_thread.daemon = True
+        self.refresh_thread.start()
+
+    def stop(self):
+        """停止后台刷新"""
+        self.running = False
+        if self.refresh_thread and self.refresh_thread.is_alive():
+            self.refresh_thread.join(2.0)
+
+    def _auto_refresh(self):
+        """后台定时刷新的内部方法"""
+        while self.running:
+            try:
+                time.sleep(self.refresh_interval)
+                self.refresh()
+            except Exception as e:
+                logger.error(f"后台刷新交易所信息时发生错误: {str(e)}")
+
+    def refresh(self):
+        """下载一次完整的交易所信息并重建索引，失败时保留旧索引"""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        try:
+            self.load(self.fetch_func())
+            return True
+        except Exception as e:
+            self.retry_time = time.time() + self.retry_after
+            logger.error(f"刷新交易所信息失败，{self.retry_after}秒内使用旧数据: {str(e)}")
+            return False
+
+    def load(self, exchange_info):
+        """用已获取的交易所信息重建索引（异步引擎自行请求后调用）"""
+        self.index = {s['symbol']: _parse_symbol(s) for s in exchange_info['symbols']}
+        self.last_refresh_time = time.time()
+
+    def is_stale(self):
+        """缓存是否已过期"""
+        return time.time() - self.last_refresh_time > self.ttl
+
+    def _needs_refresh(self):
+        return self.is_stale() and time.time() >= self.retry_time
+
+    def _ensure_fresh(self):
+        if self._needs_refresh():
+            with self._lock:
+                # 等锁期间其他线程可能已经刷新过（或刚刚失败）
+                if self._needs_refresh():
+                    self._refresh()
+
+    def get_symbol_info(self, symbol):
+        """获取交易对的索引记录，不存在时返回None"""
+        self._ensure_fresh()
+        return self.index.get(symbol)
+
+    def is_trading(self, symbol):
+        """交易对是否处于TRADING状态"""
+        info = self.get_symbol_info(symbol)
+        return bool(info) and info['status'] == 'TRADING'
+
+    def get_lot_size(self, symbol):
+        """获取LOT_SIZE规则: {'stepSize', 'minQty', 'maxQty'}"""
+        info = self.get_symbol_info(symbol)
+        return info['lot_size'] if info else None
+
+    def get_price_filter(self, symbol):
+        """获取PRICE_FILTER规则: {'tickSize', 'minPrice', 'maxPrice'}"""
+        info = self.get_symbol_info(symbol)
+        return info['price_filter'] if info else None
+
+    def get_price_precision(self, symbol):
+        """获取价格精度"""
+        info = self.get_symbol_info(symbol)
+        return info['pricePrecision'] if info else None
+
+    def get_quantity_precision(self, symbol):
+        """获取数量精度"""
+        info = self.get_symbol_info(symbol)
+        return info['quantityPrecision'] if info else None
+
+    def tradable_symbols(self, quote_asset='USDT', contract_type='PERPETUAL', exclude=None):
+        """返回正在交易的指定计价资产永续合约集合"""
+        self._ensure_fresh()
+        exclude = set(exclude or [])
+        return {symbol for symbol, info in self.index.items()
+                if info['quoteAsset'] == quote_asset
+                and info['contractType'] == contract_type
+                and info['status'] == 'TRADING'
+                and symbol not in exclude}
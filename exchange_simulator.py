@@ -0,0 +1,875 @@
+import json
+import math
+import time
+import zlib
+import random
+import logging
+import itertools
+import numpy as np
+from collections import Counter
+from threading import Lock, Thread, Event
+from requests.structures import CaseInsensitiveDict
+from binance.exceptions import BinanceAPIException
+from rate_governor import endpoint_weight, ORDER_ENDPOINTS, WINDOWS
+from kline_store import INTERVAL_MS
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[模拟交易所] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('ExchangeSimulator')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+HOUR_MS = INTERVAL_MS['1h']
+
+# 各接口的默认延迟(毫秒): (中位数, p99)，未列出的接口使用'default'
+DEFAULT_LATENCY = {
+    'default': (40, 150),
+    'futures_exchange_info': (120, 400),
+    'futures_ticker': (80, 300),
+    'futures_klines': (60, 250),
+    'futures_position_information': (50, 200),
+    'futures_create_order': (30, 120),
+    'futures_cancel_orders': (30, 120),
+}
+
+# 模拟的错误: 错误码 -> (HTTP状态码, 错误信息)
+ERRORS = {
+    -1003: (429, 'Too many requests; current limit of IP is 2400 requests per minute.'),
+    -1006: (502, 'An unexpected response was received from the message bus. Execution status unknown.'),
+    -1007: (503, 'Timeout waiting for response from backend server. Send status unknown; execution status unknown.'),
+    -1013: (400, 'Filter failure: LOT_SIZE'),
+    -1015: (429, 'Too many new orders.'),
+    -1021: (400, 'Timestamp for this request is outside of the recvWindow.'),
+    -1102: (400, 'A mandatory parameter was not sent, was empty/null, or malformed.'),
+    -1111: (400, 'Precision is over the maximum defined for this asset.'),
+    -1116: (400, 'Invalid orderType.'),
+    -1120: (400, 'Invalid interval.'),
+    -1121: (400, 'Invalid symbol.'),
+    -2011: (400, 'Unknown order sent.'),
+    -2013: (400, 'Order does not exist.'),
+    -2019: (400, 'Margin is insufficient.'),
+    -2021: (400, 'Order would immediately trigger.'),
+    -2022: (400, 'ReduceOnly Order is rejected.'),
+    -4003: (400, 'Quantity less than or equal to zero.'),
+    -4028: (400, 'Leverage is not valid.'),
+    -4059: (400, 'No need to change position side.'),
+    -4116: (400, 'ClientOrderId is duplicated.'),
+    -4130: (400, 'An open stop or take profit order with GTE and closePosition in the direction is existing.'),
+}
+# 请求已在撮合引擎执行但返回错误的错误码（模拟下单超时，用于检验下单确认逻辑）
+EXECUTED_ON_ERROR = {-1007}
+# 需要签名的接口（检查时间戳）
+SIGNED_ENDPOINTS = {
+    'futures_account_balance', 'futures_position_information', 'futures_symbol_config',
+    'futures_get_position_mode', 'futures_change_position_mode', 'futures_change_leverage',
+    'futures_create_order', 'futures_get_order', 'futures_get_open_orders', 'futures_cancel_orders',
+}
+
+
+class SimulatedReject(Exception):
+    """撮合引擎拒绝请求"""
+
+    def __init__(self, code):
+        super().__init__(ERRORS[code][1])
+        self.code = code
+
+
+class SimulatedResponse:
+    """模拟的HTTP响应，供限频钩子读取状态码和响应头"""
+
+    def __init__(self, status_code, headers, text=''):
+        self.status_code = status_code
+        self.status = status_code  # aiohttp风格
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+        self.request = None
+
+
+class SimulatedSession:
+    """只提供响应钩子的会话，RateGovernor.install可直接注册"""
+
+    def __init__(self):
+        self.hooks = {'response': []}
+
+
+class LatencyModel:
+    """对数正态分布的接口延迟"""
+
+    def __init__(self, median_ms, p99_ms):
+        """
+        :param median_ms: 延迟中位数(毫秒)
+        :param p99_ms: 99分位延迟(毫秒)
+        """
+        self.median_ms = median_ms
+        self.sigma = math.log(p99_ms / median_ms) / 2.326 if p99_ms > median_ms else 0.0
+
+    def sample(self, rng):
+        """采样一次延迟(秒)"""
+        return self.median_ms * math.exp(rng.gauss(0, self.sigma)) / 1000
+
+
+def _api_error(code, headers=None):
+    status, msg = ERRORS[code]
+    text = json.dumps({'code': code, 'msg': msg})
+    return BinanceAPIException(SimulatedResponse(status, headers or {}, text), status, text)
+
+
+def _flag(value):
+    return value is True or str(value).lower() == 'true'
+
+
+def _fmt(value, precision):
+    return f"{value:.{precision}f}"
+
+
+class SimulatedExchange:
+    """
+    进程内的U本位合约模拟交易所：随机游走行情和小时K线、单向持仓账户、市价单和止损单撮合、
+    按接口的延迟分布、限频响应和错误注入；相同seed和请求顺序下结果可复现
+    """
+
+    def __init__(self, symbols=100, history=200, seed=0, balance=10000.0, hourly_volatility=0.01,
+                 latency=None, latency_scale=1.0, failures=None, weight_limit=2400,
+                 order_limit_10s=300, order_limit_1m=1200, slippage=0.0002, fee_rate=0.0004,
+                 leverage=20, recv_window=5000, clock_offset_ms=0, now_func=time.time, sleep_func=time.sleep):
+        """
+        初始化模拟交易所
+        :param symbols: 交易对数量或交易对列表
+        :param history: 预先生成的已收盘小时K线数量
+        :param seed: 随机种子
+        :param balance: 初始USDT余额
+        :param hourly_volatility: 每小时对数收益率的标准差
+        :param latency: {接口名: (中位数ms, p99 ms)}，覆盖DEFAULT_LATENCY
+        :param latency_scale: 延迟缩放系数，0表示不等待
+        :param failures: 随机错误注入 {接口名或'*': {错误码: 概率}}
+        :param weight_limit: 每分钟请求权重上限
+        :param order_limit_10s: 每10秒下单数上限
+        :param order_limit_1m: 每分钟下单数上限
+        :param slippage: 市价成交滑点比例
+        :param fee_rate: 手续费率
+        :param leverage: 各交易对的初始杠杆
+        :param recv_window: 签名时间戳允许的最大延迟(毫秒)
+        :param clock_offset_ms: 服务器时钟相对本地时钟的偏移(毫秒)，用于模拟时间不同步
+        :param now_func: 本地时间函数(秒)
+        :param sleep_func: 模拟延迟使用的睡眠函数
+        """
+        self.seed = seed
+        self.hourly_volatility = hourly_volatility
+        self.latency = {name: LatencyModel(*value) for name, value in {**DEFAULT_LATENCY, **(latency or {})}.items()}
+        self.latency_scale = latency_scale
+        self.failures = failures or {}
+        self.limits = {'weight_1m': weight_limit, 'orders_10s': order_limit_10s, 'orders_1m': order_limit_1m}
+        self.slippage = slippage
+        self.fee_rate = fee_rate
+        self.recv_window = recv_window
+        self.clock_offset_ms = clock_offset_ms
+        self.now_func = now_func
+        self.sleep_func = sleep_func
+
+        self._lock = Lock()
+        self._np_rng = np.random.default_rng(seed)
+        self._rngs = {}  # 格式: {接口名: random.Random}，各接口的延迟和错误注入互不影响
+        self._injected = {}  # 格式: {接口名: [错误码]}
+        self._usage = {name: [0, 0] for name in WINDOWS}  # 格式: {窗口: [窗口起点, 计数]}
+        self._events = []  # 本次请求产生、释放锁后推送的事件
+        self._subscribers = {}  # 格式: {名称: (回调, 数据流列表)}
+        self._subscriber_ids = itertools.count(1)
+        self._order_ids = itertools.count(1)
+        self._running = Event()
+        self._thread = None
+
+        # 统计
+        self.request_counts = Counter()  # 格式: {接口名: 请求次数}
+        self.request_weights = Counter()  # 格式: {接口名: 累计权重}
+        self.error_counts = Counter()  # 格式: {错误码: 次数}
+
+        # 账户
+        self.balance = float(balance)
+        self.dual_side = False
+        self.positions = {}  # 格式: {symbol: [持仓数量(带符号), 开仓均价]}
+        self.orders = {}  # 格式: {orderId: 订单}
+        self.client_order_ids = {}  # 格式: {clientOrderId: orderId}
+
+        if isinstance(symbols, int):
+            symbols = [f"SIM{i:03d}USDT" for i in range(symbols)]
+        self.symbols = list(symbols)
+        self.default_leverage = leverage
+        self.leverage = {symbol: leverage for symbol in self.symbols}
+        self._generate_markets(history)
+
+    # ---------- 行情 ----------
+
+    def server_time_ms(self):
+        """服务器时间(毫秒)"""
+        return int(self.now_func() * 1000 + self.clock_offset_ms)
+
+    def _generate_markets(self, history):
+        """生成初始价格、交易规则和history根已收盘的小时K线"""
+        n = len(self.symbols)
+        rng = self._np_rng
+        current_open = self.server_time_ms() // HOUR_MS * HOUR_MS
+        start_prices = 10 ** rng.uniform(-3, 4.5, n)
+        # 每个交易对一个缓慢变化的趋势，使均线信号能够出现
+        drift = rng.normal(0, self.hourly_volatility / 4, (n, 1))
+        returns = rng.normal(0, self.hourly_volatility, (n, history)) + drift
+        closes = start_prices[:, None] * np.exp(np.cumsum(returns, axis=1))
+        opens = np.concatenate([start_prices[:, None], closes[:, :-1]], axis=1)
+        wick = np.abs(rng.normal(0, self.hourly_volatility / 2, (n, history, 2)))
+        highs = np.maximum(opens, closes) * (1 + wick[:, :, 0])
+        lows = np.minimum(opens, closes) * (1 - wick[:, :, 1])
+        volumes = 10 ** rng.uniform(6, 9, n)
+
+        self.markets = {}
+        for i, symbol in enumerate(self.symbols):
+            price = float(closes[i, -1])
+            magnitude = math.floor(math.log10(price))
+            price_precision = min(8, max(0, 4 - magnitude))
+            quantity_precision = min(3, max(0, magnitude - 1))
+            open_times = current_open - HOUR_MS * np.arange(history, 0, -1)
+            klines = [[int(t), float(o), float(h), float(l), float(c), float(volumes[i] / 24 / c)]
+                      for t, o, h, l, c in zip(open_times, opens[i], highs[i], lows[i], closes[i])]
+            # 当前未收盘K线
+            klines.append([current_open, price, price, price, price, 0.0])
+            self.markets[symbol] = {
+                'price': price,
+                'price_precision': price_precision,
+                'quantity_precision': quantity_precision,
+                'step': 10 ** -quantity_precision,
+                'quote_volume': float(volumes[i]),
+                'klines': klines,
+            }
+
+    def _market(self, symbol):
+        market = self.markets.get(symbol)
+        if market is None:
+            raise SimulatedReject(-1121)
+        return market
+
+    def _roll_klines(self, market, now_ms):
+        """补齐到当前小时的K线（没有价格变化的小时为一字线）"""
+        klines = market['klines']
+        current_open = now_ms // HOUR_MS * HOUR_MS
+        while klines[-1][0] < current_open:
+            price = klines[-1][4]
+            klines.append([klines[-1][0] + HOUR_MS, price, price, price, price, 0.0])
+
+    def step(self, seconds=1.0):
+        """
+        推进行情：所有交易对按随机游走更新价格和当前K线，撮合触发的止损单，推送行情和账户事件
+        :param seconds: 这一步对应的时间长度(秒)，决定价格波动幅度
+        """
+        with self._lock:
+            now_ms = self.server_time_ms()
+            sigma = self.hourly_volatility * math.sqrt(seconds / 3600)
+            moves = np.exp(self._np_rng.normal(0, sigma, len(self.symbols)))
+            volume_moves = np.exp(self._np_rng.normal(0, 0.01, len(self.symbols)))
+            for i, symbol in enumerate(self.symbols):
+                market = self.markets[symbol]
+                market['price'] *= float(moves[i])
+                market['quote_volume'] *= float(volume_moves[i])
+                self._roll_klines(market, now_ms)
+                kline = market['klines'][-1]
+                price = market['price']
+                kline[2] = max(kline[2], price)
+                kline[3] = min(kline[3], price)
+                kline[4] = price
+                kline[5] += market['quote_volume'] / 86400 * seconds / price
+            self._match_stops(now_ms)
+            self._events.append(('!ticker@arr', [self._stream_ticker(symbol, now_ms) for symbol in self.symbols]))
+            for symbol in self.symbols:
+                self._events.append((f"{symbol.lower()}@markPrice@1s", {
+                    'e': 'markPriceUpdate', 'E': now_ms, 's': symbol,
+                    'p': _fmt(self.markets[symbol]['price'], self.markets[symbol]['price_precision']),
+                }))
+            events = self._take_events()
+        self._publish(events)
+
+    def set_price(self, symbol, price):
+        """直接设置价格（构造止损触发、止盈等场景），并撮合止损单"""
+        with self._lock:
+            market = self._market(symbol)
+            now_ms = self.server_time_ms()
+            self._roll_klines(market, now_ms)
+            market['price'] = float(price)
+            kline = market['klines'][-1]
+            kline[2] = max(kline[2], price)
+            kline[3] = min(kline[3], price)
+            kline[4] = price
+            self._match_stops(now_ms)
+            events = self._take_events()
+        self._publish(events)
+
+    def start(self, interval=1.0):
+        """在后台线程中每interval秒推进一次行情（让机器人实时运行时使用）"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running.set()
+
+        def run():
+            while self._running.is_set():
+                self.step(interval)
+                time.sleep(interval)
+
+        self._thread = Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running.clear()
+
+    # ---------- 请求处理 ----------
+
+    def _rng(self, name):
+        rng = self._rngs.get(name)
+        if rng is None:
+            rng = random.Random(zlib.crc32(f"{self.seed}:{name}".encode()))
+            self._rngs[name] = rng
+        return rng
+
+    def inject(self, name, code, times=1):
+        """让接口接下来的times次请求返回指定错误码"""
+        with self._lock:
+            self._injected.setdefault(name, []).extend([code] * times)
+
+    def _pick_failure(self, name, rng):
+        injected = self._injected.get(name)
+        if injected:
+            return injected.pop(0)
+        for key in (name, '*'):
+            for code, probability in self.failures.get(key, {}).items():
+                if rng.random() < probability:
+                    return code
+        return None
+
+    def _check_limits(self, name, params, now_ms):
+        """
+        更新限频窗口计数
+        :return: (响应头, 错误码)
+        """
+        costs = {'weight_1m': endpoint_weight(name, params)}
+        if name in ORDER_ENDPOINTS:
+            costs['orders_10s'] = costs['orders_1m'] = 1
+        error = None
+        for window, cost in costs.items():
+            length = WINDOWS[window][0] * 1000
+            start = now_ms // length * length
+            usage = self._usage[window]
+            if usage[0] != start:
+                usage[0], usage[1] = start, 0
+            usage[1] += cost
+            if usage[1] > self.limits[window] and error is None:
+                error = -1003 if window == 'weight_1m' else -1015
+                retry_after = (start + length - now_ms) // 1000 + 1
+        headers = {WINDOWS[window][1]: str(self._usage[window][1]) for window in costs}
+        if error is not None:
+            headers['Retry-After'] = str(retry_after)
+        self.request_weights[name] += costs['weight_1m']
+        return headers, error
+
+    def call(self, client, name, handler, params, timestamp=None):
+        """
+        处理一次请求：等待模拟延迟，检查限频、时间戳和注入的错误，执行接口逻辑，推送事件，调用响应钩子
+        :param client: 发起请求的SimulatedClient
+        :param name: 接口名(python-binance方法名)
+        :param handler: 接口逻辑 handler(**params)
+        :param timestamp: 签名接口的请求时间戳(毫秒)
+        """
+        with self._lock:
+            rng = self._rng(name)
+            delay = self.latency.get(name, self.latency['default']).sample(rng) * self.latency_scale
+        # 一半延迟在请求到达交易所之前，一半在响应返回途中
+        if delay:
+            self.sleep_func(delay / 2)
+
+        with self._lock:
+            now_ms = self.server_time_ms()
+            self.request_counts[name] += 1
+            headers, error = self._check_limits(name, params, now_ms)
+            if error is None and timestamp is not None and not (
+                    now_ms - self.recv_window <= timestamp <= now_ms + 1000):
+                error = -1021
+            if error is None:
+                error = self._pick_failure(name, rng)
+            result = None
+            if error is None or error in EXECUTED_ON_ERROR:
+                try:
+                    result = handler(**params)
+                except SimulatedReject as e:
+                    error = e.code
+            if error is not None:
+                self.error_counts[error] += 1
+            events = self._take_events()
+
+        if delay:
+            self.sleep_func(delay / 2)
+        self._publish(events)
+
+        status = ERRORS[error][0] if error is not None else 200
+        response = SimulatedResponse(status, headers)
+        client.response = response
+        for hook in client.session.hooks.get('response', []):
+            hook(response)
+        if error is not None:
+            raise _api_error(error, headers)
+        return result
+
+    # ---------- 推送 ----------
+
+    def subscribe(self, callback, streams):
+        """
+        订阅数据流
+        :param streams: 数据流名称列表，'user'表示用户数据流
+        :return: 订阅名称
+        """
+        name = f"sim_stream_{next(self._subscriber_ids)}"
+        with self._lock:
+            self._subscribers[name] = (callback, set(streams))
+        return name
+
+    def unsubscribe(self, name):
+        with self._lock:
+            self._subscribers.pop(name, None)
+
+    def _take_events(self):
+        events, self._events = self._events, []
+        return events
+
+    def _publish(self, events):
+        """在锁外把事件推送给订阅者（格式与币安组合数据流一致）"""
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for stream, data in events:
+            for callback, streams in subscribers:
+                if stream not in streams:
+                    continue
+                try:
+                    callback(data if stream == 'user' else {'stream': stream, 'data': data})
+                except Exception as e:
+                    logger.error(f"推送{stream}失败: {str(e)}")
+
+    def _stream_ticker(self, symbol, now_ms):
+        market = self.markets[symbol]
+        return {'e': '24hrTicker', 'E': now_ms, 's': symbol,
+                'c': _fmt(market['price'], market['price_precision']),
+                'q': f"{market['quote_volume']:.2f}"}
+
+    # ---------- 账户和撮合 ----------
+
+    def _position_fields(self, symbol):
+        amt, entry = self.positions.get(symbol, (0.0, 0.0))
+        market = self.markets[symbol]
+        return {
+            'symbol': symbol,
+            'positionSide': 'BOTH',
+            'positionAmt': _fmt(amt, market['quantity_precision']),
+            'entryPrice': repr(entry),
+            'markPrice': _fmt(market['price'], market['price_precision']),
+            'unRealizedProfit': f"{amt * (market['price'] - entry):.8f}",
+        }
+
+    def _used_margin(self):
+        return sum(abs(amt) * entry / self.leverage[symbol] for symbol, (amt, entry) in self.positions.items())
+
+    def _emit_order(self, order, now_ms):
+        self._events.append(('user', {'e': 'ORDER_TRADE_UPDATE', 'E': now_ms, 'T': now_ms, 'o': {
+            's': order['symbol'], 'c': order['clientOrderId'], 'S': order['side'], 'o': order['type'],
+            'q': order['origQty'], 'ap': order['avgPrice'], 'sp': order['stopPrice'], 'X': order['status'],
+            'i': order['orderId'], 'z': order['executedQty'], 'R': order['reduceOnly'],
+            'cp': order['closePosition'], 'ps': 'BOTH',
+        }}))
+
+    def _emit_position(self, symbol, now_ms):
+        fields = self._position_fields(symbol)
+        self._events.append(('user', {'e': 'ACCOUNT_UPDATE', 'E': now_ms, 'T': now_ms, 'a': {
+            'm': 'ORDER',
+            'B': [{'a': 'USDT', 'wb': f"{self.balance:.8f}", 'cw': f"{self.balance:.8f}"}],
+            'P': [{'s': symbol, 'pa': fields['positionAmt'], 'ep': fields['entryPrice'],
+                   'up': fields['unRealizedProfit'], 'mt': 'cross', 'ps': 'BOTH'}],
+        }}))
+
+    def _reducible(self, symbol, side):
+        """side方向的订单最多能减仓的数量"""
+        amt = self.positions.get(symbol, (0.0, 0.0))[0]
+        if (side == 'SELL' and amt > 0) or (side == 'BUY' and amt < 0):
+            return abs(amt)
+        return 0.0
+
+    def _fill(self, order, quantity, price, now_ms):
+        """按price成交quantity，更新持仓、余额和订单状态"""
+        symbol = order['symbol']
+        market = self.markets[symbol]
+        amt, entry = self.positions.get(symbol, (0.0, 0.0))
+        signed = quantity if order['side'] == 'BUY' else -quantity
+        if amt == 0 or (amt > 0) == (signed > 0):
+            new_amt = amt + signed
+            entry = (abs(amt) * entry + quantity * price) / abs(new_amt)
+        else:
+            closed = min(quantity, abs(amt))
+            self.balance += closed * (price - entry) * (1 if amt > 0 else -1)
+            new_amt = amt + signed
+            if abs(new_amt) < 1e-12:
+                new_amt, entry = 0.0, 0.0
+            elif (new_amt > 0) != (amt > 0):
+                # 反手，剩余部分按成交价开仓
+                entry = price
+        self.balance -= quantity * price * self.fee_rate
+        new_amt = round(new_amt, market['quantity_precision'])
+        if new_amt == 0:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = (new_amt, entry)
+
+        order.update(status='FILLED', executedQty=_fmt(quantity, market['quantity_precision']),
+                     avgPrice=_fmt(price, market['price_precision']), updateTime=now_ms)
+        self._emit_order(order, now_ms)
+        self._emit_position(symbol, now_ms)
+        if new_amt == 0:
+            self._expire_reduce_only(symbol, now_ms)
+
+    def _expire_reduce_only(self, symbol, now_ms):
+        """持仓归零后，该交易对的reduceOnly挂单失效"""
+        for order in list(self.orders.values()):
+            if order['symbol'] == symbol and order['status'] == 'NEW' and order['reduceOnly']:
+                order.update(status='EXPIRED', updateTime=now_ms)
+                self._emit_order(order, now_ms)
+
+    def _market_price(self, symbol, side):
+        price = self.markets[symbol]['price']
+        return price * (1 + self.slippage) if side == 'BUY' else price * (1 - self.slippage)
+
+    def _match_stops(self, now_ms):
+        """撮合触发的止损单（按市价成交）"""
+        for order in list(self.orders.values()):
+            if order['status'] != 'NEW' or order['type'] != 'STOP_MARKET':
+                continue
+            symbol = order['symbol']
+            price = self.markets[symbol]['price']
+            stop = float(order['stopPrice'])
+            if not ((order['side'] == 'SELL' and price <= stop) or (order['side'] == 'BUY' and price >= stop)):
+                continue
+            reducible = self._reducible(symbol, order['side'])
+            if order['closePosition']:
+                quantity = reducible
+            elif order['reduceOnly']:
+                quantity = min(float(order['origQty']), reducible)
+            else:
+                quantity = float(order['origQty'])
+            if quantity <= 0:
+                order.update(status='EXPIRED', updateTime=now_ms)
+                self._emit_order(order, now_ms)
+                continue
+            self._fill(order, quantity, self._market_price(symbol, order['side']), now_ms)
+
+    def _check_quantity(self, market, quantity):
+        if quantity is None:
+            raise SimulatedReject(-1102)
+        quantity = float(quantity)
+        if quantity <= 0:
+            raise SimulatedReject(-4003)
+        steps = quantity / market['step']
+        if abs(steps - round(steps)) > 1e-6:
+            raise SimulatedReject(-1111)
+        if quantity < market['step']:
+            raise SimulatedReject(-1013)
+        return quantity
+
+    def create_order(self, symbol, side, type, quantity=None, stopPrice=None, reduceOnly=False,
+                     closePosition=False, newClientOrderId=None, newOrderRespType='ACK', **_):
+        """下单：MARKET立即成交，STOP_MARKET挂单等待触发"""
+        market = self._market(symbol)
+        now_ms = self.server_time_ms()
+        self._roll_klines(market, now_ms)
+        if newClientOrderId and newClientOrderId in self.client_order_ids:
+            raise SimulatedReject(-4116)
+        reduce_only = _flag(reduceOnly)
+        close_position = _flag(closePosition)
+
+        if type == 'MARKET':
+            quantity = self._check_quantity(market, quantity)
+            if reduce_only:
+                reducible = self._reducible(symbol, side)
+                if reducible <= 0:
+                    raise SimulatedReject(-2022)
+                quantity = min(quantity, reducible)
+            else:
+                price = market['price']
+                opening = max(0.0, quantity - self._reducible(symbol, side))
+                if opening * price / self.leverage[symbol] > self.balance - self._used_margin():
+                    raise SimulatedReject(-2019)
+        elif type == 'STOP_MARKET':
+            if stopPrice is None:
+                raise SimulatedReject(-1102)
+            stop = float(stopPrice)
+            price = market['price']
+            if (side == 'SELL' and price <= stop) or (side == 'BUY' and price >= stop):
+                raise SimulatedReject(-2021)
+            if close_position:
+                if any(o['symbol'] == symbol and o['side'] == side and o['closePosition'] and o['status'] == 'NEW'
+                       for o in self.orders.values()):
+                    raise SimulatedReject(-4130)
+            else:
+                quantity = self._check_quantity(market, quantity)
+        else:
+            raise SimulatedReject(-1116)
+
+        order_id = next(self._order_ids)
+        order = {
+            'orderId': order_id,
+            'clientOrderId': newClientOrderId or f"sim_{order_id}",
+            'symbol': symbol,
+            'side': side,
+            'type': type,
+            'status': 'NEW',
+            'price': '0',
+            'avgPrice': '0.00',
+            'origQty': _fmt(quantity or 0, market['quantity_precision']),
+            'executedQty': '0',
+            'stopPrice': _fmt(float(stopPrice), market['price_precision']) if stopPrice is not None else '0',
+            'reduceOnly': reduce_only,
+            'closePosition': close_position,
+            'positionSide': 'BOTH',
+            'timeInForce': 'GTC',
+            'updateTime': now_ms,
+        }
+        self.orders[order_id] = order
+        self.client_order_ids[order['clientOrderId']] = order_id
+        if type == 'MARKET':
+            self._fill(order, quantity, self._market_price(symbol, side), now_ms)
+            if newOrderRespType != 'RESULT':
+                # ACK响应不包含成交结果
+                return dict(order, status='NEW', executedQty='0', avgPrice='0.00')
+        else:
+            self._emit_order(order, now_ms)
+        return dict(order)
+
+    def get_order(self, symbol, orderId=None, origClientOrderId=None, **_):
+        if orderId is None and origClientOrderId is not None:
+            orderId = self.client_order_ids.get(origClientOrderId)
+        order = self.orders.get(int(orderId)) if orderId is not None else None
+        if order is None or order['symbol'] != symbol:
+            raise SimulatedReject(-2013)
+        return dict(order)
+
+    def open_orders(self, symbol=None, **_):
+        return [dict(order) for order in self.orders.values()
+                if order['status'] == 'NEW' and (symbol is None or order['symbol'] == symbol)]
+
+    def cancel_orders(self, symbol, orderidlist=None, **_):
+        """批量撤单，单个订单失败时对应位置返回错误"""
+        if isinstance(orderidlist, str):
+            orderidlist = json.loads(orderidlist)
+        if not orderidlist or len(orderidlist) > 10:
+            raise SimulatedReject(-1102)
+        now_ms = self.server_time_ms()
+        results = []
+        for order_id in orderidlist:
+            order = self.orders.get(int(order_id))
+            if order is None or order['symbol'] != symbol or order['status'] != 'NEW':
+                results.append({'code': -2011, 'msg': ERRORS[-2011][1]})
+                continue
+            order.update(status='CANCELED', updateTime=now_ms)
+            self._emit_order(order, now_ms)
+            results.append(dict(order))
+        return results
+
+    def exchange_info(self, **_):
+        symbols = []
+        for symbol in self.symbols:
+            market = self.markets[symbol]
+            tick = _fmt(10 ** -market['price_precision'], market['price_precision'])
+            step = _fmt(market['step'], market['quantity_precision'])
+            symbols.append({
+                'symbol': symbol,
+                'status': 'TRADING',
+                'contractType': 'PERPETUAL',
+                'quoteAsset': 'USDT',
+                'pricePrecision': market['price_precision'],
+                'quantityPrecision': market['quantity_precision'],
+                'filters': [
+                    {'filterType': 'PRICE_FILTER', 'tickSize': tick, 'minPrice': tick, 'maxPrice': '1000000'},
+                    {'filterType': 'LOT_SIZE', 'stepSize': step, 'minQty': step, 'maxQty': '10000000'},
+                ],
+            })
+        return {'timezone': 'UTC', 'serverTime': self.server_time_ms(), 'symbols': symbols}
+
+    def ticker(self, symbol=None, **_):
+        def view(symbol):
+            market = self.markets[symbol]
+            return {'symbol': symbol, 'lastPrice': _fmt(market['price'], market['price_precision']),
+                    'quoteVolume': f"{market['quote_volume']:.2f}"}
+        if symbol is not None:
+            self._market(symbol)
+            return view(symbol)
+        return [view(symbol) for symbol in self.symbols]
+
+    def symbol_ticker(self, symbol=None, **_):
+        now_ms = self.server_time_ms()
+
+        def view(symbol):
+            market = self.markets[symbol]
+            return {'symbol': symbol, 'price': _fmt(market['price'], market['price_precision']), 'time': now_ms}
+        if symbol is not None:
+            self._market(symbol)
+            return view(symbol)
+        return [view(symbol) for symbol in self.symbols]
+
+    def klines(self, symbol, interval, limit=500, startTime=None, endTime=None, **_):
+        if interval != '1h':
+            raise SimulatedReject(-1120)
+        market = self._market(symbol)
+        self._roll_klines(market, self.server_time_ms())
+        klines = market['klines']
+        if startTime is not None:
+            start = next((i for i, row in enumerate(klines) if row[0] >= int(startTime)), len(klines))
+            rows = klines[start:start + int(limit)]
+        else:
+            rows = klines[-int(limit):]
+        if endTime is not None:
+            rows = [row for row in rows if row[0] <= int(endTime)]
+        p, q = market['price_precision'], market['quantity_precision']
+        return [[t, _fmt(o, p), _fmt(h, p), _fmt(l, p), _fmt(c, p), _fmt(v, q), t + HOUR_MS - 1,
+                 f"{v * c:.4f}", 0, '0', '0', '0'] for t, o, h, l, c, v in rows]
+
+    def position_information(self, symbol=None, **_):
+        symbols = [symbol] if symbol else self.symbols
+        return [self._position_fields(s) for s in symbols]
+
+    def account_balance(self, **_):
+        unrealized = sum(amt * (self.markets[s]['price'] - entry) for s, (amt, entry) in self.positions.items())
+        return [{'asset': 'USDT', 'balance': f"{self.balance:.8f}",
+                 'crossUnPnl': f"{unrealized:.8f}",
+                 'availableBalance': f"{self.balance - self._used_margin() + min(0.0, unrealized):.8f}"}]
+
+    def symbol_config(self, symbol=None, **_):
+        symbols = [symbol] if symbol else self.symbols
+        return [{'symbol': s, 'marginType': 'CROSSED', 'isAutoAddMargin': 'false',
+                 'leverage': self.leverage[s], 'maxNotionalValue': '1000000'} for s in symbols]
+
+    def get_position_mode(self, **_):
+        return {'dualSidePosition': self.dual_side}
+
+    def change_position_mode(self, dualSidePosition, **_):
+        dual_side = _flag(dualSidePosition)
+        if dual_side == self.dual_side:
+            raise SimulatedReject(-4059)
+        self.dual_side = dual_side
+        return {'code': 200, 'msg': 'success'}
+
+    def change_leverage(self, symbol, leverage, **_):
+        self._market(symbol)
+        leverage = int(leverage)
+        if not 1 <= leverage <= 125:
+            raise SimulatedReject(-4028)
+        self.leverage[symbol] = leverage
+        return {'symbol': symbol, 'leverage': leverage, 'maxNotionalValue': '1000000'}
+
+
+class SimulatedClient:
+    """
+    模拟交易所的同步客户端，方法名和参数与python-binance Client一致，
+    可直接传给BinanceFuturesTrader和TakeProfitMonitor
+    """
+
+    def __init__(self, exchange, api_key=None, api_secret=None):
+        """
+        :param exchange: SimulatedExchange实例
+        """
+        self.exchange = exchange
+        self.API_KEY = api_key
+        self.API_SECRET = api_secret
+        self.session = SimulatedSession()
+        self.response = None  # 最近一次响应
+        self.timestamp_offset = 0  # 签名时间戳的偏移量(毫秒)
+
+    def _call(self, name, handler, params):
+        # requests_params只对真实HTTP请求有意义
+        params.pop('requests_params', None)
+        timestamp = int(time.time() * 1000 + self.timestamp_offset) if name in SIGNED_ENDPOINTS else None
+        return self.exchange.call(self, name, handler, params, timestamp)
+
+    def futures_time(self, **params):
+        return self._call('futures_time', lambda: {'serverTime': self.exchange.server_time_ms()}, params)
+
+    def futures_ping(self, **params):
+        return self._call('futures_ping', lambda: {}, params)
+
+    def futures_exchange_info(self, **params):
+        return self._call('futures_exchange_info', self.exchange.exchange_info, params)
+
+    def futures_ticker(self, **params):
+        return self._call('futures_ticker', self.exchange.ticker, params)
+
+    def futures_symbol_ticker(self, **params):
+        return self._call('futures_symbol_ticker', self.exchange.symbol_ticker, params)
+
+    def futures_klines(self, **params):
+        return self._call('futures_klines', self.exchange.klines, params)
+
+    def futures_position_information(self, **params):
+        return self._call('futures_position_information', self.exchange.position_information, params)
+
+    def futures_account_balance(self, **params):
+        return self._call('futures_account_balance', self.exchange.account_balance, params)
+
+    def futures_symbol_config(self, **params):
+        return self._call('futures_symbol_config', self.exchange.symbol_config, params)
+
+    def futures_get_position_mode(self, **params):
+        return self._call('futures_get_position_mode', self.exchange.get_position_mode, params)
+
+    def futures_change_position_mode(self, **params):
+        return self._call('futures_change_position_mode', self.exchange.change_position_mode, params)
+
+    def futures_change_leverage(self, **params):
+        return self._call('futures_change_leverage', self.exchange.change_leverage, params)
+
+    def futures_create_order(self, **params):
+        return self._call('futures_create_order', self.exchange.create_order, params)
+
+    def futures_get_order(self, **params):
+        return self._call('futures_get_order', self.exchange.get_order, params)
+
+    def futures_get_open_orders(self, **params):
+        return self._call('futures_get_open_orders', self.exchange.open_orders, params)
+
+    def futures_cancel_orders(self, **params):
+        return self._call('futures_cancel_orders', self.exchange.cancel_orders, params)
+
+    def close_connection(self):
+        pass
+
+
+class SimulatedSocketManager:
+    """与ThreadedWebsocketManager接口一致的模拟推送管理器，推送在SimulatedExchange.step时发出"""
+
+    def __init__(self, exchange):
+        """
+        :param exchange: SimulatedExchange实例
+        """
+        self.exchange = exchange
+        self.streams = set()
+
+    def start(self):
+        pass
+
+    def start_futures_multiplex_socket(self, callback, streams):
+        name = self.exchange.subscribe(callback, streams)
+        self.streams.add(name)
+        return name
+
+    def start_futures_user_socket(self, callback):
+        name = self.exchange.subscribe(callback, ['user'])
+        self.streams.add(name)
+        return name
+
+    def stop_socket(self, name):
+        self.exchange.unsubscribe(name)
+        self.streams.discard(name)
+
+    def stop(self):
+        for name in list(self.streams):
+            self.stop_socket(name)
@@ -0,0 +1,95 @@
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[连接池] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('HttpPool')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 各主机用于预热连接的轻量接口
+PING_PATHS = {
+    'https://fapi.binance.com': '/fapi/v1/ping',
+    'https://api.binance.com': '/api/v3/ping',
+}
+
+
+class HttpPool:
+    """
+    进程内共享的HTTP连接池：每个主机一个HTTPAdapter（urllib3连接池），
+    所有客户端和时间同步管理器的会话都挂载同一组adapter，复用已建立的TLS连接
+    """
+
+    def __init__(self, pool_maxsize=12, hosts=tuple(PING_PATHS)):
+        """
+        初始化连接池
+        :param pool_maxsize: 每个主机保持的最大连接数，应不小于并发请求数
+        :param hosts: 使用共享连接池的主机
+        """
+        self.pool_maxsize = pool_maxsize
+        self.hosts = hosts
+        self.adapters = {host: HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize) for host in hosts}
+
+    def session(self, headers=None):
+        """
+        创建挂载共享adapter的会话（会话本身很轻，各客户端的请求头和钩子互不影响）
+        :param headers: 会话默认请求头
+        """
+        session = requests.Session()
+        for host, adapter in self.adapters.items():
+            session.mount(host, adapter)
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    def prewarm(self, host='https://fapi.binance.com', connections=None, timeout=5):
+        """
+        并发请求ping接口，让连接池中保持connections个已完成握手的连接，在集中请求前调用
+        :param host: 主机
+        :param connections: 连接数，None时为pool_maxsize
+        :return: 成功的请求数
+        """
+        connections = min(connections or self.pool_maxsize, self.pool_maxsize)
+        session = self.session()
+        url = host + PING_PATHS.get(host, '/')
+
+        def ping(_):
+            try:
+                session.get(url, timeout=timeout).raise_for_status()
+                return True
+            except requests.RequestException as e:
+                logger.error(f"预热连接失败: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            ok = sum(executor.map(ping, range(connections)))
+        return ok
+
+    def close(self):
+        for adapter in self.adapters.values():
+            adapter.close()
+
+
+class PooledSessionMixin:
+    """让python-binance的同步客户端使用共享连接池创建会话"""
+
+    def _init_session(self):
+        return http_pool.session(self._get_headers())
+
+    def close_connection(self):
+        # 关闭会话会关闭其挂载的共享adapter，连接池由http_pool统一管理
+        pass
+
+# 从配置文件导入连接池大小
+try:
+    from config import HTTP_POOL_SIZE
+except ImportError:
+    HTTP_POOL_SIZE = 12
+
+# 创建全局连接池实例
+http_pool = HttpPool(pool_maxsize=HTTP_POOL_SIZE)
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from kline_store import INTERVAL_MS, FIELDS
+
+# 每列的数据类型
+COLUMNS = {'open_time': np.int64, **{field: np.float64 for field in FIELDS}}
+META_FILE = 'meta.json'
+
+
+class KlineSeries:
+    """
+    单个交易对单个周期的K线列存储：每列一个只追加的二进制文件，meta.json中的count是已提交的行数，
+    读取时把前count行映射为numpy.memmap（不复制数据）
+    """
+
+    def __init__(self, path, interval):
+        """
+        :param path: 该交易对该周期的目录
+        :param interval: K线周期
+        """
+        self.path = path
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self._lock = Lock()
+        self._maps = {}  # 格式: {列名: (行数, memmap)}
+        os.makedirs(path, exist_ok=True)
+        self._recover()
+
+    def _column_path(self, column):
+        return os.path.join(self.path, column + '.bin')
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, META_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'count': 0}
+
+    def _write_meta(self, count):
+        """原子地更新已提交行数（先写临时文件再替换）"""
+        meta_path = os.path.join(self.path, META_FILE)
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'count': count, 'interval': self.interval}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    def _recover(self):
+        """截掉上次追加中断时写了一半的数据，使各列长度与count一致"""
+        count = self.count
+        for column, dtype in COLUMNS.items():
+            path = self._column_path(column)
+            size = count * np.dtype(dtype).itemsize
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            if os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    @property
+    def count(self):
+        """已提交的K线数量"""
+        return self._read_meta()['count']
+
+    def column(self, name):
+        """
+        只读映射一列的全部已提交数据
+        :return: numpy.memmap（没有数据时为空数组）
+        """
+        count = self.count
+        cached = self._maps.get(name)
+        if cached and cached[0] == count:
+            return cached[1]
+        if count == 0:
+            return np.empty(0, dtype=COLUMNS[name])
+        array = np.memmap(self._column_path(name), dtype=COLUMNS[name], mode='r', shape=(count,))
+        self._maps[name] = (count, array)
+        return array
+
+    def last_open_time(self):
+        """最新一根K线的开盘时间，没有数据时返回None"""
+        open_time = self.column('open_time')
+        return int(open_time[-1]) if len(open_time) else None
+
+    def read(self, start_time=None, end_time=None, n=None):
+        """
+        按开盘时间范围读取各列（memmap切片，不复制数据）
+        :param start_time: 开始时间(毫秒，包含)
+        :param end_time: 结束时间(毫秒，不包含)
+        :param n: 只取范围内最后n根
+        :return: {'open_time', 'open', 'high', 'low', 'close', 'volume'}
+        """
+        open_time = self.column('open_time')
+        lo = 0 if start_time is None else int(np.searchsorted(open_time, start_time, side='left'))
+        hi = len(open_time) if end_time is None else int(np.searchsorted(open_time, end_time, side='left'))
+        if n is not None:
+            lo = max(lo, hi - n)
+        return {name: self.column(name)[lo:hi] for name in COLUMNS}
+
+    def append(self, klines, now_ms=None):
+        """
+        追加已收盘的原始K线，早于或等于已有最新K线的行会被跳过
+        :param klines: futures_klines返回的K线列表
+        :return: 追加的行数
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        with self._lock:
+            last = self.last_open_time()
+            rows = [row for row in klines
+                    if (last is None or int(row[0]) > last) and int(row[6]) < now_ms]
+            if not rows:
+                return 0
+            data = np.asarray([row[:6] for row in rows], dtype=np.float64)
+            for i, (column, dtype) in enumerate(COLUMNS.items()):
+                with open(self._column_path(column), 'ab') as f:
+                    f.write(data[:, i].astype(dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            # 所有列写完后再提交行数，中断时未提交的数据在下次打开时被截掉
+            self._write_meta(self.count + len(rows))
+            return len(rows)
+
+
+class KlineArchive:
+    """本地K线归档：<root>/<interval>/<SYMBOL>/ 下每列一个文件"""
+
+    def __init__(self, root):
+        """
+        :param root: 归档根目录
+        """
+        self.root = root
+        self._series = {}
+        self._lock = Lock()
+
+    def series(self, symbol, interval='1h'):
+        """获取(必要时创建)一个交易对的K线序列"""
+        key = (symbol, interval)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = KlineSeries(os.path.join(self.root, interval, symbol), interval)
+                self._series[key] = series
+            return series
+
+    def has(self, symbol, interval='1h'):
+        """归档中是否已有该交易对（不创建目录）"""
+        return os.path.exists(os.path.join(self.root, interval, symbol, META_FILE))
+
+    def symbols(self, interval='1h'):
+        """归档中已有数据的交易对"""
+        directory = os.path.join(self.root, interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory) if self.has(name, interval))
+
+    def load_matrix(self, symbols, interval='1h', start_time=None, end_time=None):
+        """
+        读取多个交易对的K线，供回测对齐成矩阵
+        :return: {symbol: 形状(m, 5)的数组 [open_time, open, high, low, close]}
+        """
+        result = {}
+        for symbol in symbols:
+            if not self.has(symbol, interval):
+                continue
+            columns = self.series(symbol, interval).read(start_time, end_time)
+            if len(columns['open_time']):
+                result[symbol] = np.column_stack([columns[name] for name in ('open_time', 'open', 'high', 'low', 'close')])
+        return result
+
+    def seed_store(self, kline_store, symbols):
+        """
+        用归档中最近的K线填充KlineStore，之后的增量更新只需请求归档之后的K线
+        :return: 填充的交易对数量
+        """
+        seeded = 0
+        for symbol in symbols:
+            if not self.has(symbol, kline_store.interval):
+                continue
+            columns = self.series(symbol, kline_store.interval).read(n=kline_store.capacity)
+            if len(columns['open_time']):
+                kline_store.seed(symbol, columns)
+                seeded += 1
+        return seeded
+
+
+def backfill_symbol(series, fetch_func, symbol, start_time, end_time=None, limit=1000):
+    """
+    从归档中最新K线之后(或start_time)开始分页补齐一个交易对，每页写入后立即提交，中断后可续传
+    :param fetch_func: 获取原始K线的函数 fetch_func(symbol, interval, limit, start_time)
+    :return: 追加的行数
+    """
+    if end_time is None:
+        end_time = int(time.time() * 1000)
+    last = series.last_open_time()
+    cursor = start_time if last is None else max(start_time, last + series.interval_ms)
+    added = 0
+    while cursor < end_time:
+        page = fetch_func(symbol, series.interval, limit, cursor)
+        if not page:
+            break
+        added += series.append(page)
+        cursor = int(page[-1][0]) + series.interval_ms
+        if len(page) < limit:
+            break
+    return added
+
+
+def backfill(archive, fetch_func, symbols, interval='1h', start_time=None, end_time=None, workers=4):
+    """
+    并行补齐多个交易对（请求频率由fetch_func内的限频器控制）
+    :return: {symbol: 追加的行数或异常}
+    """
+    results = {}
+
+    def run(symbol):
+        try:
+            results[symbol] = backfill_symbol(archive.series(symbol, interval), fetch_func, symbol,
+                                              start_time, end_time)
+            print(f"{symbol} 补齐 {results[symbol]} 根K线")
+        except Exception as e:
+            results[symbol] = e
+            print(f"{symbol} 补齐失败: {e}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run, symbols))
+    return results
+
+
+def main():
+    from binance.client import Client
+    from config import KLINE_ARCHIVE_DIR, exclude_symbols
+    from http_pool import PooledSessionMixin
+    from rate_governor import RateGovernor
+    from request_executor import RequestExecutor
+
+    parser = argparse.ArgumentParser(description='下载历史K线到本地归档（中断后重新运行即可续传）')
+    parser.add_argument('--symbols', nargs='*', help='交易对列表，默认使用当前交易量前N的USDT合约')
+    parser.add_argument('--top', type=int, default=100, help='未指定交易对时取交易量前N')
+    parser.add_argument('--days', type=int, default=365, help='补齐最近多少天')
+    parser.add_argument('--interval', default='1h', help='K线周期')
+    parser.add_argument('--workers', type=int, default=4, help='并行下载的交易对数')
+    parser.add_argument('--root', default=KLINE_ARCHIVE_DIR, help='归档目录')
+    args = parser.parse_args()
+
+    class PooledClient(PooledSessionMixin, Client):
+        pass
+
+    client = PooledClient()
+    governor = RateGovernor()
+    governor.install(client)
+    executor = RequestExecutor(rate_governor=governor)
+
+    def fetch(symbol, interval, limit, start_time):
+        return executor.execute(client.futures_klines, symbol=symbol, interval=interval,
+                                limit=limit, startTime=start_time)
+
+    symbols = args.symbols
+    if not symbols:
+        tickers = [t for t in executor.execute(client.futures_ticker)
+                   if t['symbol'].endswith('USDT') and t['symbol'] not in exclude_symbols]
+        tickers.sort(key=lambda t: float(t['quoteVolume']), reverse=True)
+        symbols = [t['symbol'] for t in tickers[:args.top]]
+
+    start_time = int(time.time() * 1000) - args.days * 86400 * 1000
+    start = time.time()
+    results = backfill(KlineArchive(args.root), fetch, symbols, args.interval, start_time, workers=args.workers)
+    failed = [symbol for symbol, result in results.items() if isinstance(result, Exception)]
+    print(f"完成: {len(symbols) - len(failed)}/{len(symbols)}个交易对，耗时{time.time() - start:.1f}秒")
+    if failed:
+        print(f"失败的交易对(重新运行可续传): {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import time
+import numpy as np
+from threading import Lock
+
+# K线周期对应的毫秒数
+INTERVAL_MS = {
+    '1m': 60000, '3m': 180000, '5m': 300000, '15m': 900000, '30m': 1800000,
+    '1h': 3600000, '2h': 7200000, '4h': 14400000, '6h': 21600000,
+    '8h': 28800000, '12h': 43200000, '1d': 86400000,
+}
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class KlineRingBuffer:
+    """单个交易对的定长K线环形缓冲区，OHLCV存放在numpy数组中"""
+
+    def __init__(self, capacity=100):
+        """
+        :param capacity: 最多保留的K线数量
+        """
+        self.capacity = capacity
+        self.open_time = np.zeros(capacity, dtype=np.int64)
+        self.data = {field: np.zeros(capacity, dtype=np.float64) for field in FIELDS}
+        self.head = 0  # 下一根K线写入的位置
+        self.size = 0  # 已保存的K线数量
+
+    def last_open_time(self):
+        """最新一根K线的开盘时间，没有数据时返回None"""
+        if self.size == 0:
+            return None
+        return int(self.open_time[(self.head - 1) % self.capacity])
+
+    def append(self, row):
+        """
+        追加一根原始K线；开盘时间与最新一根相同时覆盖（更新未收盘K线）
+        :param row: futures_klines返回的单根K线 [open_time, open, high, low, close, volume, ...]
+        """
+        open_time = int(row[0])
+        last = self.last_open_time()
+        if last is not None and open_time < last:
+            return
+        if last is not None and open_time == last:
+            pos = (self.head - 1) % self.capacity
+        else:
+            pos = self.head
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+        self.open_time[pos] = open_time
+        for i, field in enumerate(FIELDS, start=1):
+            self.data[field][pos] = float(row[i])
+
+    def load(self, columns):
+        """
+        用按时间顺序排列的列数据整体填充缓冲区（只保留最后capacity根）
+        :param columns: {'open_time': 数组, 'open': 数组, ...}
+        """
+        n = min(len(columns['open_time']), self.capacity)
+        self.open_time[:n] = columns['open_time'][len(columns['open_time']) - n:]
+        for field in FIELDS:
+            self.data[field][:n] = columns[field][len(columns[field]) - n:]
+        self.head = n % self.capacity
+        self.size = n
+
+    def _indices(self, n):
+        n = self.size if n is None else min(n, self.size)
+        return (self.head - n + np.arange(n)) % self.capacity
+
+    def get(self, field, n=None):
+        """按时间顺序返回最近n根K线的某个字段（open_time或OHLCV）"""
+        idx = self._indices(n)
+        if field == 'open_time':
+            return self.open_time[idx]
+        return self.data[field][idx]
+
+    def last(self):
+        """最新一根K线，格式: {'open_time', 'open', 'high', 'low', 'close', 'volume'}"""
+        if self.size == 0:
+            return None
+        pos = (self.head - 1) % self.capacity
+        kline = {field: float(self.data[field][pos]) for field in FIELDS}
+        kline['open_time'] = int(self.open_time[pos])
+        return kline
+
+
+class KlineStore:
+    """按交易对保存K线的增量存储：首次加载完整历史，之后只补充最新K线"""
+
+    def __init__(self, fetch_func, interval='1h', capacity=100):
+        """
+        初始化K线存储
+        :param fetch_func: 获取原始K线的函数 fetch_func(symbol, interval, limit, start_time)
+        :param interval: K线周期
+        :param capacity: 每个交易对保留的K线数量
+        """
+        self.fetch_func = fetch_func
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.capacity = capacity
+        self.buffers = {}  # 格式: {symbol: KlineRingBuffer}
+        self.last_update_time = {}  # 格式: {symbol: 上次更新时间(秒)}
+        self._lock = Lock()
+
+    def _get_buffer(self, symbol):
+        with self._lock:
+            buffer = self.buffers.get(symbol)
+            if buffer is None:
+                buffer = KlineRingBuffer(self.capacity)
+                self.buffers[symbol] = buffer
+            return buffer
+
+    def apply_klines(self, symbol, klines):
+        """把一批原始K线写入存储（按时间顺序）"""
+        buffer = self._get_buffer(symbol)
+        for row in klines:
+            buffer.append(row)
+        self.last_update_time[symbol] = time.time()
+        return buffer
+
+    def pending_request(self, symbol, now_ms=None):
+        """
+        计算补齐该交易对需要的请求参数
+        :return: (limit, start_time)，start_time为None表示需要完整加载
+        """
+        buffer = self.buffers.get(symbol)
+        last_open_time = buffer.last_open_time() if buffer else None
+        if last_open_time is None:
+            return self.capacity, None
+
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        # 从最新一根（可能未收盘）K线开始补，+2 容忍本地时钟误差
+        missing = (now_ms - last_open_time) // self.interval_ms + 2
+        if missing > self.capacity:
+            # 断档超过缓冲区长度，重新完整加载
+            return self.capacity, None
+        return max(int(missing), 2), last_open_time
+
+    def update(self, symbol, max_age=None):
+        """
+        增量更新一个交易对的K线
+        :param symbol: 交易对
+        :param max_age: 距上次更新不超过该秒数时跳过请求
+        :return: 是否有可用数据
+        """
+        if max_age is not None and time.time() - self.last_update_time.get(symbol, 0) <= max_age:
+            return self.size(symbol) > 0
+
+        limit, start_time = self.pending_request(symbol)
+        klines = self.fetch_func(symbol, self.interval, limit, start_time)
+        return self.ingest(symbol, klines, start_time)
+
+    def ingest(self, symbol, klines, start_time):
+        """
+        写入按pending_request参数请求到的K线（异步引擎自行请求后调用）
+        :param start_time: 请求时的start_time，为None表示完整加载
+        :return: 是否有可用数据
+        """
+        if not klines:
+            return self.size(symbol) > 0
+        if start_time is None:
+            # 完整加载时丢弃旧数据
+            with self._lock:
+                self.buffers[symbol] = KlineRingBuffer(self.capacity)
+        self.apply_klines(symbol, klines)
+        return True
+
+    def seed(self, symbol, columns):
+        """
+        用本地归档中的K线填充一个交易对，不记录更新时间，下次update只请求归档之后的K线
+        :param columns: {'open_time': 数组, 'open': 数组, ...}
+        """
+        buffer = KlineRingBuffer(self.capacity)
+        buffer.load(columns)
+        with self._lock:
+            self.buffers[symbol] = buffer
+        return buffer
+
+    def size(self, symbol):
+        """已保存的K线数量"""
+        buffer = self.buffers.get(symbol)
+        return buffer.size if buffer else 0
+
+    def get(self, symbol, field, n=None):
+        """按时间顺序返回最近n根K线的某个字段"""
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            return np.empty(0)
+        return buffer.get(field, n)
+
+    def last_kline(self, symbol):
+        """最新一根K线"""
+        buffer = self.buffers.get(symbol)
+        return buffer.last() if buffer else None
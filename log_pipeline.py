@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from threading import Lock
+import metrics
+
+# 日志队列默认容量，队列满时丢弃新记录而不是阻塞交易线程
+DEFAULT_QUEUE_SIZE = 10000
+
+# 各组件模块中已有的日志器，setup时一并改为经过队列输出
+COMPONENT_LOGGERS = ('TimeSyncManager', 'HttpPool', 'ExchangeInfoCache', 'SymbolUniverse', 'UserDataStream',
+                     'MarkPriceFeed', 'RateGovernor', 'RequestExecutor', 'Scheduler', 'Metrics')
+
+
+def _format_field(value):
+    text = str(value)
+    if not text or any(ch in text for ch in ' ="'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+class StructuredFormatter(logging.Formatter):
+    """在消息后以 key=value 形式追加结构化字段"""
+
+    def format(self, record):
+        text = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={_format_field(value)}" for key, value in fields.items())
+        return text
+
+
+class _DropQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃记录并计数"""
+
+    def __init__(self, log_queue, pipeline):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.pipeline.dropped += 1
+
+
+class _Dispatcher(logging.Handler):
+    """后台线程中把记录交给该记录所属日志器原来的处理器"""
+
+    def __init__(self):
+        super().__init__()
+        self.routes = {}  # 格式: {日志器名: [处理器]}
+
+    def handle(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+
+class StructuredLogger:
+    """
+    带结构化字段和采样的日志器：log.info('下单成功', symbol=symbol, orderId=order_id)
+
+    sample参数用于按交易对输出的频繁记录（如每个交易对的跳过/检查信息），
+    同一sample键在sample_interval秒内只输出第一条，之后的一条附带被省略的条数。
+    警告及以上级别不采样。
+    """
+
+    def __init__(self, logger, pipeline):
+        """
+        :param logger: logging.Logger实例
+        :param pipeline: 所属的LogPipeline
+        """
+        self.logger = logger
+        self.pipeline = pipeline
+        self._samples = {}  # 格式: {采样键: [上次输出时间, 省略条数]}
+        self._lock = Lock()
+
+    def _sampled_out(self, sample):
+        now = time.monotonic()
+        with self._lock:
+            state = self._samples.get(sample)
+            if state is not None and now - state[0] < self.pipeline.sample_interval:
+                state[1] += 1
+                return True, 0
+            suppressed = state[1] if state is not None else 0
+            self._samples[sample] = [now, 0]
+            return False, suppressed
+
+    def log(self, level, msg, *, sample=None, exc_info=None, **fields):
+        """
+        :param level: 日志级别
+        :param msg: 消息
+        :param sample: 采样键（如 ('止盈检查', symbol)），None表示不采样
+        :param exc_info: 是否附带异常堆栈
+        :param fields: 结构化字段
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        if sample is not None and level < logging.WARNING:
+            skip, suppressed = self._sampled_out(sample)
+            if skip:
+                return
+            if suppressed:
+                fields['suppressed'] = suppressed
+        self.logger.log(level, msg, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, msg, **kwargs):
+        self.log(logging.DEBUG, msg, **kwargs)
+
+    def info(self, msg, **kwargs):
+        self.log(logging.INFO, msg, **kwargs)
+
+    def warning(self, msg, **kwargs):
+        self.log(logging.WARNING, msg, **kwargs)
+
+    def error(self, msg, **kwargs):
+        self.log(logging.ERROR, msg, **kwargs)
+
+    def exception(self, msg, **kwargs):
+        self.log(logging.ERROR, msg, exc_info=True, **kwargs)
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level)
+
+
+class LogPipeline:
+    """
+    异步日志管道：调用线程只把记录放入有界队列，格式化和控制台/文件写入由后台QueueListener线程完成，
+    控制台缓慢或被重定向时也不会阻塞交易线程
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        :param queue_size: 队列容量
+        """
+        self.queue = queue.Queue(queue_size)
+        self.level = logging.INFO
+        self.sample_interval = 60  # 同一采样键的最短输出间隔(秒)
+        self.dropped = 0  # 队列满时丢弃的记录数
+        self.dispatcher = _Dispatcher()
+        self.file_handler = None
+        self.listener = None
+        self._lock = Lock()
+
+    def start(self):
+        """启动后台写入线程（重复调用无效果）"""
+        with self._lock:
+            if self.listener is not None:
+                return
+            self.listener = logging.handlers.QueueListener(self.queue, self.dispatcher)
+            self.listener.start()
+            atexit.register(self.stop)
+
+    def stop(self):
+        """写完队列中剩余的记录后停止后台线程"""
+        with self._lock:
+            if self.listener is None:
+                return
+            self.listener.stop()
+            self.listener = None
+
+    def configure(self, level=None, log_file=None, sample_interval=None):
+        """
+        :param level: 日志级别（如 'INFO'、'DEBUG'），应用于所有通过管道输出的日志器
+        :param log_file: 额外写入的日志文件路径（按天轮换），None表示只输出到控制台
+        :param sample_interval: 采样间隔(秒)
+        """
+        if sample_interval is not None:
+            self.sample_interval = sample_interval
+        if level is not None:
+            self.level = logging.getLevelName(level) if isinstance(level, str) else level
+            for name in self.dispatcher.routes:
+                logging.getLogger(name).setLevel(self.level)
+        if log_file and self.file_handler is None:
+            directory = os.path.dirname(log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when='midnight',
+                                                                          backupCount=7, encoding='utf-8')
+            self.file_handler.setFormatter(StructuredFormatter('%(asctime)s [%(levelname)s] [%(name)s] %(message)s'))
+            for handlers in self.dispatcher.routes.values():
+                handlers.append(self.file_handler)
+
+    def _attach(self, logger, handlers):
+        """把日志器的输出改为经过队列，由后台线程交给handlers"""
+        if self.file_handler is not None:
+            handlers.append(self.file_handler)
+        self.dispatcher.routes[logger.name] = handlers
+        logger.addHandler(_DropQueueHandler(self.queue, self))
+        logger.setLevel(self.level)
+        logger.propagate = False
+        self.start()
+
+    def get_logger(self, name, prefix):
+        """
+        创建经过队列输出的结构化日志器
+        :param name: 日志器名
+        :param prefix: 控制台输出的中文前缀
+        :return: StructuredLogger实例
+        """
+        logger = logging.getLogger(name)
+        if name not in self.dispatcher.routes:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(StructuredFormatter(f'%(asctime)s [{prefix}] %(message)s', datefmt='%H:%M:%S'))
+            self._attach(logger, [handler])
+        return StructuredLogger(logger, self)
+
+    def route(self, *names):
+        """
+        把其他模块已有的日志器（如限频器、请求执行器、调度器）也改为经过队列输出，保留它们原来的格式
+        :param names: 日志器名
+        """
+        for name in names:
+            logger = logging.getLogger(name)
+            if name in self.dispatcher.routes or not logger.handlers:
+                continue
+            handlers = list(logger.handlers)
+            for handler in handlers:
+                logger.removeHandler(handler)
+            self._attach(logger, handlers)
+
+
+# 创建全局日志管道实例
+pipeline = LogPipeline()
+
+
+def get_logger(name, prefix):
+    return pipeline.get_logger(name, prefix)
+
+
+def setup(level='INFO', log_file=None, sample_interval=60):
+    """
+    按配置设置日志管道，并把各组件模块的日志器也改为经过队列输出（在程序入口调用）
+    :param level: 日志级别
+    :param log_file: 日志文件路径，None表示只输出到控制台
+    :param sample_interval: 按交易对采样的间隔(秒)
+    """
+    pipeline.route(*COMPONENT_LOGGERS)
+    pipeline.configure(level=level, log_file=log_file, sample_interval=sample_interval)
+
+
+# 抓取指标时读取丢弃的日志记录数
+metrics.LOG_DROPPED.set_function(lambda: pipeline.dropped)
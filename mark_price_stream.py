@@ -0,0 +1,103 @@
+import time
+import logging
+from threading import Lock
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[标记价格流] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('MarkPriceFeed')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+class MarkPriceFeed:
+    """按需订阅一组交易对的markPrice@1s推送，持仓变化时更新订阅"""
+
+    def __init__(self, socket_manager, on_tick=None, stale_after=10):
+        """
+        初始化标记价格推送
+        :param socket_manager: 已启动的ThreadedWebsocketManager
+        :param on_tick: 每次收到价格时的回调 on_tick(symbol, price)
+        :param stale_after: 超过多少秒无推送视为失效(秒)
+        """
+        self.socket_manager = socket_manager
+        self.on_tick = on_tick
+        self.stale_after = stale_after
+        self.prices = {}  # 格式: {symbol: 最新标记价格}
+        self.symbols = set()  # 当前订阅的交易对
+        self.stream_name = None  # 数据流名称
+        self.last_message_time = 0  # 上次收到推送的时间
+        self._lock = Lock()
+
+    def set_symbols(self, symbols):
+        """
+        更新订阅的交易对集合，集合不变时不做任何操作
+        :return: 是否重新订阅
+        """
+        symbols = set(symbols)
+        with self._lock:
+            if symbols == self.symbols:
+                return False
+            self._stop_stream()
+            self.symbols = symbols
+            for symbol in list(self.prices):
+                if symbol not in symbols:
+                    del self.prices[symbol]
+            if symbols:
+                streams = [f"{symbol.lower()}@markPrice@1s" for symbol in sorted(symbols)]
+                self.stream_name = self.socket_manager.start_futures_multiplex_socket(
+                    callback=self._handle_message,
+                    streams=streams
+                )
+                # 给新订阅留出收到首条推送的时间
+                self.last_message_time = time.time()
+                logger.info(f"订阅标记价格: {sorted(symbols)}")
+            return True
+
+    def stop(self):
+        """取消全部订阅"""
+        with self._lock:
+            self._stop_stream()
+            self.symbols = set()
+
+    def _stop_stream(self):
+        if self.stream_name:
+            try:
+                self.socket_manager.stop_socket(self.stream_name)
+            except Exception as e:
+                logger.error(f"取消订阅失败: {str(e)}")
+            self.stream_name = None
+
+    def _handle_message(self, msg):
+        """标记价格推送回调"""
+        if not isinstance(msg, dict):
+            return
+        if msg.get('e') == 'error':
+            logger.error(f"标记价格流错误: {msg.get('m')}")
+            return
+        data = msg.get('data', msg)
+        if data.get('e') != 'markPriceUpdate':
+            return
+        symbol = data['s']
+        if symbol not in self.symbols:
+            return
+        price = float(data['p'])
+        self.prices[symbol] = price
+        self.last_message_time = time.time()
+        if self.on_tick:
+            try:
+                self.on_tick(symbol, price)
+            except Exception as e:
+                logger.error(f"处理{symbol}标记价格失败: {str(e)}")
+
+    def get_price(self, symbol):
+        """最新标记价格，未收到时返回None"""
+        return self.prices.get(symbol)
+
+    def is_live(self):
+        """推送是否正常（没有订阅时视为正常）"""
+        if not self.symbols:
+            return True
+        return time.time() - self.last_message_time <= self.stale_after
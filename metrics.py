@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import logging
+import contextlib
+from threading import Thread, Lock, Event
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[指标] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('Metrics')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 耗时直方图的默认分桶(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """带标签的指标基类，每组标签值一个序列"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        :param name: 指标名
+        :param documentation: 说明
+        :param labelnames: 标签名
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.series = {}  # 格式: {标签值元组: 值}
+        self._lock = Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        """Prometheus文本格式"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self.series.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self):
+        """JSON格式: [{'labels': {...}, 'value': ...}]"""
+        with self._lock:
+            return [{'labels': dict(zip(self.labelnames, key)), 'value': value}
+                    for key, value in sorted(self.series.items())]
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """可任意设置的数值；也可以注册函数在输出时读取当前值"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.functions = {}  # 格式: {标签值元组: 读取函数}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.series[key] = value
+
+    def set_function(self, func, **labels):
+        """输出时调用func()得到当前值（如限频器已用权重）"""
+        key = self._key(labels)
+        with self._lock:
+            self.functions[key] = func
+
+    def _collect(self):
+        for key, func in list(self.functions.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            if value is not None:
+                with self._lock:
+                    self.series[key] = value
+
+    def render(self):
+        self._collect()
+        return super().render()
+
+    def snapshot(self):
+        self._collect()
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    """分桶统计的分布（耗时等），输出累计分桶计数、总和和次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """记录代码块的耗时(秒)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(zip(self.labelnames, key)),
+                     'count': series['count'],
+                     'sum': series['sum'],
+                     'buckets': {_format_value(bound): count for bound, count in zip(self.buckets, series['counts'])}}
+                    for key, series in sorted(self.series.items())]
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表：通过本地HTTP端点输出Prometheus文本格式，或定期把快照写入JSON文件
+    """
+
+    def __init__(self):
+        self.metrics = {}  # 格式: {指标名: Metric}
+        self._lock = Lock()
+        self.server = None
+        self._stop_event = Event()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """所有指标的Prometheus文本格式"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """所有指标的JSON快照"""
+        return {'time': time.time(),
+                'metrics': {name: {'type': metric.kind, 'help': metric.documentation, 'series': metric.snapshot()}
+                            for name, metric in list(self.metrics.items())}}
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        在后台线程中启动HTTP端点，GET /metrics 返回Prometheus文本格式
+        :return: 是否启动成功
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # 不输出每次抓取的访问日志
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logger.error(f"启动指标端点失败 {host}:{port}: {str(e)}")
+            return False
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"指标端点: http://{host}:{port}/metrics")
+        return True
+
+    def write_json(self, path):
+        """把快照原子地写入JSON文件"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def start_json_dump(self, path, interval=60):
+        """在后台线程中每interval秒写一次JSON快照"""
+        def run():
+            while not self._stop_event.wait(interval):
+                try:
+                    self.write_json(path)
+                except Exception as e:
+                    logger.error(f"写入指标快照失败: {str(e)}")
+
+        Thread(target=run, daemon=True).start()
+
+    def start(self, port=None, json_path=None, json_interval=60):
+        """按配置启动HTTP端点和/或JSON快照"""
+        if port:
+            self.serve(port)
+        if json_path:
+            self.start_json_dump(json_path, json_interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server = None
+
+
+# 创建全局指标注册表实例
+registry = MetricsRegistry()
+
+# 请求路径
+REQUEST_DURATION = registry.histogram('binance_request_duration_seconds', 'REST请求耗时', ('endpoint',))
+REQUESTS = registry.counter('binance_requests_total', 'REST请求次数', ('endpoint', 'outcome'))
+REQUEST_ERRORS = registry.counter('binance_request_errors_total', 'REST请求错误次数', ('endpoint', 'code'))
+REQUEST_RETRIES = registry.counter('binance_request_retries_total', 'REST请求重试次数', ('endpoint', 'policy'))
+TIME_RESYNCS = registry.counter('binance_time_resyncs_total', '收到-1021后重新同步时间的次数')
+
+# 限频
+USED_WEIGHT = registry.gauge('binance_used_weight', '当前窗口已用额度', ('window', 'source'))
+RATE_LIMIT_WAIT = registry.histogram('rate_governor_wait_seconds', '请求前等待额度的时间', ('endpoint',))
+RATE_LIMIT_BANS = registry.counter('rate_governor_bans_total', '收到429/418的次数', ('status',))
+
+# 时间同步
+CLOCK_OFFSET = registry.gauge('time_sync_offset_ms', '服务器时间相对本地系统时间的偏移(毫秒)')
+CLOCK_RTT = registry.gauge('time_sync_rtt_ms', '最近一次同步所用样本的往返时间(毫秒)')
+CLOCK_DRIFT = registry.gauge('time_sync_drift_ppm', '估计的本地时钟漂移率(ppm)')
+CLOCK_SYNCS = registry.counter('time_sync_total', '时间同步次数', ('result',))
+
+# 调度和策略周期
+JOB_DURATION = registry.histogram('scheduler_job_duration_seconds', '定时任务耗时', ('job',))
+JOB_LATENESS = registry.gauge('scheduler_job_lateness_seconds', '定时任务最近一次相对目标时间的延迟', ('job',))
+JOB_SKIPPED = registry.counter('scheduler_job_skipped_total', '因延迟过大跳过的定时任务次数', ('job',))
+JOB_FAILURES = registry.counter('scheduler_job_failures_total', '定时任务失败次数', ('job',))
+TAKE_PROFIT_CYCLE = registry.histogram('take_profit_cycle_seconds', '一次止盈检查的耗时')
+TAKE_PROFIT_ORDERS = registry.counter('take_profit_orders_total', '止盈下单次数', ('result',))
+
+# 日志
+LOG_DROPPED = registry.gauge('log_records_dropped', '日志队列满时丢弃的记录数')
+
+
+def observe_request(endpoint, seconds, error=None):
+    """
+    记录一次REST请求
+    :param endpoint: python-binance方法名
+    :param seconds: 耗时(秒)
+    :param error: 请求抛出的异常，成功时为None
+    """
+    REQUEST_DURATION.observe(seconds, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, outcome='ok' if error is None else 'error')
+    if error is not None:
+        REQUEST_ERRORS.inc(endpoint=endpoint, code=getattr(error, 'code', None) or type(error).__name__)
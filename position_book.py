@@ -0,0 +1,69 @@
+import time
+from threading import Lock
+
+
+class PositionSnapshot:
+    """账户持仓快照：一次请求全账户持仓并按交易对索引，供本轮所有按交易对的查询使用"""
+
+    def __init__(self, fetch_func, max_age=30):
+        """
+        初始化持仓快照
+        :param fetch_func: 获取futures_position_information全量数据的函数
+        :param max_age: 快照最长使用时间(秒)，超过后下次读取时重新请求
+        """
+        self.fetch_func = fetch_func
+        self.max_age = max_age
+        self.positions = {}  # 格式: {symbol: 持仓数据}
+        self.last_refresh_time = 0  # 上次刷新时间
+        self.dirty = True  # 下过单后标记为需要刷新
+        self.live = False  # 用户数据流可用时快照由推送维护，不按时间过期
+        self._lock = Lock()
+
+    def refresh(self):
+        """请求一次全账户持仓，失败时抛出异常并保留旧快照"""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        positions = self.fetch_func()
+        self.positions = {pos['symbol']: pos for pos in positions}
+        self.last_refresh_time = time.time()
+        self.dirty = False
+
+    def is_stale(self):
+        """快照是否需要重新请求"""
+        if self.dirty:
+            return True
+        return not self.live and time.time() - self.last_refresh_time > self.max_age
+
+    def _ensure_fresh(self):
+        if self.is_stale():
+            with self._lock:
+                # 等锁期间其他线程可能已经刷新过
+                if self.is_stale():
+                    self._refresh()
+
+    def invalidate(self):
+        """下单或撤单后调用，下次读取时重新请求"""
+        self.dirty = True
+
+    def patch(self, symbol, **fields):
+        """用已知的成交结果直接修改快照中的持仓，不重新请求"""
+        with self._lock:
+            position = self.positions.setdefault(symbol, {'symbol': symbol, 'positionAmt': '0',
+                                                          'entryPrice': '0', 'markPrice': '0'})
+            position.update({key: str(value) for key, value in fields.items()})
+
+    def peek(self, symbol):
+        """直接读取快照中的持仓，不触发请求（推送回调等高频路径使用）"""
+        return self.positions.get(symbol)
+
+    def get(self, symbol):
+        """获取指定交易对的持仓（包括数量为0的记录），不存在时返回None"""
+        self._ensure_fresh()
+        return self.positions.get(symbol)
+
+    def open_positions(self):
+        """获取所有数量不为0的持仓"""
+        self._ensure_fresh()
+        return [pos for pos in self.positions.values() if float(pos['positionAmt']) != 0]
@@ -0,0 +1,369 @@
+import os
+import json
+import time
+import logging
+import asyncio
+import tempfile
+from threading import Lock
+import metrics
+
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+except ImportError:
+    # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[限频] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('RateGovernor')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 各接口的请求权重（U本位合约，按python-binance方法名）
+ENDPOINT_WEIGHTS = {
+    'futures_ping': 1,
+    'futures_time': 1,
+    'futures_exchange_info': 1,
+    'futures_mark_price': 1,
+    'futures_account_balance': 5,
+    'futures_account': 5,
+    'futures_position_information': 5,
+    'futures_symbol_config': 5,
+    'futures_get_position_mode': 30,
+    'futures_change_position_mode': 1,
+    'futures_change_leverage': 1,
+    'futures_create_order': 0,
+    'futures_place_batch_order': 5,
+    'futures_get_order': 1,
+    'futures_cancel_order': 1,
+    'futures_cancel_orders': 1,
+    'futures_cancel_all_open_orders': 1,
+    'futures_stream_get_listen_key': 1,
+    'futures_stream_keepalive': 1,
+    'futures_stream_close': 1,
+}
+# 不带symbol参数时权重不同的接口: (带symbol, 不带symbol)
+SYMBOL_OPTIONAL_WEIGHTS = {
+    'futures_ticker': (1, 40),
+    'futures_symbol_ticker': (1, 2),
+    'futures_get_open_orders': (1, 40),
+    'futures_mark_price': (1, 10),
+}
+# 计入下单频率限制的接口
+ORDER_ENDPOINTS = {'futures_create_order', 'futures_place_batch_order'}
+
+# 限频窗口: 名称 -> (窗口长度(秒), 对应的响应头)
+WINDOWS = {
+    'weight_1m': (60, 'X-MBX-USED-WEIGHT-1M'),
+    'orders_10s': (10, 'X-MBX-ORDER-COUNT-10S'),
+    'orders_1m': (60, 'X-MBX-ORDER-COUNT-1M'),
+}
+
+
+class RateLimitTimeout(Exception):
+    """等待请求额度会超过调用方的截止时间，请求未发送"""
+
+
+def kline_weight(limit):
+    """K线接口权重随limit变化"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+def endpoint_weight(name, params=None):
+    """
+    计算一次请求的权重
+    :param name: python-binance方法名
+    :param params: 请求参数
+    """
+    params = params or {}
+    if name in ('futures_klines', 'futures_continous_klines', 'futures_mark_price_klines'):
+        return kline_weight(params.get('limit', 500))
+    if name in SYMBOL_OPTIONAL_WEIGHTS:
+        with_symbol, without_symbol = SYMBOL_OPTIONAL_WEIGHTS[name]
+        return with_symbol if params.get('symbol') else without_symbol
+    return ENDPOINT_WEIGHTS.get(name, 1)
+
+
+class RateGovernor:
+    """
+    请求权重限频器：按固定窗口计数（与币安按分钟重置的计数方式一致），
+    用响应头校准已用权重，状态保存在文件中供交易器和止盈监控器两个进程共享。
+
+    请求前在内存中的状态副本上占用额度，每隔sync_interval秒（或副本显示额度不足、触发封禁时）
+    才在文件锁下把本地新增的用量合并进共享文件并读回另一个进程的用量，
+    两个进程之间最多相差一个同步间隔的用量，由safety_ratio留出的余量覆盖
+    """
+
+    def __init__(self, weight_limit=2400, order_limit_10s=300, order_limit_1m=1200,
+                 safety_ratio=0.9, state_file=None, now_func=time.time, sync_interval=1.0):
+        """
+        初始化限频器
+        :param weight_limit: 每分钟请求权重上限
+        :param order_limit_10s: 每10秒下单数上限
+        :param order_limit_1m: 每分钟下单数上限
+        :param safety_ratio: 只使用上限的这个比例，给其他来源的请求留余量
+        :param state_file: 共享状态文件路径，None时使用系统临时目录
+        :param now_func: 时间函数(秒)，传入同步后的服务器时间可与币安窗口对齐
+        :param sync_interval: 内存状态与共享文件同步的最长间隔(秒)，0表示每次请求都读改写文件
+        """
+        self.limits = {
+            'weight_1m': int(weight_limit * safety_ratio),
+            'orders_10s': int(order_limit_10s * safety_ratio),
+            'orders_1m': int(order_limit_1m * safety_ratio),
+        }
+        self.state_file = state_file or os.path.join(tempfile.gettempdir(), 'binance_futures_rate_limit.json')
+        self.lock_file = self.state_file + '.lock'
+        self.now_func = now_func
+        self.sync_interval = sync_interval
+        self._lock = Lock()
+        self._state = None  # 共享状态在内存中的副本（包括尚未写入文件的本地用量）
+        self._synced_at = 0  # 上次与文件同步的时间(time.monotonic)
+        self._pending = {}  # 尚未写入文件的本地用量，格式: {窗口名: [窗口开始时间, 数量]}
+        self._server = {}  # 尚未写入文件的响应头计数，格式: {窗口名: [窗口开始时间, 数量]}
+        self._banned_until = 0  # 尚未写入文件的封禁截止时间
+        # 本地记录的已用权重（包括另一个进程的请求），抓取指标时读取
+        metrics.USED_WEIGHT.set_function(self.used_weight, window='weight_1m', source='governor')
+
+    def _read_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        with open(self.state_file, 'w') as f:
+            json.dump(state, f)
+
+    def _sync(self):
+        """
+        在文件锁下把本地新增的用量、响应头计数和封禁时间合并进共享文件，并用合并结果替换内存副本
+        （调用方需持有self._lock）
+        """
+        with open(self.lock_file, 'a+') as lf:
+            _lock_file(lf)
+            try:
+                state = self._read_state()
+                now = self.now_func()
+                for name in WINDOWS:
+                    window_start, count = self._window_count(state, name, now)
+                    pending = self._pending.get(name)
+                    if pending and pending[0] == window_start:
+                        count += pending[1]
+                    server = self._server.get(name)
+                    if server and server[0] == window_start:
+                        # 服务器计数包含其他来源的请求，取较大值
+                        count = max(count, server[1])
+                    state[name][1] = count
+                state['banned_until'] = max(state.get('banned_until', 0), self._banned_until)
+                self._write_state(state)
+            finally:
+                _unlock_file(lf)
+        self._state = state
+        self._synced_at = time.monotonic()
+        self._pending = {}
+        self._server = {}
+        self._banned_until = 0
+
+    def _cached_state(self):
+        """内存中的状态副本，超过同步间隔时先与共享文件同步（调用方需持有self._lock）"""
+        if self._state is None or time.monotonic() - self._synced_at >= self.sync_interval:
+            self._sync()
+        return self._state
+
+    @staticmethod
+    def _add(counts, name, window_start, value, merge):
+        """按窗口累计本地用量或记录响应头计数，进入新窗口时丢弃旧值"""
+        entry = counts.get(name)
+        if entry is None or entry[0] != window_start:
+            counts[name] = [window_start, value]
+        else:
+            entry[1] = merge(entry[1], value)
+
+    def _window_count(self, state, name, now):
+        """当前窗口已用数量，进入新窗口时归零"""
+        length = WINDOWS[name][0]
+        window_start = int(now // length * length)
+        start, count = state.get(name, [0, 0])
+        if start != window_start:
+            state[name] = [window_start, 0]
+            return window_start, 0
+        return window_start, count
+
+    def _wait_time(self, state, costs, now):
+        """按状态计算占用额度前需要等待的秒数，0表示可以立即占用"""
+        banned_until = state.get('banned_until', 0)
+        if now < banned_until:
+            return banned_until - now
+
+        wait = 0
+        for name, cost in costs.items():
+            window_start, count = self._window_count(state, name, now)
+            if cost and count + cost > self.limits[name]:
+                wait = max(wait, window_start + WINDOWS[name][0] - now)
+        return wait
+
+    def _try_acquire(self, costs):
+        """尝试占用额度，成功返回0，否则返回需要等待的秒数"""
+        with self._lock:
+            synced = self._state is None or time.monotonic() - self._synced_at >= self.sync_interval
+            if synced:
+                self._sync()
+            state = self._state
+            now = self.now_func()
+            wait = self._wait_time(state, costs, now)
+            if wait and not synced:
+                # 内存副本显示额度不足时，先读回文件中的最新状态再决定是否等待
+                self._sync()
+                state = self._state
+                wait = self._wait_time(state, costs, now)
+            if wait:
+                return wait
+
+            for name, cost in costs.items():
+                state[name][1] += cost
+                self._add(self._pending, name, state[name][0], cost, lambda a, b: a + b)
+            return 0
+
+    def _costs(self, name, params):
+        costs = {'weight_1m': endpoint_weight(name, params)}
+        if name in ORDER_ENDPOINTS:
+            costs['orders_10s'] = 1
+            costs['orders_1m'] = 1
+        return costs
+
+    @staticmethod
+    def _check_wait(name, wait, start, max_wait):
+        """等待后会超过max_wait时抛出RateLimitTimeout"""
+        if max_wait is not None and time.perf_counter() - start + wait > max_wait:
+            metrics.RATE_LIMIT_WAIT.observe(time.perf_counter() - start, endpoint=name)
+            raise RateLimitTimeout(f"请求额度不足，{name} 需要等待 {wait:.2f} 秒，超过截止时间")
+
+    def acquire(self, name, params=None, max_wait=None):
+        """
+        请求前调用：额度不足时提前等待到下一个窗口，而不是触发429/418
+        :param name: python-binance方法名
+        :param params: 请求参数
+        :param max_wait: 最长等待时间(秒)，需要等得更久时抛出RateLimitTimeout，None表示一直等待
+        """
+        costs = self._costs(name, params)
+        start = time.perf_counter()
+        while True:
+            wait = self._try_acquire(costs)
+            if not wait:
+                metrics.RATE_LIMIT_WAIT.observe(time.perf_counter() - start, endpoint=name)
+                return
+            self._check_wait(name, wait, start, max_wait)
+            logger.info(f"请求额度不足，{name} 等待 {wait:.2f} 秒")
+            time.sleep(wait + 0.05)
+
+    async def acquire_async(self, name, params=None, max_wait=None):
+        """acquire的异步版本，文件锁在线程中获取，等待时不阻塞事件循环"""
+        costs = self._costs(name, params)
+        start = time.perf_counter()
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, costs)
+            if not wait:
+                metrics.RATE_LIMIT_WAIT.observe(time.perf_counter() - start, endpoint=name)
+                return
+            self._check_wait(name, wait, start, max_wait)
+            logger.info(f"请求额度不足，{name} 等待 {wait:.2f} 秒")
+            await asyncio.sleep(wait + 0.05)
+
+    def on_response(self, response, *args, **kwargs):
+        """requests响应钩子"""
+        self.update_from_headers(response.status_code, response.headers)
+
+    def trace_config(self):
+        """
+        AsyncClient使用的aiohttp请求跟踪配置（作为session_params的trace_configs传入），
+        每个请求结束时用它自己的响应头校准额度，并发请求之间不会读到其他请求的响应
+        """
+        import aiohttp
+
+        async def on_request_end(session, context, params):
+            await asyncio.to_thread(self.update_from_headers, params.response.status, params.response.headers)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def update_from_headers(self, status_code, headers):
+        """
+        用响应头校准已用额度，遇到429/418记录封禁截止时间
+        :param status_code: HTTP状态码
+        :param headers: 响应头（不区分大小写）
+        """
+        if not any(header in headers for _, header in WINDOWS.values()) and status_code not in (418, 429):
+            return
+
+        try:
+            with self._lock:
+                state = self._cached_state()
+                now = self.now_func()
+                for name, (_, header) in WINDOWS.items():
+                    value = headers.get(header)
+                    if value is None:
+                        continue
+                    metrics.USED_WEIGHT.set(int(value), window=name, source='server')
+                    window_start, _ = self._window_count(state, name, now)
+                    # 服务器计数包含其他来源的请求，取较大值；下次同步时写入文件
+                    state[name][1] = max(state[name][1], int(value))
+                    self._add(self._server, name, window_start, int(value), max)
+                if status_code in (418, 429):
+                    retry_after = int(headers.get('Retry-After', 60))
+                    self._banned_until = now + retry_after
+                    # 封禁需要立即让另一个进程看到
+                    self._sync()
+                    metrics.RATE_LIMIT_BANS.inc(status=status_code)
+                    logger.error(f"触发限频({status_code})，暂停请求 {retry_after} 秒")
+        except Exception as e:
+            logger.error(f"更新限频状态失败: {str(e)}")
+
+    def install(self, client):
+        """在客户端的requests会话上注册响应钩子（重复调用只注册一次）"""
+        hooks = client.session.hooks.setdefault('response', [])
+        if self.on_response not in hooks:
+            hooks.append(self.on_response)
+
+    def used_weight(self):
+        """当前窗口已用权重（只读：使用内存副本，副本过期时只读取文件，不加文件锁也不写入）"""
+        length = WINDOWS['weight_1m'][0]
+        window_start = int(self.now_func() // length * length)
+        with self._lock:
+            if self._state is not None and time.monotonic() - self._synced_at < self.sync_interval:
+                state, extra = self._state, 0
+            else:
+                state = self._read_state()
+                pending = self._pending.get('weight_1m')
+                extra = pending[1] if pending and pending[0] == window_start else 0
+            start, count = state.get('weight_1m', [0, 0])
+            return (count if start == window_start else 0) + extra
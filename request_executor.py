@@ -0,0 +1,279 @@
+import time
+import uuid
+import random
+import asyncio
+import logging
+from binance.client import Client
+from binance.exceptions import BinanceAPIException, BinanceOrderException
+import metrics
+from rate_governor import RateLimitTimeout
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[请求] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('RequestExecutor')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 错误处理策略
+RETRY = 'retry'  # 退避后重试
+RESYNC = 'resync'  # 请求后台重新同步时间，退避后重试
+FAIL = 'fail'  # 直接抛出，不重试
+AMBIGUOUS = 'ambiguous'  # 请求可能已被服务器执行（超时、5xx），下单接口需要先确认订单状态
+
+# 时间戳错误
+RESYNC_CODES = {1021, -1021}
+# 重试也不会成功的错误
+FAIL_FAST_CODES = {
+    -4059,  # 不需要更改持仓模式
+    -4046,  # 不需要更改保证金模式
+    -1013,  # 数量/价格不符合过滤器
+    -1111,  # 精度超出限制
+    -1102, -1106, -1100,  # 参数缺失或非法
+    -1121,  # 交易对不存在
+    -2014, -2015,  # API Key无效或无权限
+    -2019,  # 保证金不足
+    -2021,  # 止损单会立即触发
+    -2022,  # reduceOnly订单被拒绝
+    -2011, -2013,  # 撤单/查询的订单不存在
+    -4003,  # 数量小于等于0
+    -4130,  # 已存在closePosition止损单
+    -4164,  # 名义价值过小
+}
+# 服务器未知执行结果的错误
+AMBIGUOUS_CODES = {-1006, -1007}
+# 重复的客户端订单号：说明首次请求已经下单成功
+DUPLICATE_CLIENT_ORDER_ID = -4116
+# 需要保证幂等的下单接口
+ORDER_ENDPOINTS = {'futures_create_order'}
+
+
+def classify_error(e):
+    """
+    根据异常类型和错误码选择处理策略
+    :return: RETRY / RESYNC / FAIL / AMBIGUOUS
+    """
+    code = getattr(e, 'code', None)
+    if code in RESYNC_CODES:
+        return RESYNC
+    if code in FAIL_FAST_CODES:
+        return FAIL
+    if code in AMBIGUOUS_CODES:
+        return AMBIGUOUS
+    if isinstance(e, BinanceOrderException):
+        # 本地参数校验失败
+        return FAIL
+    if isinstance(e, RateLimitTimeout):
+        # 请求未发送，截止时间前拿不到额度
+        return FAIL
+    if isinstance(e, BinanceAPIException):
+        status = e.status_code or 0
+        if status in (418, 429) or code == -1003:
+            # 限频器已记录封禁时间，重试时会先等待
+            return RETRY
+        if status >= 500:
+            return AMBIGUOUS
+        if 400 <= status < 500:
+            return FAIL
+        return RETRY
+    # 网络错误、超时、非JSON响应：请求是否到达服务器未知
+    return AMBIGUOUS
+
+
+def new_client_order_id():
+    """生成客户端订单号（币安限制36个字符以内）"""
+    return 'bot_' + uuid.uuid4().hex[:28]
+
+
+class RequestExecutor:
+    """
+    统一的请求执行器：限频、按错误码选择重试策略、带抖动的指数退避、单次调用截止时间，
+    下单接口使用客户端订单号保证重试不会重复下单
+    """
+
+    def __init__(self, rate_governor=None, time_sync=None, max_retries=3, base_delay=0.5,
+                 max_delay=8, deadline=30, request_timeout=10):
+        """
+        初始化请求执行器
+        :param rate_governor: RateGovernor实例，None时不限频
+        :param time_sync: 时间同步管理器，收到1021错误时调用其request_sync由后台线程同步
+        :param max_retries: 最大尝试次数
+        :param base_delay: 首次重试延迟(秒)
+        :param max_delay: 最大重试延迟(秒)
+        :param deadline: 单次调用(包括重试)的默认截止时间(秒)
+        :param request_timeout: 单个HTTP请求的超时时间(秒)
+        """
+        self.rate_governor = rate_governor
+        self.time_sync = time_sync
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.request_timeout = request_timeout
+
+    def _backoff(self, attempt):
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _resync(self):
+        """请求后台线程重新同步时间（不阻塞交易线程），同步耗时由重试前的退避吸收"""
+        if self.time_sync is not None and hasattr(self.time_sync, 'request_sync'):
+            metrics.TIME_RESYNCS.inc()
+            self.time_sync.request_sync()
+
+    @staticmethod
+    def _prepare(request_func, kwargs):
+        """下单接口补充客户端订单号，返回接口名"""
+        name = getattr(request_func, '__name__', '')
+        if name in ORDER_ENDPOINTS and not kwargs.get('newClientOrderId'):
+            kwargs['newClientOrderId'] = new_client_order_id()
+        return name
+
+    def _next_step(self, name, e, attempt, end_time):
+        """
+        决定失败后的下一步
+        :return: (策略, 重试前等待秒数)，策略为FAIL时应抛出异常
+        """
+        policy = classify_error(e)
+        if policy == FAIL or attempt + 1 >= self.max_retries:
+            return FAIL, 0
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= end_time:
+            logger.warning(f"{name} 超过截止时间，不再重试")
+            return FAIL, 0
+        logger.warning(f"{name} 请求失败 (尝试 {attempt + 1}/{self.max_retries}): {str(e)}，{delay:.2f}秒后重试")
+        metrics.REQUEST_RETRIES.inc(endpoint=name, policy=policy)
+        return policy, delay
+
+    def execute(self, request_func, *args, deadline=None, **kwargs):
+        """
+        执行一次REST请求
+        :param request_func: python-binance客户端方法
+        :param deadline: 本次调用的截止时间(秒)，None时使用默认值
+        """
+        name = self._prepare(request_func, kwargs)
+        end_time = time.monotonic() + (deadline or self.deadline)
+        client = getattr(request_func, '__self__', None)
+        # 上一次下单结果未知，重发前先查询
+        confirm_order = False
+        for attempt in range(self.max_retries):
+            try:
+                if confirm_order:
+                    order = self._find_order(client, kwargs, end_time)
+                    if order is not None:
+                        return order
+                    confirm_order = False
+                if self.rate_governor is not None:
+                    self.rate_governor.acquire(name, kwargs, max_wait=end_time - time.monotonic())
+                if isinstance(client, Client) and self.request_timeout:
+                    remaining = max(0.1, end_time - time.monotonic())
+                    kwargs['requests_params'] = {'timeout': min(self.request_timeout, remaining)}
+                return self._call(name, request_func, args, kwargs)
+            except Exception as e:
+                if getattr(e, 'code', None) == DUPLICATE_CLIENT_ORDER_ID and name in ORDER_ENDPOINTS:
+                    order = self._find_order(client, kwargs, end_time)
+                    if order is not None:
+                        return order
+                policy, delay = self._next_step(name, e, attempt, end_time)
+                if policy == FAIL:
+                    raise
+                if policy == RESYNC:
+                    self._resync()
+                if policy == AMBIGUOUS and name in ORDER_ENDPOINTS:
+                    confirm_order = True
+                time.sleep(delay)
+        raise Exception("未知请求错误")
+
+    @staticmethod
+    def _call(name, request_func, args, kwargs):
+        """发送请求并记录耗时和结果"""
+        start = time.perf_counter()
+        try:
+            result = request_func(*args, **kwargs)
+        except Exception as e:
+            metrics.observe_request(name, time.perf_counter() - start, e)
+            raise
+        metrics.observe_request(name, time.perf_counter() - start)
+        return result
+
+    def _find_order(self, client, kwargs, end_time):
+        """
+        按客户端订单号查询订单，确认结果未知的下单是否已成交
+        :param end_time: 调用的截止时间(time.monotonic)
+        :return: 订单信息，订单不存在时返回None；查询失败时抛出异常
+        """
+        try:
+            if self.rate_governor is not None:
+                self.rate_governor.acquire('futures_get_order', kwargs, max_wait=end_time - time.monotonic())
+            order = client.futures_get_order(symbol=kwargs['symbol'], origClientOrderId=kwargs['newClientOrderId'])
+        except BinanceAPIException as e:
+            if e.code == -2013:
+                return None
+            raise
+        logger.info(f"{kwargs['symbol']} 订单 {kwargs['newClientOrderId']} 已在服务器执行，不再重复下单")
+        return order
+
+    async def execute_async(self, request_func, *args, deadline=None, semaphore=None, **kwargs):
+        """
+        execute的异步版本（AsyncClient方法）
+        :param semaphore: 限制同时进行的请求数
+        """
+        name = self._prepare(request_func, kwargs)
+        end_time = time.monotonic() + (deadline or self.deadline)
+        client = getattr(request_func, '__self__', None)
+        confirm_order = False
+        for attempt in range(self.max_retries):
+            try:
+                if confirm_order:
+                    order = await self._find_order_async(client, kwargs, end_time)
+                    if order is not None:
+                        return order
+                    confirm_order = False
+                if self.rate_governor is not None:
+                    await self.rate_governor.acquire_async(name, kwargs, max_wait=end_time - time.monotonic())
+                remaining = max(0.1, end_time - time.monotonic())
+                if semaphore is None:
+                    return await self._call_async(name, request_func, args, kwargs, remaining)
+                async with semaphore:
+                    return await self._call_async(name, request_func, args, kwargs, remaining)
+            except Exception as e:
+                if getattr(e, 'code', None) == DUPLICATE_CLIENT_ORDER_ID and name in ORDER_ENDPOINTS:
+                    order = await self._find_order_async(client, kwargs, end_time)
+                    if order is not None:
+                        return order
+                policy, delay = self._next_step(name, e, attempt, end_time)
+                if policy == FAIL:
+                    raise
+                if policy == RESYNC:
+                    self._resync()
+                if policy == AMBIGUOUS and name in ORDER_ENDPOINTS:
+                    confirm_order = True
+                await asyncio.sleep(delay)
+        raise Exception("未知请求错误")
+
+    @staticmethod
+    async def _call_async(name, request_func, args, kwargs, timeout):
+        """发送请求并记录耗时和结果（响应头由RateGovernor.trace_config按请求校准额度）"""
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(request_func(*args, **kwargs), timeout)
+        except Exception as e:
+            metrics.observe_request(name, time.perf_counter() - start, e)
+            raise
+        metrics.observe_request(name, time.perf_counter() - start)
+        return result
+
+    async def _find_order_async(self, client, kwargs, end_time):
+        try:
+            if self.rate_governor is not None:
+                await self.rate_governor.acquire_async('futures_get_order', kwargs,
+                                                       max_wait=end_time - time.monotonic())
+            order = await client.futures_get_order(symbol=kwargs['symbol'],
+                                                   origClientOrderId=kwargs['newClientOrderId'])
+        except BinanceAPIException as e:
+            if e.code == -2013:
+                return None
+            raise
+        logger.info(f"{kwargs['symbol']} 订单 {kwargs['newClientOrderId']} 已在服务器执行，不再重复下单")
+        return order
@@ -30,10 +30,10 @@ if errorlevel 1 (
 
 :: Check and install dependencies
 echo Checking dependencies...
-%PYTHON_PATH% -c "import pandas" >nul 2>&1
+%PYTHON_PATH% -c "import numpy" >nul 2>&1
 if errorlevel 1 (
-    echo Installing pandas...
-    %PYTHON_PATH% -m pip install pandas
+    echo Installing numpy...
+    %PYTHON_PATH% -m pip install numpy
 )
 
 %PYTHON_PATH% -c "import binance" >nul 2>&1
@@ -55,18 +55,15 @@ if not exist "logs" mkdir logs
 echo.
 echo Starting Binance Trading System...
 echo Start time: %date% %time%
-echo Main program runs in current window, take profit monitor runs in new window
-echo Press Ctrl+C to safely stop the program in current window
+echo Trading strategy and take profit monitor run in one process in current window
+echo Press Ctrl+C to safely stop the program
 echo.
 
-:: Start take profit monitor in new window
-start "Binance Take Profit" cmd /k "%PYTHON_PATH% binance_take_profit.py"
-
 :: Set console window title
 title Binance Trading Bot
 
-:: Run main program in current window
-%PYTHON_PATH% binance_main.py
+:: Run trader and take profit monitor in one process (shared clock, connections and position data)
+%PYTHON_PATH% binance_supervisor.py
 
 :: Post-processing after program ends
 if errorlevel 1 (
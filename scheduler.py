@@ -0,0 +1,138 @@
+import time
+import logging
+from datetime import datetime
+from threading import Event
+import metrics
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[调度] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('Scheduler')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+class HourlyJob:
+    """每小时在固定的分:秒执行一次的任务"""
+
+    def __init__(self, name, func, minute, second=0, max_lateness=None):
+        """
+        :param name: 任务名称
+        :param func: 任务函数
+        :param minute: 每小时的第几分钟
+        :param second: 该分钟的第几秒
+        :param max_lateness: 最多允许延迟多少秒执行，超过时跳过本次(None表示总是补执行)
+        """
+        self.name = name
+        self.func = func
+        self.offset = minute * 60 + second  # 距整点的秒数
+        self.max_lateness = max_lateness
+        self.last_slot = None  # 上次执行(或跳过)的时间点
+        self.last_lateness = None  # 上次执行相对目标时间的延迟(秒)
+
+    def slot_at(self, now):
+        """now之前(含)最近一次应执行的时间点"""
+        return (now - self.offset) // 3600 * 3600 + self.offset
+
+    def next_slot(self, now):
+        """下一次尚未执行的时间点"""
+        slot = self.slot_at(now)
+        if slot == self.last_slot:
+            slot += 3600
+        return slot
+
+
+class Scheduler:
+    """
+    按服务器时间对齐的任务调度器：用同步后的时钟计算下一个目标时间，
+    用单调时钟睡眠到目标时间，每个任务每个时间点只执行一次，错过的时间点立即补执行
+    """
+
+    def __init__(self, now_func=time.time, poll_interval=30):
+        """
+        :param now_func: 返回服务器时间(秒)的函数
+        :param poll_interval: 长时间等待时重新读取服务器时间的间隔(秒)，时钟重新同步后可及时修正
+        """
+        self.now_func = now_func
+        self.poll_interval = poll_interval
+        self.jobs = []
+        self._stop_event = Event()
+
+    def add_job(self, name, func, minute, second=0, max_lateness=None):
+        """
+        添加每小时任务，启动时已经过去的时间点不补执行
+        :return: HourlyJob实例
+        """
+        job = HourlyJob(name, func, minute, second, max_lateness)
+        job.last_slot = job.slot_at(self.now_func())
+        self.jobs.append(job)
+        return job
+
+    def run_pending(self):
+        """
+        执行所有已到时间的任务（按目标时间先后）
+        :return: 执行的任务数
+        """
+        count = 0
+        while True:
+            now = self.now_func()
+            due = [(job.next_slot(now), job) for job in self.jobs if job.next_slot(now) <= now]
+            if not due:
+                return count
+            slot, job = min(due, key=lambda item: item[0])
+            self._run_job(job, slot, now)
+            count += 1
+
+    def _run_job(self, job, slot, now):
+        job.last_slot = slot
+        lateness = now - slot
+        target = datetime.fromtimestamp(slot).strftime('%H:%M:%S')
+        if job.max_lateness is not None and lateness > job.max_lateness:
+            logger.warning(f"{job.name} 错过目标时间 {target} {lateness:.3f}秒，跳过本次")
+            metrics.JOB_SKIPPED.inc(job=job.name)
+            return
+        job.last_lateness = lateness
+        metrics.JOB_LATENESS.set(lateness, job=job.name)
+        logger.info(f"{job.name} 目标时间 {target}，延迟 {lateness * 1000:.0f}ms")
+        try:
+            with metrics.JOB_DURATION.time(job=job.name):
+                job.func()
+        except Exception as e:
+            metrics.JOB_FAILURES.inc(job=job.name)
+            logger.error(f"{job.name} 执行失败: {str(e)}")
+
+    def seconds_until_next(self):
+        """距下一个任务的秒数(服务器时间)"""
+        now = self.now_func()
+        return min(job.next_slot(now) for job in self.jobs) - now
+
+    def sleep_until_next(self):
+        """
+        睡眠到下一个任务的目标时间
+        :return: 是否因stop()提前结束
+        """
+        while not self._stop_event.is_set():
+            remaining = self.seconds_until_next()
+            if remaining <= 0:
+                return False
+            # 换算到单调时钟，不受本地系统时间调整影响
+            deadline = time.monotonic() + min(remaining, self.poll_interval)
+            while True:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                if self._stop_event.wait(wait):
+                    return True
+        return True
+
+    def run_forever(self):
+        """循环执行任务直到stop()"""
+        self._stop_event.clear()
+        while not self._stop_event.is_set():
+            self.run_pending()
+            self.sleep_until_next()
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+def evaluate_matrix(opens, close_matrix, valid, short_window=20, long_window=60, max_change_pct=4):
+    """
+    对多个交易对一次性计算均线并判断开仓信号
+    :param opens: 每个交易对最新K线的开盘价，形状(n,)
+    :param close_matrix: 每个交易对最近long_window根收盘价，形状(n, long_window)，最后一列为最新K线
+    :param valid: 数据是否足够的布尔数组，形状(n,)
+    :return: (ma_short, ma_long, long_mask, short_mask)
+    """
+    closes = close_matrix[:, -1]
+    ma_short = close_matrix[:, -short_window:].mean(axis=1)
+    ma_long = close_matrix.mean(axis=1)
+    long_mask, short_mask = signal_masks(opens, closes, ma_short, ma_long, valid, max_change_pct)
+    return ma_short, ma_long, long_mask, short_mask
+
+
+def signal_masks(opens, closes, ma_short, ma_long, valid, max_change_pct=4):
+    """
+    开仓信号判断（实盘和回测共用），参数为形状相同的数组
+    :return: (long_mask, short_mask)
+    """
+    # 当前K线涨跌幅（基于开盘价和收盘价）
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_change = (closes - opens) / opens * 100
+    small_change = np.abs(price_change) < max_change_pct  # 涨跌幅小于4%
+
+    # 开多: 收盘价 > MA60 > MA20 > 开盘价
+    long_mask = valid & small_change & (closes > ma_long) & (ma_long > ma_short) & (ma_short > opens)
+    # 开空: 收盘价 < MA60 < MA20 < 开盘价
+    short_mask = valid & small_change & (closes < ma_long) & (ma_long < ma_short) & (ma_short < opens)
+    return long_mask, short_mask
+
+
+class SignalEngine:
+    """批量信号引擎：把所有监控交易对的收盘价放进一个二维矩阵，一次计算MA20/MA60和开仓信号"""
+
+    def __init__(self, kline_store, short_window=20, long_window=60):
+        """
+        初始化信号引擎
+        :param kline_store: KlineStore实例
+        :param short_window: 短均线周期
+        :param long_window: 长均线周期
+        """
+        self.kline_store = kline_store
+        self.short_window = short_window
+        self.long_window = long_window
+        # 复用的缓冲区，交易对数量增加时才重新分配
+        self._rows = 0
+        self._alloc(64)
+
+    def _alloc(self, rows):
+        self._rows = rows
+        self._closes = np.zeros((rows, self.long_window), dtype=np.float64)
+        self._opens = np.zeros(rows, dtype=np.float64)
+        self._highs = np.zeros(rows, dtype=np.float64)
+        self._lows = np.zeros(rows, dtype=np.float64)
+        self._valid = np.zeros(rows, dtype=bool)
+
+    def evaluate(self, symbols):
+        """
+        计算一批交易对的指标和信号
+        :param symbols: 交易对列表（K线需已在kline_store中更新）
+        :return: {symbol: {'open', 'high', 'low', 'close', 'ma_20', 'ma_60', 'long_signal', 'short_signal'}}，
+                 数据不足的交易对不包含在结果中
+        """
+        n = len(symbols)
+        if n == 0:
+            return {}
+        if n > self._rows:
+            self._alloc(max(n, self._rows * 2))
+
+        closes, opens, highs, lows, valid = (self._closes[:n], self._opens[:n], self._highs[:n],
+                                             self._lows[:n], self._valid[:n])
+        valid[:] = False
+        for i, symbol in enumerate(symbols):
+            if self.kline_store.size(symbol) < self.long_window:
+                continue
+            buffer = self.kline_store.buffers[symbol]
+            closes[i] = buffer.get('close', self.long_window)
+            last = buffer.last()
+            opens[i] = last['open']
+            highs[i] = last['high']
+            lows[i] = last['low']
+            valid[i] = True
+
+        ma_short, ma_long, long_mask, short_mask = evaluate_matrix(
+            opens, closes, valid, self.short_window, self.long_window)
+
+        results = {}
+        for i in np.flatnonzero(valid):
+            results[symbols[i]] = {
+                'open': float(opens[i]),
+                'high': float(highs[i]),
+                'low': float(lows[i]),
+                'close': float(closes[i, -1]),
+                'ma_20': float(ma_short[i]),
+                'ma_60': float(ma_long[i]),
+                'long_signal': bool(long_mask[i]),
+                'short_signal': bool(short_mask[i]),
+            }
+        return results
@@ -0,0 +1,53 @@
+# 策略规则：止损价、跟踪止损条件、止盈倍数和数量取整，供同步交易器、异步引擎和止盈监控器共用
+
+STOP_LOSS_BUFFER = 0.999  # 多单止损放在K线最低价下方0.1%
+TRAIL_TRIGGER_PCT = 1.0  # 当前小时K线涨跌幅达到1%时上移/下移止损
+
+
+def round_step(quantity, step_size):
+    """把数量调整为stepSize的整数倍"""
+    return round(quantity / step_size) * step_size
+
+
+def format_quantity(quantity, precision=None):
+    """格式化数量，避免科学计数法或多余小数"""
+    try:
+        quantity_str = f"{quantity:.{precision}f}"
+        return float(quantity_str.rstrip('0').rstrip('.') if '.' in quantity_str else quantity_str)
+    except:
+        # 如果无法获取quantityPrecision，使用备用方法
+        return float(
+            f"{quantity:.8f}".rstrip('0').rstrip('.') if '.' in f"{quantity:.8f}" else f"{quantity:.0f}")
+
+
+def stop_price(is_long, kline, price_precision):
+    """
+    根据K线计算止损价
+    :param is_long: 是否是多单
+    :param kline: 包含high/low的K线
+    :param price_precision: 价格精度
+    """
+    if is_long:
+        # 多单止损在K线最低价下方0.1%的位置
+        return round(kline['low'] * STOP_LOSS_BUFFER, price_precision)
+    # 空单止损在K线最高价
+    return round(kline['high'], price_precision)
+
+
+def should_trail_stop(is_long, price_change_pct):
+    """当前小时K线涨跌幅是否满足止损调整条件"""
+    if is_long:
+        return price_change_pct >= TRAIL_TRIGGER_PCT
+    return price_change_pct <= -TRAIL_TRIGGER_PCT
+
+
+def price_ratio(position_amt, entry_price, current_price):
+    """当前价格相对开仓价的有利倍数（空单取倒数）"""
+    return current_price / entry_price if position_amt > 0 else entry_price / current_price
+
+
+def profit_percent(position_amt, entry_price, current_price):
+    """盈利百分比 - 考虑多单和空单的不同计算方式"""
+    if position_amt > 0:  # 多单
+        return ((current_price - entry_price) / entry_price) * 100
+    return ((entry_price - current_price) / entry_price) * 100  # 空单
@@ -0,0 +1,129 @@
+import time
+import heapq
+import logging
+from threading import Lock
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[交易对池] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('SymbolUniverse')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 全市场24小时行情推送流（每秒推送有变化的交易对）
+TICKER_STREAM = '!ticker@arr'
+
+
+class SymbolUniverse:
+    """交易量前K交易对池，跟随!ticker@arr行情流或批量轮询实时维护排名"""
+
+    def __init__(self, exchange_info, limit=28, exclude=None, on_change=None, stale_after=30):
+        """
+        初始化交易对池
+        :param exchange_info: ExchangeInfoCache实例，用于筛选正在交易的USDT永续合约
+        :param limit: 保留的交易对数量
+        :param exclude: 排除的交易对列表
+        :param on_change: 排名变化时的回调 on_change(added, removed)
+        :param stale_after: 行情流超过多少秒无消息视为失效(秒)
+        """
+        self.exchange_info = exchange_info
+        self.limit = limit
+        self.exclude = set(exclude or [])
+        self.on_change = on_change
+        self.stale_after = stale_after
+        self.volumes = {}  # 格式: {symbol: 24小时成交额(USDT)}
+        self.prices = {}  # 格式: {symbol: 最新成交价}
+        self.top = []  # 按成交额降序排列的前K交易对
+        self.eligible = set()  # 可入选的交易对集合
+        self.last_message_time = 0  # 上次收到行情流消息的时间
+        self.stream_name = None  # 行情流名称
+        self._lock = Lock()
+        self.refresh_eligible()
+
+    def refresh_eligible(self):
+        """根据交易所信息缓存更新可入选交易对集合，剔除已下架的交易对"""
+        eligible = self.exchange_info.tradable_symbols(exclude=self.exclude)
+        with self._lock:
+            self.eligible = eligible
+            for symbol in list(self.volumes):
+                if symbol not in eligible:
+                    del self.volumes[symbol]
+                    self.prices.pop(symbol, None)
+
+    def update_tickers(self, tickers):
+        """
+        用一批行情数据更新成交额并重新排名
+        :param tickers: REST futures_ticker返回的列表，或!ticker@arr推送的列表
+        :return: (added, removed) 本次进入和退出前K的交易对
+        """
+        with self._lock:
+            for ticker in tickers:
+                # REST字段为symbol/quoteVolume，推送字段为s/q
+                symbol = ticker.get('symbol') or ticker.get('s')
+                if symbol not in self.eligible:
+                    continue
+                volume = ticker.get('quoteVolume', ticker.get('q'))
+                if volume is not None:
+                    self.volumes[symbol] = float(volume)
+                price = ticker.get('lastPrice', ticker.get('c'))
+                if price is not None:
+                    self.prices[symbol] = float(price)
+
+            new_top = heapq.nlargest(self.limit, self.volumes, key=self.volumes.get)
+            old_set, new_set = set(self.top), set(new_top)
+            added = [s for s in new_top if s not in old_set]
+            removed = [s for s in self.top if s not in new_set]
+            self.top = new_top
+
+        if (added or removed) and self.on_change:
+            try:
+                self.on_change(added, removed)
+            except Exception as e:
+                logger.error(f"处理交易对变化回调失败: {str(e)}")
+        return added, removed
+
+    def poll(self, fetch_func):
+        """
+        批量轮询一次全部行情（行情流不可用时的后备方式）
+        :param fetch_func: 获取futures_ticker全量数据的函数
+        """
+        self.refresh_eligible()
+        return self.update_tickers(fetch_func())
+
+    def last_prices(self):
+        """所有可入选交易对的最新成交价（行情流正常时每秒更新），格式: {symbol: price}"""
+        with self._lock:
+            return dict(self.prices)
+
+    def top_symbols(self):
+        """当前交易量前K的交易对（按成交额降序）"""
+        return list(self.top)
+
+    def start_stream(self, socket_manager):
+        """
+        订阅!ticker@arr行情流
+        :param socket_manager: 已启动的ThreadedWebsocketManager
+        """
+        self.stream_name = socket_manager.start_futures_multiplex_socket(
+            callback=self._handle_message,
+            streams=[TICKER_STREAM]
+        )
+        return self.stream_name
+
+    def _handle_message(self, msg):
+        """行情流消息回调"""
+        if not isinstance(msg, dict):
+            return
+        if msg.get('e') == 'error':
+            logger.error(f"行情流错误: {msg.get('m')}")
+            return
+        data = msg.get('data', msg)
+        if isinstance(data, list):
+            self.last_message_time = time.time()
+            self.update_tickers(data)
+
+    def is_live(self):
+        """行情流是否在正常推送"""
+        return time.time() - self.last_message_time <= self.stale_after
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import unittest
+from binance.enums import SIDE_BUY, SIDE_SELL
+from exchange_simulator import SimulatedExchange, SimulatedClient, SimulatedSocketManager
+from rate_governor import RateGovernor
+from binance_main import BinanceFuturesTrader
+
+
+class DeferredExecutor:
+    """代替交易器线程池：提交的任务先暂存，由测试决定何时执行，使后台清理与下单的先后顺序可控"""
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, func, *args):
+        self.pending.append((func, args))
+
+    def run_pending(self):
+        pending, self.pending = self.pending, []
+        for func, args in pending:
+            func(*args)
+
+    def shutdown(self, wait=True):
+        self.pending = []
+
+
+class SimulatedTradingTest(unittest.TestCase):
+    """在模拟交易所上运行交易器的开仓、止损和反手流程，检查最终的持仓和挂单"""
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.exchange = SimulatedExchange(symbols=5, seed=7, balance=1e7, latency_scale=0)
+        self.trader = BinanceFuturesTrader(
+            '', '',
+            client=SimulatedClient(self.exchange),
+            socket_manager=SimulatedSocketManager(self.exchange),
+            rate_governor=RateGovernor(state_file=os.path.join(self.state_dir, 'governor.json'))
+        )
+        self.trader.executor = DeferredExecutor()
+        self.symbol = self.exchange.symbols[0]
+
+    def tearDown(self):
+        self.trader.stop()
+        shutil.rmtree(self.state_dir, ignore_errors=True)
+
+    def _signal(self, long_signal):
+        kline = self.trader.get_current_hour_klines(self.symbol)
+        self.assertIsNotNone(kline)
+        return dict(kline, long_signal=long_signal, short_signal=not long_signal)
+
+    def _open_stops(self):
+        return [order for order in self.exchange.open_orders(self.symbol) if order['type'] == 'STOP_MARKET']
+
+    def _position_amt(self):
+        return self.exchange.positions.get(self.symbol, (0.0, 0.0))[0]
+
+    def assert_protected(self, side):
+        """持仓方向与side一致，且只有一个覆盖全部仓位的反向止损单，并记录在order_relations中"""
+        amt = self._position_amt()
+        self.assertGreater(amt if side == SIDE_BUY else -amt, 0)
+        stops = self._open_stops()
+        self.assertEqual(len(stops), 1)
+        stop = stops[0]
+        self.assertEqual(stop['side'], SIDE_SELL if side == SIDE_BUY else SIDE_BUY)
+        self.assertTrue(stop['reduceOnly'])
+        self.assertAlmostEqual(float(stop['origQty']), abs(amt))
+        self.assertEqual(self.trader.order_relations[self.symbol]['stop_loss'], stop['orderId'])
+        return stop
+
+    def test_open_long_places_stop_loss(self):
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=True))
+
+        stop = self.assert_protected(SIDE_BUY)
+        self.assertLess(float(stop['stopPrice']), self.exchange.markets[self.symbol]['price'])
+        self.assertTrue(self.trader.stream_live())
+        self.assertAlmostEqual(float(self.trader.get_position(self.symbol)['positionAmt']), self._position_amt())
+
+    def test_same_direction_signal_does_not_add_to_position(self):
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=True))
+        amt = self._position_amt()
+        stop = self.assert_protected(SIDE_BUY)
+
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=True))
+
+        self.assertEqual(self._position_amt(), amt)
+        self.assertEqual(self.assert_protected(SIDE_BUY)['orderId'], stop['orderId'])
+
+    def test_stop_fill_clears_order_relations(self):
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=True))
+        stop = self.assert_protected(SIDE_BUY)
+
+        self.exchange.set_price(self.symbol, float(stop['stopPrice']) * 0.99)
+        self.assertEqual(self._position_amt(), 0.0)
+        self.assertEqual(self.exchange.orders[stop['orderId']]['status'], 'FILLED')
+
+        self.trader.executor.run_pending()
+        self.assertNotIn(self.symbol, self.trader.order_relations)
+        self.assertEqual(self.exchange.open_orders(self.symbol), [])
+        self.assertEqual(float(self.trader.get_position(self.symbol)['positionAmt']), 0.0)
+
+    def test_reversal_keeps_new_stop_after_close_cleanup(self):
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=True))
+        long_stop = self.assert_protected(SIDE_BUY)
+
+        # 反手：平多时推送持仓归零，清理任务排在新空单和新止损单之后执行
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=False))
+        self.assertTrue(self.trader.executor.pending)
+        short_stop = self.assert_protected(SIDE_SELL)
+        self.assertNotEqual(self.exchange.orders[long_stop['orderId']]['status'], 'NEW')
+
+        self.trader.executor.run_pending()
+        self.assertEqual(self.assert_protected(SIDE_SELL)['orderId'], short_stop['orderId'])
+
+    def test_check_order_execution_after_stop_fill(self):
+        self.trader._act_on_signal(self.symbol, self._signal(long_signal=False))
+        stop = self.assert_protected(SIDE_SELL)
+
+        self.exchange.set_price(self.symbol, float(stop['stopPrice']) * 1.01)
+        self.assertEqual(self._position_amt(), 0.0)
+
+        # 不执行推送触发的清理，由57分的检查清理
+        self.trader.executor.shutdown()
+        self.trader.check_order_execution()
+        self.assertNotIn(self.symbol, self.trader.order_relations)
+        self.assertEqual(self.exchange.open_orders(self.symbol), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
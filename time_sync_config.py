@@ -1,8 +1,10 @@
 import time
 import requests
 import logging
-from threading import Thread
+from threading import Thread, Lock, Event
 from datetime import datetime
+from http_pool import http_pool
+import metrics
 
 # 配置日志（简化格式）
 handler = logging.StreamHandler()
@@ -12,28 +14,48 @@ logger = logging.getLogger('TimeSyncManager')
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 
+# U本位合约服务器时间接口
+FUTURES_TIME_URL = 'https://fapi.binance.com/fapi/v1/time'
+
+
 class TimeSyncManager:
-    """时间同步管理器，用于同步本地时间与币安服务器时间"""
-    
-    def __init__(self, sync_interval=3600, max_allowed_offset=1500):
+    """
+    时间同步管理器，用于同步本地时间与币安合约服务器时间
+    每次同步取多个样本，使用往返时间最短的样本作为锚点，两次同步之间按单调时钟和估计的时钟漂移外推，
+    读取时间只做几次算术运算，从不发起网络请求；同步只在后台线程中进行
+    """
+
+    def __init__(self, sync_interval=3600, max_allowed_offset=1500, samples=5, url=FUTURES_TIME_URL):
         """
         初始化时间同步管理器
         :param sync_interval: 同步间隔(秒)
         :param max_allowed_offset: 最大允许的时间偏移量(毫秒)
+        :param samples: 每次同步的采样次数
+        :param url: 服务器时间接口
         """
         self.sync_interval = sync_interval  # 默认每小时同步一次
         self.max_allowed_offset = max_allowed_offset  # 默认最大允许1500ms偏移
-        self.time_offset = 0  # 时间偏移量(毫秒)
-        self.last_sync_time = 0  # 上次同步时间
+        self.samples = samples
+        self.url = url
+        self.time_offset = 0  # 服务器时间相对本地系统时间的偏移量(毫秒)
+        self.last_sync_time = 0  # 上次同步时间(本地毫秒时间戳)
         self.is_synced = False  # 是否已同步
         self.sync_thread = None  # 同步线程
         self.running = False  # 运行状态
-    
+        # 外推锚点: (单调时钟时间(秒), 对应的服务器时间(毫秒), 本地单调时钟相对服务器时钟的漂移率)，
+        # 服务器时间 = 服务器时间锚点 + (单调时钟 - 单调时钟锚点) * 1000 * (1 + 漂移率)
+        # 同步时整体替换，签名线程读取一次后使用，不会读到一半更新的锚点
+        self.anchor = None
+        self.last_rtt = None  # 最近一次同步所用样本的往返时间(毫秒)
+        self.session = http_pool.session()  # 复用共享连接池中的连接，握手耗时不进入采样
+        self._sync_lock = Lock()
+        self._wake_event = Event()
+
     def start(self):
         """启动自动时间同步"""
         if self.running:
             return
-            
+
         self.running = True
         # 立即进行一次同步
         self.sync_time()
@@ -42,80 +64,127 @@ class TimeSyncManager:
         self.sync_thread.daemon = True
         self.sync_thread.start()
         # 不输出启动服务日志
-    
+
     def stop(self):
         """停止自动时间同步"""
         self.running = False
+        self._wake_event.set()
         if self.sync_thread and self.sync_thread.is_alive():
             self.sync_thread.join(2.0)  # 等待线程结束，最多等待2秒
         # 不输出停止服务日志
-    
+
     def _auto_sync(self):
-        """自动同步时间的内部方法"""
+        """自动同步时间的内部方法，未同步成功时每分钟重试"""
         while self.running:
             try:
-                time.sleep(self.sync_interval)
-                self.sync_time()
+                self._wake_event.wait(self.sync_interval if self.is_synced else 60)
+                self._wake_event.clear()
+                if self.running:
+                    self.sync_time()
             except Exception as e:
                 logger.error(f"自动同步时间时发生错误: {str(e)}")
-    
-    def sync_time(self):
-        """手动同步时间"""
-        try:
-            # 记录本地请求发送时间
-            local_request_time = int(time.time() * 1000)
-            
-            # 请求币安服务器时间
-            response = requests.get('https://api.binance.com/api/v3/time', timeout=10)
-            response.raise_for_status()
-            
-            # 解析币安服务器时间
-            binance_time = response.json().get('serverTime', 0)
-            
-            # 记录本地响应接收时间
-            local_response_time = int(time.time() * 1000)
-            
-            # 计算网络延迟和时间偏移
-            network_delay = (local_response_time - local_request_time) // 2
-            self.time_offset = binance_time - local_response_time + network_delay
-            self.last_sync_time = local_response_time
-            
-            # 检查时间偏移是否在允许范围内
-            is_offset_acceptable = abs(self.time_offset) <= self.max_allowed_offset
-            self.is_synced = True
-            
-            # 只输出一个表明同步成功的简洁日志
-            if is_offset_acceptable:
-                logger.info("时间戳同步成功")
-            else:
-                logger.info(f"时间戳同步成功 (注意: 时间偏移 {abs(self.time_offset)}ms 超过允许范围)")
-                
-        except requests.RequestException as e:
-            logger.error(f"同步时间时发生网络错误: {str(e)}")
-            self.is_synced = False
-        except Exception as e:
-            logger.error(f"同步时间时发生未知错误: {str(e)}")
-            self.is_synced = False
-    
+
+    def request_sync(self):
+        """请求后台线程立即同步（不阻塞调用方）"""
+        self._wake_event.set()
+
+    def _sample(self):
+        """
+        采样一次服务器时间
+        :return: (往返时间(秒), 请求中点的单调时钟时间(秒), 服务器时间(毫秒))
+        """
+        start = time.monotonic()
+        response = self.session.get(self.url, timeout=10)
+        end = time.monotonic()
+        response.raise_for_status()
+        server_ms = response.json()['serverTime']
+        return end - start, (start + end) / 2, server_ms
+
+    def sync_time(self, min_interval=5):
+        """
+        同步时间：多次采样取往返时间最短的样本
+        :param min_interval: 距上次同步不足该秒数时跳过（多个线程同时收到1021时只同步一次）
+        """
+        with self._sync_lock:
+            anchor = self.anchor
+            if anchor is not None and time.monotonic() - anchor[0] < min_interval:
+                return
+            try:
+                samples = []
+                for _ in range(self.samples):
+                    try:
+                        samples.append(self._sample())
+                    except requests.RequestException as e:
+                        last_error = e
+                if not samples:
+                    raise last_error
+
+                rtt, mid_monotonic, server_ms = min(samples)
+                drift_rate = self._estimate_drift(anchor, mid_monotonic, server_ms)
+                self.anchor = (mid_monotonic, server_ms, drift_rate)
+                self.last_rtt = rtt * 1000
+                # 同时更新相对系统时间的偏移量，供按系统时间签名的客户端使用
+                wall_ms = time.time() * 1000 - (time.monotonic() - mid_monotonic) * 1000
+                self.time_offset = int(server_ms - wall_ms)
+                self.last_sync_time = int(time.time() * 1000)
+                self.is_synced = True
+                metrics.CLOCK_SYNCS.inc(result='ok')
+                metrics.CLOCK_RTT.set(self.last_rtt)
+                metrics.CLOCK_DRIFT.set(drift_rate * 1e6)
+
+                # 检查时间偏移是否在允许范围内
+                if abs(self.time_offset) <= self.max_allowed_offset:
+                    logger.info(f"时间戳同步成功 (往返 {self.last_rtt:.1f}ms, 漂移 {drift_rate * 1e6:.1f}ppm)")
+                else:
+                    logger.info(f"时间戳同步成功 (注意: 时间偏移 {abs(self.time_offset)}ms 超过允许范围)")
+
+            except requests.RequestException as e:
+                logger.error(f"同步时间时发生网络错误: {str(e)}")
+                self.is_synced = self.anchor is not None
+                metrics.CLOCK_SYNCS.inc(result='error')
+            except Exception as e:
+                logger.error(f"同步时间时发生未知错误: {str(e)}")
+                self.is_synced = self.anchor is not None
+                metrics.CLOCK_SYNCS.inc(result='error')
+
+    def _estimate_drift(self, anchor, mid_monotonic, server_ms):
+        """
+        用新样本与旧锚点外推值的差估计时钟漂移率（平滑处理，间隔过短时沿用旧值）
+        :param anchor: 旧锚点，None表示首次同步
+        :return: 新锚点使用的漂移率
+        """
+        if anchor is None:
+            return 0.0
+        drift_rate = anchor[2]
+        elapsed = mid_monotonic - anchor[0]
+        if elapsed < 60:
+            return drift_rate
+        predicted = self._extrapolate(anchor, mid_monotonic)
+        rate = (server_ms - predicted) / (elapsed * 1000)
+        # 单次测量受往返时间误差影响，取指数平均并限制在±1000ppm以内
+        return max(-1e-3, min(1e-3, drift_rate + 0.5 * rate))
+
+    @staticmethod
+    def _extrapolate(anchor, monotonic_now):
+        anchor_monotonic, anchor_server_ms, drift_rate = anchor
+        return anchor_server_ms + (monotonic_now - anchor_monotonic) * 1000 * (1 + drift_rate)
+
     def get_synced_timestamp(self):
-        """获取同步后的时间戳(毫秒)"""
-        # 如果尚未同步，先进行同步
-        if not self.is_synced:
-            self.sync_time()
-        
-        # 检查上次同步是否超过一定时间，如果是则重新同步
-        current_time = int(time.time() * 1000)
-        if current_time - self.last_sync_time > self.sync_interval * 1000:
-            logger.info("上次同步时间过长，重新同步")
-            self.sync_time()
-        
-        # 返回同步后的时间戳
-        return current_time + self.time_offset
-    
+        """获取同步后的时间戳(毫秒)，不发起网络请求"""
+        anchor = self.anchor
+        if anchor is None:
+            # 尚未同步成功时退回本地时间
+            return int(time.time() * 1000) + self.time_offset
+        return int(self._extrapolate(anchor, time.monotonic()))
+
     def get_synced_time(self):
         """获取同步后的时间(秒)"""
         return self.get_synced_timestamp() / 1000
-    
+
+    def get_offset_ms(self):
+        """当前同步时间相对本地系统时间的偏移量(毫秒)"""
+        return self.get_synced_timestamp() - time.time() * 1000
+
     def _format_time(self, timestamp_ms):
         """格式化时间戳为可读时间"""
         try:
@@ -123,8 +192,26 @@ class TimeSyncManager:
         except:
             return "Invalid time"
 
+
+class SyncedTimestampMixin:
+    """
+    python-binance客户端按 本地时间 + timestamp_offset 生成签名时间戳，
+    把timestamp_offset改为从时间同步管理器读取，签名时不会发起网络请求
+    """
+
+    @property
+    def timestamp_offset(self):
+        return time_sync_manager.get_offset_ms()
+
+    @timestamp_offset.setter
+    def timestamp_offset(self, value):
+        # 忽略客户端自己计算的偏移量
+        pass
+
 # 创建全局时间同步管理器实例
 time_sync_manager = TimeSyncManager()
+# 抓取指标时读取当前外推的偏移量
+metrics.CLOCK_OFFSET.set_function(time_sync_manager.get_offset_ms)
 
 # 启动时间同步
 time_sync_manager.start()
\ No newline at end of file
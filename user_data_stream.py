@@ -0,0 +1,223 @@
+import time
+import logging
+from threading import Thread, Lock, Event
+
+# 配置日志（简化格式）
+handler = logging.StreamHandler()
+formatter = logging.Formatter('[用户数据流] %(message)s')
+handler.setFormatter(formatter)
+logger = logging.getLogger('UserDataStream')
+logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 仍在挂单中的订单状态
+OPEN_STATUSES = ('NEW', 'PARTIALLY_FILLED')
+
+
+class OrderBook:
+    """内存中的委托单簿，按交易对保存当前挂单"""
+
+    def __init__(self):
+        self.orders = {}  # 格式: {symbol: {orderId: 订单}}
+        self._lock = Lock()
+
+    def load(self, open_orders):
+        """用REST返回的全部挂单重建委托单簿"""
+        orders = {}
+        for order in open_orders:
+            orders.setdefault(order['symbol'], {})[order['orderId']] = {
+                'symbol': order['symbol'],
+                'orderId': order['orderId'],
+                'type': order['type'],
+                'side': order['side'],
+                'status': order['status'],
+                'reduceOnly': order['reduceOnly'],
+                'closePosition': order.get('closePosition', False),
+                'stopPrice': order.get('stopPrice'),
+            }
+        with self._lock:
+            self.orders = orders
+
+    def apply_update(self, o):
+        """
+        应用ORDER_TRADE_UPDATE推送中的订单数据
+        :param o: 推送中的'o'字段
+        :return: 整理后的订单
+        """
+        order = {
+            'symbol': o['s'],
+            'orderId': o['i'],
+            'type': o['o'],
+            'side': o['S'],
+            'status': o['X'],
+            'reduceOnly': o.get('R', False),
+            'closePosition': o.get('cp', False),
+            'stopPrice': o.get('sp'),
+            'avgPrice': o.get('ap'),
+            'executedQty': o.get('z'),
+        }
+        with self._lock:
+            symbol_orders = self.orders.setdefault(order['symbol'], {})
+            if order['status'] in OPEN_STATUSES:
+                symbol_orders[order['orderId']] = order
+            else:
+                symbol_orders.pop(order['orderId'], None)
+        return order
+
+    def remove(self, symbol, order_id):
+        """撤单成功后从委托单簿移除"""
+        with self._lock:
+            self.orders.get(symbol, {}).pop(order_id, None)
+
+    def open_orders(self, symbol):
+        """获取交易对的当前挂单列表"""
+        with self._lock:
+            return list(self.orders.get(symbol, {}).values())
+
+
+class UserDataStream:
+    """用户数据流：消费ACCOUNT_UPDATE和ORDER_TRADE_UPDATE，维护内存中的持仓快照和委托单簿"""
+
+    def __init__(self, socket_manager, fetch_open_orders, positions, order_book,
+                 on_order_update=None, on_position_closed=None, max_silence=120, check_interval=5):
+        """
+        初始化用户数据流
+        :param socket_manager: 已启动的ThreadedWebsocketManager
+        :param fetch_open_orders: 获取全部挂单的函数（启动和重连后对账用）
+        :param positions: PositionSnapshot实例
+        :param order_book: OrderBook实例
+        :param on_order_update: 订单状态变化回调 on_order_update(order)
+        :param on_position_closed: 持仓归零回调 on_position_closed(symbol)
+        :param max_silence: 超过多少秒既没有推送也没有对账时，视为不可用并用REST重新对账(秒)
+        :param check_interval: 后台检查间隔(秒)
+        """
+        self.socket_manager = socket_manager
+        self.fetch_open_orders = fetch_open_orders
+        self.positions = positions
+        self.order_book = order_book
+        self.on_order_update = on_order_update
+        self.on_position_closed = on_position_closed
+        self.stream_name = None  # 数据流名称
+        self.live = False  # 数据流是否可用
+        self.last_event_time = 0  # 上次收到推送的时间
+        self.last_resync_time = 0  # 上次REST对账成功的时间
+        self.max_silence = max_silence
+        self.check_interval = check_interval
+        self._stop_event = Event()
+        self._watchdog = None
+        self._retry_time = 0  # 订阅失败后下次重试的时间
+        self._resync_lock = Lock()
+
+    def start(self):
+        """
+        订阅用户数据流并用REST对账一次，启动后台检查线程
+        listenKey由socket_manager创建并定时续期，过期或出错时重新订阅；
+        python-binance在内部自动重连时不会通知，长时间没有推送时由后台线程用REST重新对账
+        """
+        self._stop_event.clear()
+        self._subscribe()
+        if self._watchdog is None or not self._watchdog.is_alive():
+            self._watchdog = Thread(target=self._watch, name='user-stream-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def _subscribe(self):
+        try:
+            self.stream_name = self.socket_manager.start_futures_user_socket(callback=self._handle_message)
+            self.resync()
+            self._set_live(True)
+            logger.info("用户数据流已启动")
+        except Exception as e:
+            logger.error(f"启动用户数据流失败，改用REST轮询: {str(e)}")
+            self._set_live(False)
+
+    def stop(self):
+        """停止订阅和后台检查线程"""
+        self._stop_event.set()
+        self._unsubscribe()
+
+    def _unsubscribe(self):
+        self._set_live(False)
+        if self.stream_name:
+            try:
+                self.socket_manager.stop_socket(self.stream_name)
+            except Exception as e:
+                logger.error(f"停止用户数据流失败: {str(e)}")
+            self.stream_name = None
+
+    def restart(self):
+        """重新订阅并对账（listenKey过期、连接出错或重连后）"""
+        self._unsubscribe()
+        self._subscribe()
+
+    def _restart_in_background(self):
+        # 不在数据流回调线程中停止自身
+        Thread(target=self.restart, daemon=True).start()
+
+    def resync(self):
+        """用REST重新加载持仓和挂单，保证内存数据与交易所一致"""
+        with self._resync_lock:
+            self.positions.refresh()
+            self.order_book.load(self.fetch_open_orders())
+            self.last_resync_time = time.time()
+
+    def silence(self):
+        """距上次收到推送或REST对账的时间(秒)"""
+        return time.time() - max(self.last_event_time, self.last_resync_time)
+
+    def is_live(self):
+        """数据流是否可用：已订阅，且max_silence内收到过推送或完成过对账"""
+        return self.live and self.silence() <= self.max_silence
+
+    def _watch(self):
+        """后台检查：未订阅时重新订阅；长时间没有推送时用REST对账，对账失败则退回REST轮询"""
+        while not self._stop_event.wait(self.check_interval):
+            if self.stream_name is None:
+                if time.time() >= self._retry_time:
+                    self._retry_time = time.time() + self.max_silence
+                    self.restart()
+                continue
+            if self.silence() <= self.max_silence:
+                continue
+            try:
+                self.resync()
+                self._set_live(True)
+            except Exception as e:
+                logger.error(f"长时间没有推送，REST对账失败，改用REST轮询: {str(e)}")
+                self._set_live(False)
+
+    def _set_live(self, live):
+        self.live = live
+        # 数据流可用时持仓快照由推送维护，不再按时间过期
+        self.positions.live = live
+
+    def _handle_message(self, msg):
+        """用户数据流消息回调"""
+        if not isinstance(msg, dict):
+            return
+        event = msg.get('e')
+        self.last_event_time = time.time()
+        try:
+            if event == 'ACCOUNT_UPDATE':
+                self._handle_account_update(msg)
+            elif event == 'ORDER_TRADE_UPDATE':
+                order = self.order_book.apply_update(msg['o'])
+                if self.on_order_update:
+                    self.on_order_update(order)
+            elif event == 'listenKeyExpired':
+                logger.info("listenKey已过期，重新订阅")
+                self._restart_in_background()
+            elif event == 'error':
+                logger.error(f"用户数据流错误: {msg.get('m')}，重新订阅")
+                self._set_live(False)
+                self._restart_in_background()
+        except Exception as e:
+            logger.error(f"处理用户数据流消息失败: {str(e)}")
+
+    def _handle_account_update(self, msg):
+        """用ACCOUNT_UPDATE中的持仓变化修改持仓快照"""
+        for p in msg.get('a', {}).get('P', []):
+            symbol = p['s']
+            self.positions.patch(symbol, positionAmt=p['pa'], entryPrice=p['ep'])
+            if float(p['pa']) == 0 and self.on_position_closed:
+                self.on_position_closed(symbol)